@@ -13,6 +13,8 @@ CREATE DATABASE profe_database;
 -- Enable necessary extensions
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
 CREATE EXTENSION IF NOT EXISTS "pgcrypto";
+-- Statement statistics read by the index advisor
+CREATE EXTENSION IF NOT EXISTS "pg_stat_statements";
 
 -- Create the migration service database
 \c profe_migrations;
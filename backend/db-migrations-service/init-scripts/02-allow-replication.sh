@@ -0,0 +1,6 @@
+#!/bin/bash
+# Allow replication connections so the migration service can stream WAL
+# (pg_receivewal) and take base backups (pg_basebackup)
+set -e
+
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -1,15 +1,21 @@
+from datetime import datetime, timezone
 from logging.config import fileConfig
 from sqlalchemy import engine_from_config
-from sqlalchemy import pool
+from sqlalchemy import event, pool
+from sqlalchemy.exc import DBAPIError
 from alembic import context
+import logging
 import os
+import random
 import sys
+import time
 
 # Add the src directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from src.core.config import settings
 from src.core.database import Base
+from src.services.migration_profiler import MigrationProfiler, record_run
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -17,7 +23,8 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-if config.config_file_name is not None:
+# Skipped when running in-process inside the service, which owns logging.
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -30,8 +37,17 @@ target_metadata = Base.metadata
 # ... etc.
 
 def get_url():
-    """Get database URL from settings"""
-    return settings.MASTER_DATABASE_URL
+    """Database to migrate: the caller's override (provisioning), else the master database"""
+    return config.attributes.get("database_url") or settings.MASTER_DATABASE_URL
+
+
+def is_online_mode() -> bool:
+    """Online mode as requested by the caller, else the service default"""
+    online = config.attributes.get("online")
+    if online is None:
+        online = settings.MIGRATION_ONLINE_MODE
+    return online
+
 
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
@@ -51,12 +67,69 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        # Rendered the way an online run would commit it
+        transaction_per_migration=is_online_mode(),
     )
 
     with context.begin_transaction():
         context.run_migrations()
 
 
+# SQLSTATEs retried in online mode: lock_not_available (lock_timeout) and deadlock_detected
+RETRYABLE_SQLSTATES = ("55P03", "40P01")
+
+logger = logging.getLogger("alembic.env")
+
+
+def _is_retryable(error: DBAPIError) -> bool:
+    return getattr(error.orig, "pgcode", None) in RETRYABLE_SQLSTATES
+
+
+def _configure_timeouts(connection) -> None:
+    """Apply lock_timeout and statement_timeout at every transaction start.
+
+    Inside a revision's transaction they are set with SET LOCAL and end
+    with it. Autocommit blocks (concurrent index builds, backfills) have no
+    transaction to scope them to, so there they are set for the session;
+    the connection is not pooled and closes with the run.
+    """
+    def set_timeouts(conn) -> None:
+        scope = "" if conn.get_execution_options().get("isolation_level") == "AUTOCOMMIT" else "LOCAL "
+        conn.exec_driver_sql(f"SET {scope}lock_timeout = {int(settings.MIGRATION_LOCK_TIMEOUT_MS)}")
+        conn.exec_driver_sql(f"SET {scope}statement_timeout = {int(settings.MIGRATION_STATEMENT_TIMEOUT_MS)}")
+
+    event.listen(connection, "begin", set_timeouts)
+
+
+def _run_with_lock_retries(connection, profiler) -> None:
+    """Run migrations one transaction per revision, retrying lock timeouts.
+
+    A revision that cannot get its locks within lock_timeout is rolled back
+    and retried after an exponential backoff; revisions already committed
+    are not run again.
+    """
+    for attempt in range(settings.MIGRATION_LOCK_RETRIES + 1):
+        try:
+            with context.begin_transaction():
+                context.run_migrations()
+            return
+        except DBAPIError as e:
+            if not _is_retryable(e) or attempt == settings.MIGRATION_LOCK_RETRIES:
+                raise
+            if connection.in_transaction():
+                connection.rollback()
+            profiler.discard_pending()
+            delay = min(
+                settings.MIGRATION_RETRY_BACKOFF_SECONDS * 2 ** attempt,
+                settings.MIGRATION_RETRY_BACKOFF_MAX_SECONDS
+            ) * random.uniform(0.5, 1.0)
+            logger.warning(
+                f"Lock not available ({str(e.orig).strip()}), retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{settings.MIGRATION_LOCK_RETRIES})"
+            )
+            time.sleep(delay)
+
+
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
@@ -73,16 +146,47 @@ def run_migrations_online() -> None:
         poolclass=pool.NullPool,
     )
 
+    # Per-revision and per-statement timings. The service passes its own
+    # profiler and records the run against its job; command line runs are
+    # recorded here.
+    profiler = config.attributes.get("profiler")
+    standalone = profiler is None
+    if standalone:
+        profiler = MigrationProfiler()
+    online = is_online_mode()
+    started_at = datetime.now(timezone.utc)
+    error = None
+
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, 
-            target_metadata=target_metadata,
-            compare_type=True,
-            compare_server_default=True,
-        )
-
-        with context.begin_transaction():
-            context.run_migrations()
+        profiler.attach(connection)
+        try:
+            if online and connection.dialect.name == "postgresql":
+                _configure_timeouts(connection)
+
+            context.configure(
+                connection=connection, 
+                target_metadata=target_metadata,
+                compare_type=True,
+                compare_server_default=True,
+                on_version_apply=profiler.on_version_apply,
+                # Online mode commits every revision on its own, so locks are
+                # held briefly and a failed revision can be retried alone
+                transaction_per_migration=online,
+            )
+
+            if online:
+                _run_with_lock_retries(connection, profiler)
+            else:
+                with context.begin_transaction():
+                    context.run_migrations()
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            profiler.detach(connection)
+            if standalone and (profiler.revisions or error):
+                operation = profiler.revisions[0].direction if profiler.revisions else "unknown"
+                record_run(profiler, operation, str(context.get_revision_argument()), started_at, error)
 
 
 if context.is_offline_mode():
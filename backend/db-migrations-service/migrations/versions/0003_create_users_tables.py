@@ -1,7 +1,7 @@
 """Create users tables
 
 Revision ID: 0003
-Revises: 0002
+Revises: 
 Create Date: 2024-01-15 10:02:00.000000
 
 """
@@ -11,9 +11,11 @@ from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision = '0003'
-down_revision = '0002'
-branch_labels = None
-depends_on = None
+# Rooted on the branches it has foreign keys to (auth.users) rather than on
+# 0001, which they imply
+down_revision = None
+branch_labels = ('users',)
+depends_on = ('0002',)
 
 
 def upgrade() -> None:
@@ -1,7 +1,7 @@
 """Create organizations tables
 
 Revision ID: 0004
-Revises: 0003
+Revises: 0001
 Create Date: 2024-01-15 10:03:00.000000
 
 """
@@ -11,8 +11,8 @@ from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision = '0004'
-down_revision = '0003'
-branch_labels = None
+down_revision = '0001'
+branch_labels = ('organizations',)
 depends_on = None
 
 
@@ -1,7 +1,7 @@
 """Create plans tables
 
 Revision ID: 0005
-Revises: 0004
+Revises: 
 Create Date: 2024-01-15 10:04:00.000000
 
 """
@@ -11,9 +11,11 @@ from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision = '0005'
-down_revision = '0004'
-branch_labels = None
-depends_on = None
+# Rooted on the branches it has foreign keys to (auth.users,
+# organizations.organizations) rather than on 0001, which they imply
+down_revision = None
+branch_labels = ('plans',)
+depends_on = ('0002', '0004')
 
 
 def upgrade() -> None:
@@ -0,0 +1,88 @@
+"""Turn plans.plan_jobs into a SKIP LOCKED work queue with change notifications
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-01-15 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from src.utils.migration_ops import create_index_concurrently, drop_index_concurrently
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Leases: a dequeued job belongs to locked_by until locked_until, and a
+    # failed attempt is retried after run_after. Constant and now() defaults
+    # are stored in the catalog, so adding the columns rewrites nothing.
+    op.add_column('plan_jobs', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'), schema='plans')
+    op.add_column('plan_jobs', sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='5'), schema='plans')
+    op.add_column(
+        'plan_jobs',
+        sa.Column('run_after', sa.DateTime(timezone=True), nullable=False, server_default=sa.text('now()')),
+        schema='plans'
+    )
+    op.add_column('plan_jobs', sa.Column('locked_by', sa.String(length=255), nullable=True), schema='plans')
+    op.add_column('plan_jobs', sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True), schema='plans')
+
+    # Status and progress changes are pushed on the plan_jobs channel
+    op.execute("""
+        CREATE OR REPLACE FUNCTION plans.notify_plan_job_change() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('plan_jobs', json_build_object(
+                'id', NEW.id,
+                'teacher_id', NEW.teacher_id,
+                'plan_id', NEW.plan_id,
+                'status', NEW.status,
+                'progress', NEW.progress,
+                'attempts', NEW.attempts,
+                'error_message', left(NEW.error_message, 1000)
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER plan_jobs_notify_insert
+        AFTER INSERT ON plans.plan_jobs
+        FOR EACH ROW EXECUTE FUNCTION plans.notify_plan_job_change()
+    """)
+    op.execute("""
+        CREATE TRIGGER plan_jobs_notify_update
+        AFTER UPDATE OF status, progress ON plans.plan_jobs
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.progress IS DISTINCT FROM NEW.progress)
+        EXECUTE FUNCTION plans.notify_plan_job_change()
+    """)
+
+    # Dequeue walks the pending jobs oldest first; the lease reaper looks
+    # for processing jobs whose lease expired
+    create_index_concurrently(
+        'idx_plan_jobs_pending', 'plan_jobs', ['created_at'], schema='plans',
+        postgresql_where=sa.text("status = 'pending'")
+    )
+    create_index_concurrently(
+        'idx_plan_jobs_lease', 'plan_jobs', ['locked_until'], schema='plans',
+        postgresql_where=sa.text("status = 'processing'")
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently('idx_plan_jobs_lease', 'plan_jobs', schema='plans')
+    drop_index_concurrently('idx_plan_jobs_pending', 'plan_jobs', schema='plans')
+
+    op.execute("DROP TRIGGER IF EXISTS plan_jobs_notify_update ON plans.plan_jobs")
+    op.execute("DROP TRIGGER IF EXISTS plan_jobs_notify_insert ON plans.plan_jobs")
+    op.execute("DROP FUNCTION IF EXISTS plans.notify_plan_job_change()")
+
+    op.drop_column('plan_jobs', 'locked_until', schema='plans')
+    op.drop_column('plan_jobs', 'locked_by', schema='plans')
+    op.drop_column('plan_jobs', 'run_after', schema='plans')
+    op.drop_column('plan_jobs', 'max_attempts', schema='plans')
+    op.drop_column('plan_jobs', 'attempts', schema='plans')
@@ -0,0 +1,24 @@
+"""Range-partition auth.sessions by month of created_at
+
+Revision ID: 0007
+Revises: 0002
+Create Date: 2024-01-15 10:06:00.000000
+
+"""
+from src.utils.migration_ops import partition_by_range, unpartition
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Expired sessions are dropped a month at a time by the partition
+    # maintenance instead of being deleted row by row
+    partition_by_range('sessions', 'created_at', schema='auth', interval='month')
+
+
+def downgrade() -> None:
+    unpartition('sessions', schema='auth')
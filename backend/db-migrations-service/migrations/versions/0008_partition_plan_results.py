@@ -0,0 +1,22 @@
+"""Range-partition plans.plan_results by month of created_at
+
+Revision ID: 0008
+Revises: 0006
+Create Date: 2024-01-15 10:07:00.000000
+
+"""
+from src.utils.migration_ops import partition_by_range, unpartition
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    partition_by_range('plan_results', 'created_at', schema='plans', interval='month')
+
+
+def downgrade() -> None:
+    unpartition('plan_results', schema='plans')
@@ -0,0 +1,25 @@
+"""Index expires_at of auth.sessions and auth.password_resets for the purge
+
+Revision ID: 0009
+Revises: 0007
+Create Date: 2024-01-15 10:08:00.000000
+
+"""
+from src.utils.migration_ops import create_index_concurrently, drop_index_concurrently
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The purge job deletes expired rows in expires_at order, a batch at a time
+    create_index_concurrently('idx_sessions_expires_at', 'sessions', ['expires_at'], schema='auth')
+    create_index_concurrently('idx_password_resets_expires_at', 'password_resets', ['expires_at'], schema='auth')
+
+
+def downgrade() -> None:
+    drop_index_concurrently('idx_password_resets_expires_at', 'password_resets', schema='auth')
+    drop_index_concurrently('idx_sessions_expires_at', 'sessions', schema='auth')
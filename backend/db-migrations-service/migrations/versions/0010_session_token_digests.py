@@ -0,0 +1,53 @@
+"""Add sha256 digest columns of the auth.sessions tokens
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2024-01-15 10:09:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable without a default: no rewrite, existing rows are filled by 0011
+    op.add_column('sessions', sa.Column('token_digest', sa.LargeBinary(), nullable=True), schema='auth')
+    op.add_column('sessions', sa.Column('refresh_token_digest', sa.LargeBinary(), nullable=True), schema='auth')
+
+    # Services look sessions up with
+    #   WHERE token_digest = auth.token_digest(:token) AND token = :token
+    op.execute("""
+        CREATE OR REPLACE FUNCTION auth.token_digest(token text) RETURNS bytea
+        LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+        AS $$ SELECT sha256(convert_to(token, 'UTF8')) $$
+    """)
+    op.execute("""
+        CREATE OR REPLACE FUNCTION auth.set_session_token_digests() RETURNS trigger AS $$
+        BEGIN
+            NEW.token_digest := auth.token_digest(NEW.token);
+            NEW.refresh_token_digest := auth.token_digest(NEW.refresh_token);
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # Defined on the partitioned table, so every partition gets it
+    op.execute("""
+        CREATE TRIGGER sessions_token_digests
+        BEFORE INSERT OR UPDATE OF token, refresh_token ON auth.sessions
+        FOR EACH ROW EXECUTE FUNCTION auth.set_session_token_digests()
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS sessions_token_digests ON auth.sessions")
+    op.execute("DROP FUNCTION IF EXISTS auth.set_session_token_digests()")
+    op.execute("DROP FUNCTION IF EXISTS auth.token_digest(text)")
+
+    op.drop_column('sessions', 'refresh_token_digest', schema='auth')
+    op.drop_column('sessions', 'token_digest', schema='auth')
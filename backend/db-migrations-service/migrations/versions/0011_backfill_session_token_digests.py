@@ -0,0 +1,28 @@
+"""Backfill the token digests of existing auth.sessions rows
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2024-01-15 10:10:00.000000
+
+"""
+from src.utils.migration_ops import backfill, reset_backfill_checkpoint
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Rows written since 0010 already have their digests from the trigger
+    backfill(
+        'sessions_token_digests', 'sessions',
+        'token_digest = auth.token_digest(token), refresh_token_digest = auth.token_digest(refresh_token)',
+        where='token_digest IS NULL',
+        schema='auth'
+    )
+
+
+def downgrade() -> None:
+    reset_backfill_checkpoint('sessions_token_digests')
@@ -0,0 +1,31 @@
+"""Hash indexes on the auth.sessions token digests
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2024-01-15 10:11:00.000000
+
+"""
+from src.utils.migration_ops import create_index_concurrently, drop_index_concurrently
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # A hash index entry is a 4 byte hash code whatever the key width; the
+    # lookups are equality only
+    create_index_concurrently(
+        'idx_sessions_token_digest', 'sessions', ['token_digest'], schema='auth', postgresql_using='hash'
+    )
+    create_index_concurrently(
+        'idx_sessions_refresh_token_digest', 'sessions', ['refresh_token_digest'], schema='auth',
+        postgresql_using='hash'
+    )
+
+
+def downgrade() -> None:
+    drop_index_concurrently('idx_sessions_refresh_token_digest', 'sessions', schema='auth')
+    drop_index_concurrently('idx_sessions_token_digest', 'sessions', schema='auth')
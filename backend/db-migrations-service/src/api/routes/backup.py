@@ -1,176 +1,252 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-import structlog
-import subprocess
-import os
+from fastapi import APIRouter, HTTPException, Query
 from datetime import datetime
-from typing import List, Dict, Any
-from src.core.database import get_master_db
+from fastapi.concurrency import run_in_threadpool
+import structlog
 from src.core.config import settings
+from src.core.schemas import parse_names, schemas_for
+from src.services import backup_catalog, backups
+from src.services import wal_archive
+from src.services.jobs import job_manager
 
 logger = structlog.get_logger()
 router = APIRouter()
 
-@router.post("/create")
-async def create_backup(service: str = None, description: str = "Manual backup"):
+@router.post("/create", status_code=202)
+async def create_backup(
+    service: str = None,
+    description: str = "Manual backup",
+    format: str = settings.BACKUP_FORMAT,
+    jobs: int = settings.BACKUP_JOBS,
+    compression: int = settings.BACKUP_COMPRESSION
+):
     """Create database backup"""
     try:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"backup_{service}_{timestamp}.sql" if service else f"backup_{timestamp}.sql"
-        backup_path = os.path.join(settings.BACKUP_PATH, backup_filename)
-        
-        # Create backup using pg_dump
-        cmd = [
-            "pg_dump",
-            "-h", "postgres",
-            "-U", "postgres",
-            "-d", "profe_database",
-            "-f", backup_path,
-            "--verbose"
-        ]
-        
-        # Set environment variables for pg_dump
-        env = os.environ.copy()
-        env["PGPASSWORD"] = "password"
-        
-        logger.info(f"Creating backup: {backup_filename}")
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            cwd="/app"
+        if format not in backups.BACKUP_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported backup format {format}")
+        if settings.BACKUP_UPLOAD_ENABLED and format not in backups.STREAMABLE_FORMATS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{format} backups cannot be streamed to {settings.BACKUP_STORAGE}; use plain or custom"
+            )
+        
+        try:
+            schemas = schemas_for(parse_names(service))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        job = job_manager.submit(
+            "backup",
+            backups.create_backup,
+            service=service,
+            description=description,
+            format=format,
+            jobs=jobs,
+            compression=compression
         )
         
-        if result.returncode == 0:
-            # Get file size
-            file_size = os.path.getsize(backup_path) if os.path.exists(backup_path) else 0
-            
-            return {
-                "status": "success",
-                "backup_id": backup_filename,
-                "service": service,
-                "description": description,
-                "size": f"{file_size} bytes",
-                "path": backup_path,
-                "created_at": datetime.now().isoformat(),
-                "message": "Backup created successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "service": service,
-                "description": description,
-                "error": result.stderr,
-                "message": "Backup creation failed"
-            }
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "service": service,
+            "description": description,
+            "schemas": schemas or None,
+            "format": format,
+            "jobs": jobs,
+            "compression": compression,
+            "message": "Backup job submitted"
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Backup creation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/list")
-async def list_backups():
-    """List available backups"""
+async def list_backups(
+    service: str = None,
+    format: str = None,
+    schema: str = None,
+    created_after: datetime = None,
+    created_before: datetime = None,
+    cursor: str = None,
+    limit: int = Query(50, ge=1, le=500)
+):
+    """List backups from the catalog, newest first"""
     try:
-        backup_dir = settings.BACKUP_PATH
-        backups = []
-        
-        if os.path.exists(backup_dir):
-            for filename in os.listdir(backup_dir):
-                if filename.endswith('.sql'):
-                    file_path = os.path.join(backup_dir, filename)
-                    file_size = os.path.getsize(file_path)
-                    file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    
-                    backups.append({
-                        "filename": filename,
-                        "size": f"{file_size} bytes",
-                        "created_at": file_mtime.isoformat(),
-                        "path": file_path
-                    })
+        entries, next_cursor = await run_in_threadpool(
+            backup_catalog.query,
+            service=service,
+            format=format,
+            schema=schema,
+            created_after=created_after,
+            created_before=created_before,
+            cursor=cursor,
+            limit=limit
+        )
         
         return {
             "status": "success",
-            "backups": backups,
-            "count": len(backups),
+            "backups": entries,
+            "count": len(entries),
+            "next_cursor": next_cursor,
             "message": "Backup list retrieved successfully"
         }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Backup list failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/restore/{backup_id}")
-async def restore_backup(backup_id: str):
-    """Restore database from backup"""
+@router.post("/catalog/reconcile", status_code=202)
+async def reconcile_catalog():
+    """Synchronize the backup catalog with the backups on disk"""
     try:
-        backup_path = os.path.join(settings.BACKUP_PATH, backup_id)
+        job = job_manager.submit("backup_catalog_reconcile", backups.reconcile_catalog)
         
-        if not os.path.exists(backup_path):
-            raise HTTPException(status_code=404, detail=f"Backup {backup_id} not found")
-        
-        # Restore using psql
-        cmd = [
-            "psql",
-            "-h", "postgres",
-            "-U", "postgres",
-            "-d", "profe_database",
-            "-f", backup_path
-        ]
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "message": "Backup catalog reconcile submitted"
+        }
+    except Exception as e:
+        logger.error(f"Backup catalog reconcile failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/restore/{backup_id}", status_code=202)
+async def restore_backup(
+    backup_id: str,
+    jobs: int = settings.BACKUP_JOBS,
+    schemas: str = None,
+    shadow: bool = False
+):
+    """Restore database, or only some schemas or services, from backup"""
+    try:
+        manifest = backups.read_manifest(backup_id)
+    except (backups.BackupNotFound, ValueError):
+        raise HTTPException(status_code=404, detail=f"Backup {backup_id} not found")
+    
+    try:
+        selected = schemas_for(parse_names(schemas)) or None
+        if shadow:
+            backups.check_shadow(manifest, selected)
+        backups.plan_restore(manifest, selected)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        job = job_manager.submit(
+            "restore", backups.restore_backup, backup_id=backup_id, jobs=jobs, schemas=selected, shadow=shadow
+        )
         
-        # Set environment variables for psql
-        env = os.environ.copy()
-        env["PGPASSWORD"] = "password"
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "backup_id": backup_id,
+            "format": manifest["format"],
+            "schemas": selected,
+            "shadow": shadow,
+            "message": "Restore job submitted"
+        }
+    except Exception as e:
+        logger.error(f"Backup restore failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/base", status_code=202)
+async def create_base_backup(label: str = "profe base backup"):
+    """Create a physical base backup for point-in-time recovery"""
+    try:
+        job = job_manager.submit("base_backup", wal_archive.create_base_backup, label=label)
         
-        logger.info(f"Restoring backup: {backup_id}")
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "label": label,
+            "message": "Base backup job submitted"
+        }
+    except Exception as e:
+        logger.error(f"Base backup creation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/wal/status")
+async def wal_status():
+    """WAL archiving status and available base backups"""
+    try:
+        base_backups = await run_in_threadpool(wal_archive.list_base_backups)
         
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            env=env,
-            cwd="/app"
+        return {
+            "status": "success",
+            "wal": wal_archive.wal_archiver.status(),
+            "base_backups": base_backups,
+            "message": "WAL archive status retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"WAL status check failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/restore-pitr", status_code=202)
+async def restore_pitr(target_time: datetime = None, target_lsn: str = None, base_backup_id: str = None):
+    """Prepare a point-in-time recovery to a timestamp or LSN"""
+    if (target_time is None) == (target_lsn is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of target_time or target_lsn")
+    
+    if target_lsn and not wal_archive.LSN_PATTERN.match(target_lsn):
+        raise HTTPException(status_code=400, detail=f"Invalid LSN {target_lsn}")
+    
+    try:
+        base_backup = wal_archive.select_base_backup(target_time, target_lsn, base_backup_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        job = job_manager.submit(
+            "restore_pitr",
+            wal_archive.restore_pitr,
+            target_time=target_time,
+            target_lsn=target_lsn,
+            base_backup_id=base_backup["backup_id"]
         )
         
-        if result.returncode == 0:
-            return {
-                "status": "success",
-                "backup_id": backup_id,
-                "output": result.stdout,
-                "message": "Backup restored successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "backup_id": backup_id,
-                "error": result.stderr,
-                "message": "Backup restore failed"
-            }
-    except HTTPException:
-        raise
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "base_backup_id": base_backup["backup_id"],
+            "target_time": target_time,
+            "target_lsn": target_lsn,
+            "message": "Point-in-time restore job submitted"
+        }
     except Exception as e:
-        logger.error(f"Backup restore failed: {str(e)}")
+        logger.error(f"Point-in-time restore failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/gc", status_code=202)
+async def collect_garbage(retention_days: int = settings.BACKUP_RETENTION_DAYS):
+    """Expire old backups and remove unreferenced chunks from the backup store"""
+    try:
+        job = job_manager.submit("backup_gc", backups.apply_retention, retention_days=retention_days)
+        
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "retention_days": retention_days,
+            "message": "Backup garbage collection submitted"
+        }
+    except Exception as e:
+        logger.error(f"Backup garbage collection failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/{backup_id}")
 async def delete_backup(backup_id: str):
-    """Delete backup file"""
+    """Delete backup"""
     try:
-        backup_path = os.path.join(settings.BACKUP_PATH, backup_id)
-        
-        if not os.path.exists(backup_path):
-            raise HTTPException(status_code=404, detail=f"Backup {backup_id} not found")
-        
-        os.remove(backup_path)
+        await run_in_threadpool(backups.delete_backup, backup_id)
         
         return {
             "status": "success",
             "backup_id": backup_id,
             "message": "Backup deleted successfully"
         }
-    except HTTPException:
-        raise
+    except (backups.BackupNotFound, ValueError):
+        raise HTTPException(status_code=404, detail=f"Backup {backup_id} not found")
     except Exception as e:
         logger.error(f"Backup deletion failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import structlog
+from src.services import provisioning
+from src.services.jobs import job_manager
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+@router.get("")
+async def list_databases():
+    """Databases provisioned from the template"""
+    try:
+        databases = await run_in_threadpool(provisioning.list_provisioned)
+        return {
+            "status": "success",
+            "databases": databases,
+            "message": "Provisioned databases retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"Database listing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("", status_code=202)
+async def provision_database(name: str):
+    """Create a database at head by cloning the template database"""
+    try:
+        provisioning.validate_database_name(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit("provision", provisioning.provision_database, name=name)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "database": name,
+            "message": f"Provisioning of {name} submitted"
+        }
+    except Exception as e:
+        logger.error(f"Database provisioning failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/{name}")
+async def drop_database(name: str):
+    """Drop a provisioned database"""
+    try:
+        dropped = await run_in_threadpool(provisioning.drop_provisioned, name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Database drop failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not dropped:
+        raise HTTPException(status_code=404, detail=f"Database {name} not found")
+    return {
+        "status": "success",
+        "database": name,
+        "message": f"Database {name} dropped"
+    }
+
+@router.get("/template")
+async def get_template_status():
+    """Template database and whether it is at head"""
+    try:
+        status = await run_in_threadpool(provisioning.template_status)
+        return {
+            "status": "success",
+            **status,
+            "message": "Template status retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"Template status check failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/template/refresh", status_code=202)
+async def refresh_template():
+    """Create the template database if needed and upgrade it to head"""
+    try:
+        job = job_manager.submit("template_refresh", provisioning.refresh_template)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "message": "Template refresh submitted"
+        }
+    except Exception as e:
+        logger.error(f"Template refresh failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
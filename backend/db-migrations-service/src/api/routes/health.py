@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 import structlog
-from src.core.database import get_db, get_master_db
+from src.core.database import pool_stats
+from src.services.health_prober import health_prober
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -16,38 +16,51 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@router.get("/health/live")
+async def liveness_check():
+    """Liveness probe: the process and its event loop respond"""
+    return {"status": "alive"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Readiness probe: every database answered its last probe recently"""
+    databases = {}
+    ready = True
+    for name in health_prober.targets:
+        target = await health_prober.get(name)
+        databases[name] = target.to_dict()
+        ready = ready and bool(target.healthy) and target.is_fresh()
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "databases": databases
+        }
+    )
+
 @router.get("/health/database")
-async def database_health_check(db: Session = Depends(get_db)):
+async def database_health_check():
     """Database health check"""
-    try:
-        result = db.execute(text("SELECT 1"))
-        return {
-            "status": "healthy",
-            "database": "migrations_db",
-            "message": "Database connection successful"
-        }
-    except Exception as e:
-        logger.error(f"Database health check failed: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "database": "migrations_db",
-            "error": str(e)
-        }
+    target = await health_prober.get("migrations_db")
+    result = {"database": "migrations_db", **target.to_dict()}
+    if target.healthy:
+        result["message"] = "Database connection successful"
+    return result
 
 @router.get("/health/master-database")
-async def master_database_health_check(db: Session = Depends(get_master_db)):
+async def master_database_health_check():
     """Master database health check"""
-    try:
-        result = db.execute(text("SELECT 1"))
-        return {
-            "status": "healthy",
-            "database": "master_db",
-            "message": "Master database connection successful"
-        }
-    except Exception as e:
-        logger.error(f"Master database health check failed: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "database": "master_db",
-            "error": str(e)
-        } 
\ No newline at end of file
+    target = await health_prober.get("master_db")
+    result = {"database": "master_db", **target.to_dict()}
+    if target.healthy:
+        result["message"] = "Master database connection successful"
+    return result
+
+@router.get("/health/pool")
+async def pool_health_check():
+    """Connection pool statistics"""
+    return {
+        "status": "healthy",
+        "pools": pool_stats()
+    }
\ No newline at end of file
@@ -0,0 +1,40 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+import structlog
+from src.core.schemas import parse_names
+from src.services import index_advisor
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+@router.get("/advice")
+async def get_index_advice():
+    """Missing indexes ranked by estimated benefit, and unused indexes"""
+    try:
+        advice = await run_in_threadpool(index_advisor.advise)
+        return {
+            "status": "success",
+            **advice,
+            "message": "Index advice computed successfully"
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Index advice failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/revisions", status_code=201)
+async def generate_index_revisions(limit: int = None, indexes: str = None):
+    """Write revisions building the advised indexes concurrently (``indexes``: comma separated names)"""
+    try:
+        revisions = await run_in_threadpool(index_advisor.generate_revisions, limit, parse_names(indexes))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Index revision generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "revisions": revisions,
+        "message": f"{len(revisions)} revisions generated" if revisions else "No index worth adding"
+    }
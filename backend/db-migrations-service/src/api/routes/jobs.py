@@ -0,0 +1,82 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import structlog
+from src.services.jobs import Job, job_manager
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+# Interval between checks for new job events while streaming
+STREAM_POLL_SECONDS = 0.25
+
+STREAM_MEDIA_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+def _encode_event(event: dict, format: str) -> str:
+    payload = json.dumps(event, default=str)
+    if format == "sse":
+        return f"id: {event.get('seq', '')}\nevent: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+async def _stream_job_events(job: Job, format: str, after: int):
+    """Yield job events as they are recorded until the job finishes"""
+    last_seq = after
+    while True:
+        finished = job.finished
+        events, dropped = job.events_since(last_seq)
+        if dropped:
+            yield _encode_event({"type": "dropped", "count": dropped}, format)
+        for event in events:
+            yield _encode_event(event, format)
+            last_seq = event["seq"]
+        if finished and not events:
+            yield _encode_event({"type": "end", "job": job.to_dict()}, format)
+            return
+        await asyncio.sleep(STREAM_POLL_SECONDS)
+
+@router.get("")
+async def list_jobs(kind: str = None):
+    """List recent jobs"""
+    jobs = [job.to_dict() for job in job_manager.list(kind)]
+    return {
+        "status": "success",
+        "jobs": jobs,
+        "count": len(jobs),
+        "message": "Job list retrieved successfully"
+    }
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """Get job state, progress and timings"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    return {
+        "status": "success",
+        "job": job.to_dict(),
+        "message": "Job retrieved successfully"
+    }
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: str, format: str = "sse", after: int = 0):
+    """Stream job log lines and progress as Server-Sent Events or NDJSON"""
+    job = job_manager.get(job_id)
+    
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format {format}")
+    
+    return StreamingResponse(
+        _stream_job_events(job, format, after),
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException
+import structlog
+from src.core.schemas import parse_names
+from src.services import expiry_purge, migration_targets
+from src.services.jobs import job_manager
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+@router.post("/purge", status_code=202)
+async def purge_expired_rows(targets: str = None):
+    """Delete expired sessions and password resets in batches (``targets``: comma separated names, default all)"""
+    names = parse_names(targets)
+    try:
+        selected = migration_targets.select_targets(names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit("expiry_purge", expiry_purge.purge_expired_job, names=names)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "targets": list(selected),
+            "message": f"Purge of expired rows on {len(selected)} databases submitted"
+        }
+    except Exception as e:
+        logger.error(f"Purge failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import text
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from alembic.util import CommandError
 import structlog
-import subprocess
-import os
-from typing import List, Dict, Any
-from src.core.database import get_master_db
-from src.core.config import settings
+from src.core.schemas import parse_names
+from src.services import (
+    backfill, migration_branches, migration_planner, migration_profiler, migration_targets, provisioning
+)
+from src.services.jobs import job_manager
+from src.services.migration_engine import migration_engine, downgrade_job
 
 logger = structlog.get_logger()
 router = APIRouter()
@@ -15,27 +16,21 @@ router = APIRouter()
 async def get_migration_status():
     """Get migration status"""
     try:
-        # Check current migration version
-        result = subprocess.run(
-            ["alembic", "current"],
-            capture_output=True,
-            text=True,
-            cwd="/app"
-        )
-        
-        if result.returncode == 0:
-            current_version = result.stdout.strip()
-            return {
-                "status": "success",
-                "current_version": current_version,
-                "message": "Migration status retrieved successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "error": result.stderr,
-                "message": "Failed to get migration status"
-            }
+        status = await run_in_threadpool(migration_engine.status)
+        return {
+            "status": "success",
+            "current_version": status["current"],
+            "heads": status["heads"],
+            "pending": status["pending"],
+            "up_to_date": status["up_to_date"],
+            "message": "Migration status retrieved successfully"
+        }
+    except CommandError as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "message": "Failed to get migration status"
+        }
     except Exception as e:
         logger.error(f"Migration status check failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -44,122 +39,253 @@ async def get_migration_status():
 async def get_migration_history():
     """Get migration history"""
     try:
-        result = subprocess.run(
-            ["alembic", "history"],
-            capture_output=True,
-            text=True,
-            cwd="/app"
-        )
-        
-        if result.returncode == 0:
-            return {
-                "status": "success",
-                "history": result.stdout,
-                "message": "Migration history retrieved successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "error": result.stderr,
-                "message": "Failed to get migration history"
-            }
+        history = await run_in_threadpool(migration_engine.history)
+        return {
+            "status": "success",
+            "history": history,
+            "message": "Migration history retrieved successfully"
+        }
+    except CommandError as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "message": "Failed to get migration history"
+        }
     except Exception as e:
         logger.error(f"Migration history check failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/run")
-async def run_migrations(service: str = None, environment: str = "development", dry_run: bool = False):
-    """Run migrations"""
+@router.get("/history/runs")
+async def list_migration_runs(limit: int = 20):
+    """Recent migration runs with per-revision timings"""
+    try:
+        runs = await run_in_threadpool(migration_profiler.list_runs, limit=min(max(limit, 1), 200))
+        return {
+            "status": "success",
+            "runs": runs,
+            "message": "Migration runs retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"Migration run listing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/history/runs/{run_id}")
+async def get_migration_run(run_id: str):
+    """One migration run with per-statement timings"""
+    run = await run_in_threadpool(migration_profiler.get_run, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Migration run {run_id} not found")
+    return {
+        "status": "success",
+        "run": run,
+        "message": "Migration run retrieved successfully"
+    }
+
+@router.get("/backfills")
+async def list_backfills():
+    """Batched backfills run by revisions, with their progress"""
+    try:
+        backfills = await run_in_threadpool(backfill.list_backfills)
+        return {
+            "status": "success",
+            "backfills": backfills,
+            "message": "Backfills retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"Backfill listing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/backfills/{name}")
+async def get_backfill(name: str):
+    """Progress and checkpoint of one backfill on every database it ran on"""
+    checkpoints = await run_in_threadpool(backfill.list_backfills, name)
+    if not checkpoints:
+        raise HTTPException(status_code=404, detail=f"Backfill {name} not found")
+    return {
+        "status": "success",
+        "backfills": checkpoints,
+        "message": "Backfill retrieved successfully"
+    }
+
+@router.delete("/backfills/{name}")
+async def reset_backfill(name: str, database: str = None):
+    """Forget a backfill's checkpoint, on one database or all of them, so it starts over on the next run"""
+    if not await run_in_threadpool(backfill.reset_backfill, name, database):
+        raise HTTPException(status_code=404, detail=f"Backfill {name} not found")
+    return {
+        "status": "success",
+        "name": name,
+        "database": database,
+        "message": f"Backfill {name} reset"
+    }
+
+@router.post("/run", status_code=202)
+async def run_migrations(
+    service: str = None,
+    environment: str = "development",
+    dry_run: bool = False,
+    online: bool = None
+):
+    """Run migrations, only on the branches of ``service`` when given"""
+    labels = None
+    if service:
+        try:
+            labels = migration_branches.labels_for_service(service)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
     try:
-        # Build alembic command
-        cmd = ["alembic", "upgrade", "head"]
-        
         if dry_run:
-            cmd = ["alembic", "check"]
-        
-        logger.info(f"Running migrations: {' '.join(cmd)}")
-        
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            cwd="/app"
-        )
-        
-        if result.returncode == 0:
+            # Every service owns a single schema, hence a single branch
+            target = f"{labels[0]}@head" if labels and len(labels) == 1 else "heads"
+            plan = await run_in_threadpool(migration_planner.plan_upgrade, target, online)
             return {
                 "status": "success",
                 "service": service,
                 "environment": environment,
                 "dry_run": dry_run,
-                "output": result.stdout,
-                "message": "Migrations completed successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "service": service,
-                "environment": environment,
-                "dry_run": dry_run,
-                "error": result.stderr,
-                "message": "Migration failed"
+                "target": plan["target"],
+                "current_version": plan["current"],
+                "online": online,
+                "revisions": plan["revisions"],
+                "summary": plan["summary"],
+                "sql": plan["sql"],
+                "message": "Pending migrations rendered"
             }
+
+        logger.info(f"Submitting migration run of branches {', '.join(labels) if labels else 'all'}")
+        job = job_manager.submit(
+            "migration",
+            migration_branches.upgrade_branches_job,
+            labels=labels,
+            online=online,
+            service=service,
+            environment=environment,
+        )
+
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "service": service,
+            "environment": environment,
+            "dry_run": dry_run,
+            "online": online,
+            "branches": labels or migration_branches.branch_labels(),
+            "message": "Migration job submitted"
+        }
+    except CommandError as e:
+        return {
+            "status": "error",
+            "service": service,
+            "environment": environment,
+            "dry_run": dry_run,
+            "error": str(e),
+            "message": "Migration failed"
+        }
     except Exception as e:
         logger.error(f"Migration execution failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/rollback")
-async def rollback_migrations(revision: str):
+@router.get("/targets")
+async def list_migration_targets():
+    """Databases a fan-out run migrates (the master one and MIGRATION_TARGETS)"""
+    try:
+        targets = migration_targets.list_targets()
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "targets": targets,
+        "message": "Migration targets retrieved successfully"
+    }
+
+@router.post("/targets/run", status_code=202)
+async def run_migrations_on_targets(targets: str = None, online: bool = None):
+    """Migrate several databases concurrently (``targets``: comma separated names, default all)"""
+    names = parse_names(targets)
+    try:
+        selected = migration_targets.select_targets(names)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit("migration_fanout", migration_targets.migrate_targets_job, names=names, online=online)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "targets": list(selected),
+            "online": online,
+            "message": f"Migration of {len(selected)} databases submitted"
+        }
+    except Exception as e:
+        logger.error(f"Migration fan-out failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/rollback", status_code=202)
+async def rollback_migrations(revision: str, online: bool = None):
     """Rollback migrations to specific revision"""
     try:
-        result = subprocess.run(
-            ["alembic", "downgrade", revision],
-            capture_output=True,
-            text=True,
-            cwd="/app"
-        )
-        
-        if result.returncode == 0:
-            return {
-                "status": "success",
-                "revision": revision,
-                "output": result.stdout,
-                "message": f"Rollback to revision {revision} completed successfully"
-            }
-        else:
-            return {
-                "status": "error",
-                "revision": revision,
-                "error": result.stderr,
-                "message": "Rollback failed"
-            }
+        job = job_manager.submit("rollback", downgrade_job, revision=revision, online=online)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "revision": revision,
+            "message": f"Rollback to revision {revision} submitted"
+        }
     except Exception as e:
         logger.error(f"Migration rollback failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/baselines")
+async def list_baselines():
+    """Compiled baselines used to migrate empty databases"""
+    try:
+        baselines = await run_in_threadpool(provisioning.list_baselines)
+        return {
+            "status": "success",
+            "baselines": baselines,
+            "message": "Baselines retrieved successfully"
+        }
+    except Exception as e:
+        logger.error(f"Baseline listing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/baselines", status_code=201)
+async def create_baseline(revision: str = "heads"):
+    """Compile the revisions from base up to ``revision`` into a baseline"""
+    try:
+        baseline = await run_in_threadpool(provisioning.create_baseline, revision)
+        return {
+            "status": "success",
+            "baseline": baseline,
+            "message": f"Baseline for revision {baseline['revision']} created"
+        }
+    except (CommandError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Baseline creation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.post("/validate")
 async def validate_migrations():
     """Validate migration files"""
     try:
-        result = subprocess.run(
-            ["alembic", "check"],
-            capture_output=True,
-            text=True,
-            cwd="/app"
-        )
-        
-        if result.returncode == 0:
+        result = await run_in_threadpool(migration_engine.validate)
+
+        if result["valid"]:
             return {
                 "status": "success",
                 "message": "Migration validation passed",
-                "output": result.stdout
+                "heads": result["heads"],
+                "revisions": result["revisions"]
             }
         else:
             return {
                 "status": "error",
                 "message": "Migration validation failed",
-                "error": result.stderr
+                "heads": result["heads"],
+                "errors": result["errors"]
             }
     except Exception as e:
         logger.error(f"Migration validation failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+import structlog
+from src.core.schemas import parse_names
+from src.services import migration_targets, partitions
+from src.services.jobs import job_manager
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+def _list_target_partitions(name: str):
+    url = migration_targets.select_targets([name])[name]
+    if name == migration_targets.MASTER_TARGET:
+        return partitions.list_partitions()
+    connectable = create_engine(url, poolclass=NullPool)
+    try:
+        return partitions.list_partitions(connectable)
+    finally:
+        connectable.dispose()
+
+@router.get("")
+async def list_partitions(target: str = migration_targets.MASTER_TARGET):
+    """Partitioned tables of a migration target with their partitions and bounds"""
+    try:
+        tables = await run_in_threadpool(_list_target_partitions, target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Partition listing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "target": target,
+        "tables": tables,
+        "message": "Partitions retrieved successfully"
+    }
+
+@router.post("/maintain", status_code=202)
+async def maintain_partitions(targets: str = None):
+    """Create upcoming partitions and expire old ones (``targets``: comma separated names, default all)"""
+    names = parse_names(targets)
+    try:
+        selected = migration_targets.select_targets(names)
+        partitions.policies()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = job_manager.submit("partition_maintenance", partitions.maintain_partitions_job, names=names)
+        return {
+            "status": "accepted",
+            "job_id": job.id,
+            "targets": list(selected),
+            "message": f"Partition maintenance of {len(selected)} databases submitted"
+        }
+    except Exception as e:
+        logger.error(f"Partition maintenance failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,149 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict
+from uuid import UUID
+import structlog
+from src.api.routes.jobs import STREAM_MEDIA_TYPES, _encode_event
+from src.services import plan_queue
+from src.services.plan_queue import FINAL_STATUSES, plan_job_notifier
+
+logger = structlog.get_logger()
+router = APIRouter()
+
+def _streaming_response(events, format: str) -> StreamingResponse:
+    if format not in STREAM_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported stream format {format}")
+    return StreamingResponse(
+        events,
+        media_type=STREAM_MEDIA_TYPES[format],
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _leased(job, job_id: UUID) -> Dict[str, Any]:
+    if job is None:
+        raise HTTPException(status_code=409, detail=f"Plan job {job_id} is not leased by this worker")
+    return job
+
+async def _stream_job(job_id: str, format: str):
+    """Yield the job as it is now, then every change until it finishes"""
+    async with plan_job_notifier.subscribe(job_id=job_id) as changes:
+        job = await run_in_threadpool(plan_queue.get_job, job_id)
+        # The job may be deleted at any point; the stream then just ends
+        if job is None:
+            yield _encode_event({"type": "end", "job": None}, format)
+            return
+        yield _encode_event({"type": "snapshot", "job": job}, format)
+        if job["status"] in FINAL_STATUSES:
+            yield _encode_event({"type": "end", "job": job}, format)
+            return
+        async for change in changes:
+            if change.get("type") == "reconnect":
+                change = await run_in_threadpool(plan_queue.get_job, job_id)
+                if change is None:
+                    yield _encode_event({"type": "end", "job": None}, format)
+                    return
+            yield _encode_event({"type": "change", "job": change}, format)
+            if change["status"] in FINAL_STATUSES:
+                yield _encode_event({"type": "end", "job": change}, format)
+                return
+
+async def _stream_teacher_jobs(teacher_id: str, format: str):
+    """Yield the unfinished jobs of a teacher, then every change to their jobs"""
+    async with plan_job_notifier.subscribe(teacher_id=teacher_id) as changes:
+        jobs = await run_in_threadpool(plan_queue.list_active_jobs, teacher_id)
+        yield _encode_event({"type": "snapshot", "jobs": jobs}, format)
+        async for change in changes:
+            if change.get("type") == "reconnect":
+                jobs = await run_in_threadpool(plan_queue.list_active_jobs, teacher_id)
+                yield _encode_event({"type": "snapshot", "jobs": jobs}, format)
+                continue
+            yield _encode_event({"type": "change", "job": change}, format)
+
+@router.post("", status_code=201)
+async def enqueue_plan_job(teacher_id: UUID, plan_id: UUID = None, max_attempts: int = None):
+    """Queue a plan generation job"""
+    try:
+        job = await run_in_threadpool(
+            plan_queue.enqueue, str(teacher_id), str(plan_id) if plan_id else None, max_attempts
+        )
+    except Exception as e:
+        logger.error(f"Plan job enqueue failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "job": job,
+        "message": "Plan job queued successfully"
+    }
+
+@router.post("/dequeue")
+async def dequeue_plan_jobs(worker_id: str, limit: int = 1, lease_seconds: float = None):
+    """Lease the oldest pending jobs to a worker"""
+    try:
+        jobs = await run_in_threadpool(plan_queue.dequeue, worker_id, limit, lease_seconds)
+    except Exception as e:
+        logger.error(f"Plan job dequeue failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "status": "success",
+        "jobs": jobs,
+        "count": len(jobs),
+        "message": f"{len(jobs)} plan jobs leased to {worker_id}"
+    }
+
+@router.get("/events")
+async def stream_teacher_plan_jobs(teacher_id: UUID, format: str = "sse"):
+    """Stream the plan jobs of a teacher as Server-Sent Events or NDJSON"""
+    return _streaming_response(_stream_teacher_jobs(str(teacher_id), format), format)
+
+@router.get("/{job_id}")
+async def get_plan_job(job_id: UUID):
+    """Get a plan job"""
+    job = await run_in_threadpool(plan_queue.get_job, str(job_id))
+
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Plan job {job_id} not found")
+
+    return {
+        "status": "success",
+        "job": job,
+        "message": "Plan job retrieved successfully"
+    }
+
+@router.get("/{job_id}/events")
+async def stream_plan_job(job_id: UUID, format: str = "sse"):
+    """Stream status and progress changes of a plan job until it finishes"""
+    if await run_in_threadpool(plan_queue.get_job, str(job_id)) is None:
+        raise HTTPException(status_code=404, detail=f"Plan job {job_id} not found")
+    return _streaming_response(_stream_job(str(job_id), format), format)
+
+@router.post("/{job_id}/heartbeat")
+async def heartbeat_plan_job(job_id: UUID, worker_id: str, progress: int = None, lease_seconds: float = None):
+    """Extend the lease of a running job and record its progress"""
+    job = await run_in_threadpool(plan_queue.heartbeat, str(job_id), worker_id, progress, lease_seconds)
+    return {
+        "status": "success",
+        "job": _leased(job, job_id),
+        "message": "Plan job lease extended"
+    }
+
+@router.post("/{job_id}/complete")
+async def complete_plan_job(job_id: UUID, worker_id: str, result: Dict[str, Any] = None):
+    """Finish a running job with its result"""
+    job = await run_in_threadpool(plan_queue.complete, str(job_id), worker_id, result)
+    return {
+        "status": "success",
+        "job": _leased(job, job_id),
+        "message": "Plan job completed"
+    }
+
+@router.post("/{job_id}/fail")
+async def fail_plan_job(job_id: UUID, worker_id: str, error: str):
+    """Give a running job back for a retry, or fail it after its last attempt"""
+    job = await run_in_threadpool(plan_queue.fail, str(job_id), worker_id, error)
+    job = _leased(job, job_id)
+    return {
+        "status": "success",
+        "job": job,
+        "message": "Plan job failed" if job["status"] == "failed" else "Plan job scheduled for retry"
+    }
@@ -1,33 +1,89 @@
 from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 import structlog
 from .config import settings
+from .metrics import TimedAsyncAdaptedQueuePool, TimedQueuePool, register_pools
+from .schemas import SCHEMAS
 
 logger = structlog.get_logger()
 
-# Create engine for migrations database
+# Async driver used for each dialect of the configured URLs
+ASYNC_DRIVERS = {
+    "postgresql": "asyncpg",
+    "sqlite": "aiosqlite",
+}
+
+def _pool_options(name, poolclass=TimedQueuePool):
+    """Bounded pool settings shared by every engine"""
+    return {
+        "poolclass": poolclass,
+        # Label of the pool in logs and metrics
+        "pool_logging_name": name,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+def async_url(url: str):
+    """Same database URL with the async driver of its dialect"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    return url.set(drivername=f"{url.get_backend_name()}+{driver}") if driver else url
+
+# Create engine for migrations database (Alembic, background jobs)
 engine = create_engine(
     settings.DATABASE_URL,
-    poolclass=StaticPool,
-    echo=False
+    echo=False,
+    **_pool_options("migrations_db")
 )
 
 # Create engine for master database
 master_engine = create_engine(
     settings.MASTER_DATABASE_URL,
-    poolclass=StaticPool,
-    echo=False
+    echo=False,
+    **_pool_options("master_db")
+)
+
+# Async engines for request handlers, so they never block the event loop
+async_engine = create_async_engine(
+    async_url(settings.DATABASE_URL),
+    echo=False,
+    **_pool_options("migrations_db_async", TimedAsyncAdaptedQueuePool)
 )
 
+async_master_engine = create_async_engine(
+    async_url(settings.MASTER_DATABASE_URL),
+    echo=False,
+    **_pool_options("master_db_async", TimedAsyncAdaptedQueuePool)
+)
+
+register_pools(lambda: {
+    "migrations_db": engine.pool,
+    "master_db": master_engine.pool,
+    "migrations_db_async": async_engine.pool,
+    "master_db_async": async_master_engine.pool,
+})
+
 # Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 MasterSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=master_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+AsyncMasterSessionLocal = async_sessionmaker(
+    async_master_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 # Base class for models
 Base = declarative_base()
 
+# Base class for the service's own tables in the migrations database.
+# Kept apart from Base, whose metadata is Alembic's target for the master database.
+ServiceBase = declarative_base()
+
 async def init_db():
     """Initialize database and create schemas"""
     try:
@@ -36,18 +92,17 @@ async def init_db():
             result = conn.execute(text("SELECT 1"))
             logger.info("Connected to migrations database successfully")
         
+        # Create the service's own tables (backup catalog, migration history, ...)
+        from src.models import backfill, backup_catalog, migration_history  # noqa: F401
+        ServiceBase.metadata.create_all(bind=engine)
+        
         # Test connection to master database
         with master_engine.connect() as conn:
             result = conn.execute(text("SELECT 1"))
             logger.info("Connected to master database successfully")
             
             # Create schemas if they don't exist
-            schemas = [
-                'auth', 'users', 'organizations', 'academic', 
-                'plans', 'chat', 'analytics', 'files'
-            ]
-            
-            for schema in schemas:
+            for schema in SCHEMAS:
                 conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
                 logger.info(f"Schema {schema} created/verified")
             
@@ -72,4 +127,43 @@ def get_master_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    """Get async database session for migrations"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_master_db():
+    """Get async database session for master database"""
+    async with AsyncMasterSessionLocal() as db:
+        yield db
+
+def _pool_status(pool):
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+    }
+
+def pool_stats():
+    """Connection pool usage of every engine"""
+    return {
+        "migrations_db": {
+            "sync": _pool_status(engine.pool),
+            "async": _pool_status(async_engine.pool),
+        },
+        "master_db": {
+            "sync": _pool_status(master_engine.pool),
+            "async": _pool_status(async_master_engine.pool),
+        },
+    }
+
+async def dispose_engines():
+    """Close every pooled connection"""
+    await async_engine.dispose()
+    await async_master_engine.dispose()
+    engine.dispose()
+    master_engine.dispose() 
\ No newline at end of file
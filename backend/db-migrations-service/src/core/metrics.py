@@ -0,0 +1,105 @@
+import time
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Buckets for operations that run from milliseconds (status) to hours (large dumps)
+OPERATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+SIZE_BUCKETS = tuple(2 ** exponent for exponent in range(20, 41, 2))  # 1 MiB .. 1 TiB
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+OPERATION_DURATION = Histogram(
+    "db_migrations_operation_duration_seconds",
+    "Duration of background operations (migrations, backups, restores, ...)",
+    ["operation", "outcome"],
+    buckets=OPERATION_BUCKETS,
+)
+
+BACKUP_BYTES = Counter(
+    "db_migrations_backup_bytes_total",
+    "Backup bytes written by dumps and read back by restores",
+    ["direction", "format"],
+)
+
+BACKUP_SIZE = Histogram(
+    "db_migrations_backup_size_bytes",
+    "Size of completed backups",
+    ["format"],
+    buckets=SIZE_BUCKETS,
+)
+
+PURGED_ROWS = Counter(
+    "db_migrations_purged_rows_total",
+    "Expired rows deleted by the purge job",
+    ["table"],
+)
+
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection",
+    ["pool"],
+    buckets=WAIT_BUCKETS,
+)
+
+CURRENT_REVISION = Gauge(
+    "db_migrations_current_revision",
+    "Revisions stamped in the master database (1 for every current head)",
+    ["revision"],
+)
+
+
+def set_current_revisions(revisions: Iterable[str]) -> None:
+    CURRENT_REVISION.clear()
+    for revision in revisions:
+        CURRENT_REVISION.labels(revision=revision).set(1)
+
+
+class _CheckoutTimer:
+    """Times ``_do_get``, the only place a checkout can block on the pool"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(pool=self.logging_name or "default").observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_CheckoutTimer, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_CheckoutTimer, AsyncAdaptedQueuePool):
+    pass
+
+
+class PoolCollector:
+    """Exports pool occupancy at scrape time"""
+
+    def __init__(self, pools):
+        # Callable returning {pool name: pool}; engines replace pools on dispose()
+        self.pools = pools
+
+    def collect(self):
+        size = GaugeMetricFamily("db_pool_size", "Configured pool size", labels=["pool"])
+        checked_out = GaugeMetricFamily("db_pool_checked_out", "Connections in use", labels=["pool"])
+        overflow = GaugeMetricFamily("db_pool_overflow", "Connections opened beyond the pool size", labels=["pool"])
+        for name, pool in self.pools().items():
+            size.add_metric([name], pool.size())
+            checked_out.add_metric([name], pool.checkedout())
+            overflow.add_metric([name], max(pool.overflow(), 0))
+        yield size
+        yield checked_out
+        yield overflow
+
+
+def register_pools(pools) -> None:
+    REGISTRY.register(PoolCollector(pools))
@@ -0,0 +1,38 @@
+from typing import Iterable, List
+
+# Schemas of the master database, in dependency order (auth first because
+# every other schema references auth.users)
+SCHEMAS = [
+    'auth', 'users', 'organizations', 'academic',
+    'plans', 'chat', 'analytics', 'files'
+]
+
+# Schemas owned by each microservice
+SERVICE_SCHEMAS = {
+    "auth-service": ["auth"],
+    "user-service": ["users"],
+    "organization-service": ["organizations"],
+    "academic-service": ["academic"],
+    "plans-service": ["plans"],
+    "chat-service": ["chat"],
+    "analytics-service": ["analytics"],
+    "file-service": ["files"],
+}
+
+
+def parse_names(value: str) -> List[str]:
+    """Split a comma separated query parameter"""
+    return [name.strip() for name in value.split(",") if name.strip()] if value else []
+
+
+def schemas_for(names: Iterable[str]) -> List[str]:
+    """Resolve service or schema names to schemas, in dependency order"""
+    schemas = set()
+    for name in names:
+        if name in SERVICE_SCHEMAS:
+            schemas.update(SERVICE_SCHEMAS[name])
+        elif name in SCHEMAS:
+            schemas.add(name)
+        else:
+            raise ValueError(f"Unknown service or schema {name}")
+    return [schema for schema in SCHEMAS if schema in schemas]
@@ -1,11 +1,25 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import asyncio
+import time
 import structlog
 
-from src.api.routes import migrations, health, backup
+from src.api.routes import migrations, health, backup, databases, indexes, jobs, maintenance, partitions, plan_jobs
 from src.core.config import settings
-from src.core.database import init_db
+from src.core.database import dispose_engines, init_db
+from src.core.metrics import REQUEST_DURATION
+from src.services.backups import apply_retention, reconcile_catalog
+from src.services.expiry_purge import purge_expired_job
+from src.services.health_prober import health_prober
+from src.services.jobs import job_manager, run_periodically
+from src.services.migration_branches import restamp_legacy
+from src.services.migration_engine import migration_engine
+from src.services.partitions import maintain_partitions_job
+from src.services.plan_queue import plan_job_notifier, release_expired_leases
+from src.services.wal_archive import wal_archiver
 
 # Configure structured logging
 structlog.configure(
@@ -34,12 +48,47 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting Database Migration Service")
     await init_db()
+    try:
+        # Databases migrated with the former linear chain
+        await run_in_threadpool(restamp_legacy)
+    except Exception as e:
+        logger.warning(f"Could not restamp legacy revisions: {str(e)}")
+    try:
+        # Publishes the current revision gauge
+        await run_in_threadpool(migration_engine.status)
+    except Exception as e:
+        logger.warning(f"Could not read migration status: {str(e)}")
+    if settings.WAL_ARCHIVE_ENABLED:
+        wal_archiver.start()
+    job_manager.submit("backup_catalog_reconcile", reconcile_catalog)
+    # Partitions for the coming periods must exist before rows arrive
+    job_manager.submit("partition_maintenance", maintain_partitions_job)
+    background_tasks = [
+        asyncio.create_task(health_prober.run()),
+        asyncio.create_task(run_periodically("backup_gc", apply_retention, settings.BACKUP_GC_INTERVAL_SECONDS)),
+        asyncio.create_task(run_periodically(
+            "backup_catalog_reconcile", reconcile_catalog, settings.BACKUP_CATALOG_RECONCILE_SECONDS
+        )),
+        asyncio.create_task(run_periodically(
+            "partition_maintenance", maintain_partitions_job, settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS
+        )),
+        asyncio.create_task(run_periodically("expiry_purge", purge_expired_job, settings.PURGE_INTERVAL_SECONDS)),
+        asyncio.create_task(run_periodically(
+            "plan_queue_reaper", release_expired_leases, settings.PLAN_QUEUE_REAP_INTERVAL_SECONDS
+        )),
+    ]
     logger.info("Database Migration Service started successfully")
     
     yield
     
     # Shutdown
     logger.info("Shutting down Database Migration Service")
+    for task in background_tasks:
+        task.cancel()
+    wal_archiver.stop()
+    await plan_job_notifier.close()
+    job_manager.shutdown()
+    await dispose_engines()
 
 # Create FastAPI app
 app = FastAPI(
@@ -58,10 +107,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates keep label cardinality bounded (/api/jobs/{job_id})
+        route = request.scope.get("route")
+        REQUEST_DURATION.labels(
+            method=request.method,
+            route=route.path if route else "unmatched",
+            status=str(status)
+        ).observe(time.perf_counter() - started)
+
 # Include routers
 app.include_router(health.router, prefix="/api", tags=["health"])
 app.include_router(migrations.router, prefix="/api/migrations", tags=["migrations"])
 app.include_router(backup.router, prefix="/api/backup", tags=["backup"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(databases.router, prefix="/api/databases", tags=["databases"])
+app.include_router(indexes.router, prefix="/api/indexes", tags=["indexes"])
+app.include_router(maintenance.router, prefix="/api/maintenance", tags=["maintenance"])
+app.include_router(partitions.router, prefix="/api/partitions", tags=["partitions"])
+app.include_router(plan_jobs.router, prefix="/api/plan-jobs", tags=["plan-jobs"])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
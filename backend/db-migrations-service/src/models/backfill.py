@@ -0,0 +1,56 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, String, Text
+
+from src.core.database import ServiceBase
+
+
+class BackfillCheckpoint(ServiceBase):
+    """Progress of a batched backfill, used to resume it after an interruption"""
+    __tablename__ = "backfill_checkpoints"
+
+    # Each database keeps its own progress: the service may migrate several
+    # (targets, the provisioning template), keyed by URL without password
+    database = Column(String(512), primary_key=True)
+    name = Column(String(255), primary_key=True)
+    table_name = Column(String(255), nullable=False)
+    key_column = Column(String(255), nullable=False)
+    # Last primary key of the last committed batch, as text so any key type fits
+    last_key = Column(Text, nullable=True)
+    batch_size = Column(Integer, nullable=False)
+    batches = Column(Integer, nullable=False, default=0)
+    rows_scanned = Column(BigInteger, nullable=False, default=0)
+    rows_updated = Column(BigInteger, nullable=False, default=0)
+    total_estimate = Column(BigInteger, nullable=True)
+    status = Column(String(20), nullable=False)
+    error = Column(Text, nullable=True)
+    duration_seconds = Column(Float, nullable=False, default=0)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    def progress(self) -> float:
+        if self.status == "completed":
+            return 100.0
+        if not self.total_estimate:
+            return 0.0
+        return round(min(self.rows_scanned / self.total_estimate * 100, 99.9), 1)
+
+    def to_dict(self):
+        return {
+            "database": self.database,
+            "name": self.name,
+            "table": self.table_name,
+            "key_column": self.key_column,
+            "last_key": self.last_key,
+            "batch_size": self.batch_size,
+            "batches": self.batches,
+            "rows_scanned": self.rows_scanned,
+            "rows_updated": self.rows_updated,
+            "total_estimate": self.total_estimate,
+            "progress": self.progress(),
+            "status": self.status,
+            "error": self.error,
+            "duration_seconds": round(self.duration_seconds, 3),
+            "started_at": self.started_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
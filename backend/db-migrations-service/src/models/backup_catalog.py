@@ -0,0 +1,48 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, Index, Integer, String, Text
+from sqlalchemy.dialects import postgresql
+
+from src.core.database import ServiceBase
+
+
+class BackupCatalogEntry(ServiceBase):
+    """One logical backup known to the service"""
+    __tablename__ = "backup_catalog"
+
+    backup_id = Column(String(255), primary_key=True)
+    service = Column(String(255), nullable=True)
+    description = Column(Text, nullable=True)
+    database = Column(String(255), nullable=True)
+    format = Column(String(20), nullable=False)
+    jobs = Column(Integer, nullable=False, default=1)
+    compression = Column(Integer, nullable=False, default=0)
+    schemas = Column(postgresql.ARRAY(String(63)), nullable=True)
+    size_bytes = Column(BigInteger, nullable=False, default=0)
+    checksum = Column(String(64), nullable=True)
+    duration_seconds = Column(Float, nullable=True)
+    source_revision = Column(String(255), nullable=True)
+    location = Column(String(1024), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        # Keyset pagination walks (created_at, backup_id) in descending order
+        Index("idx_backup_catalog_created_at", "created_at", "backup_id"),
+        Index("idx_backup_catalog_service", "service"),
+    )
+
+    def to_dict(self):
+        return {
+            "backup_id": self.backup_id,
+            "service": self.service,
+            "description": self.description,
+            "database": self.database,
+            "schemas": self.schemas,
+            "format": self.format,
+            "jobs": self.jobs,
+            "compression": self.compression,
+            "size_bytes": self.size_bytes,
+            "checksum": self.checksum,
+            "duration_seconds": self.duration_seconds,
+            "source_revision": self.source_revision,
+            "location": self.location,
+            "created_at": self.created_at.isoformat(),
+        }
@@ -0,0 +1,116 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text
+from sqlalchemy.orm import relationship
+
+from src.core.database import ServiceBase
+
+
+class MigrationRun(ServiceBase):
+    """One upgrade or downgrade executed by the service"""
+    __tablename__ = "migration_runs"
+
+    id = Column(String(36), primary_key=True)
+    job_id = Column(String(36), nullable=True)
+    operation = Column(String(20), nullable=False)
+    target = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False)
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    duration_ms = Column(Float, nullable=True)
+
+    revisions = relationship(
+        "MigrationRevisionTiming",
+        back_populates="run",
+        order_by="MigrationRevisionTiming.position",
+        cascade="all, delete-orphan",
+    )
+
+    __table_args__ = (
+        Index("idx_migration_runs_started_at", "started_at"),
+    )
+
+    def to_dict(self, statements: bool = False):
+        return {
+            "run_id": self.id,
+            "job_id": self.job_id,
+            "operation": self.operation,
+            "target": self.target,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_ms": self.duration_ms,
+            "revisions": [revision.to_dict(statements) for revision in self.revisions],
+        }
+
+
+class MigrationRevisionTiming(ServiceBase):
+    """Wall time, lock waits and row counts of one revision within a run"""
+    __tablename__ = "migration_revision_timings"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String(36), ForeignKey("migration_runs.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    revision = Column(String(255), nullable=False)
+    from_revisions = Column(String(255), nullable=True)
+    direction = Column(String(20), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Float, nullable=False)
+    lock_wait_ms = Column(Float, nullable=False, default=0)
+    statements = Column(Integer, nullable=False, default=0)
+    rows = Column(BigInteger, nullable=False, default=0)
+
+    run = relationship("MigrationRun", back_populates="revisions")
+    statement_timings = relationship(
+        "MigrationStatementTiming",
+        order_by="MigrationStatementTiming.position",
+        cascade="all, delete-orphan",
+    )
+
+    __table_args__ = (
+        Index("idx_migration_revision_timings_run", "run_id"),
+        Index("idx_migration_revision_timings_revision", "revision", "id"),
+    )
+
+    def to_dict(self, statements: bool = False):
+        result = {
+            "revision": self.revision,
+            "from_revisions": self.from_revisions.split(",") if self.from_revisions else [],
+            "direction": self.direction,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "lock_wait_ms": self.lock_wait_ms,
+            "statements": self.statements,
+            "rows": self.rows,
+        }
+        if statements:
+            result["statement_timings"] = [timing.to_dict() for timing in self.statement_timings]
+        return result
+
+
+class MigrationStatementTiming(ServiceBase):
+    """A single SQL statement executed by a revision"""
+    __tablename__ = "migration_statement_timings"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    revision_timing_id = Column(
+        Integer, ForeignKey("migration_revision_timings.id", ondelete="CASCADE"), nullable=False
+    )
+    position = Column(Integer, nullable=False)
+    statement = Column(Text, nullable=False)
+    duration_ms = Column(Float, nullable=False)
+    lock_wait_ms = Column(Float, nullable=False, default=0)
+    rows = Column(BigInteger, nullable=True)
+
+    __table_args__ = (
+        Index("idx_migration_statement_timings_revision", "revision_timing_id"),
+    )
+
+    def to_dict(self):
+        return {
+            "position": self.position,
+            "statement": self.statement,
+            "duration_ms": self.duration_ms,
+            "lock_wait_ms": self.lock_wait_ms,
+            "rows": self.rows,
+        }
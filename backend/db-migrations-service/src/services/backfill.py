@@ -0,0 +1,211 @@
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.engine import Connection, make_url
+
+from src.core.config import settings
+from src.core.database import SessionLocal, engine
+from src.models.backfill import BackfillCheckpoint
+
+# An alembic.* logger, so the progress lands in the migration job's log
+logger = logging.getLogger("alembic.backfill")
+
+# Progress is logged every this many batches
+LOG_EVERY_BATCHES = 10
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def qualified_name(dialect, table_name: str, schema: Optional[str] = None) -> str:
+    preparer = dialect.identifier_preparer
+    name = preparer.quote(table_name)
+    return f"{preparer.quote_schema(schema)}.{name}" if schema else name
+
+
+def _estimate_rows(connection: Connection, table: str) -> Optional[int]:
+    """Planner estimate on PostgreSQL, an exact count elsewhere"""
+    if connection.dialect.name == "postgresql":
+        # Summed over the partitions of a partitioned table, which has no
+        # statistics of its own; a plain table is its only leaf
+        estimate = connection.execute(
+            text(
+                "SELECT CASE WHEN bool_and(c.reltuples < 0) THEN -1 ELSE sum(greatest(c.reltuples, 0)) END::bigint "
+                "FROM pg_partition_tree(to_regclass(:name)) t "
+                "JOIN pg_catalog.pg_class c ON c.oid = t.relid WHERE t.isleaf"
+            ),
+            {"name": table}
+        ).scalar()
+        # -1 means the table was never analyzed
+        if estimate is not None and estimate >= 0:
+            return estimate
+    return connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+def database_key(connection: Connection) -> str:
+    """Database a checkpoint belongs to: its URL without the password"""
+    return make_url(connection.engine.url).render_as_string(hide_password=True)
+
+
+def _start(
+    database: str, name: str, table: str, key: str, batch_size: int, total_estimate: Optional[int]
+) -> Dict[str, Any]:
+    """Load the checkpoint of a backfill, creating it on the first run"""
+    # Command line runs may happen before the service ever created its tables
+    BackfillCheckpoint.__table__.create(bind=engine, checkfirst=True)
+    now = _now()
+    with SessionLocal() as db:
+        checkpoint = db.get(BackfillCheckpoint, (database, name))
+        if checkpoint is None:
+            checkpoint = BackfillCheckpoint(
+                database=database,
+                name=name,
+                table_name=table,
+                key_column=key,
+                batch_size=batch_size,
+                batches=0,
+                rows_scanned=0,
+                rows_updated=0,
+                total_estimate=total_estimate,
+                status="running",
+                duration_seconds=0,
+                started_at=now,
+                updated_at=now,
+            )
+            db.add(checkpoint)
+        elif checkpoint.status != "completed":
+            checkpoint.status = "running"
+            checkpoint.error = None
+            checkpoint.batch_size = batch_size
+            checkpoint.total_estimate = total_estimate
+            checkpoint.updated_at = now
+        db.commit()
+        return checkpoint.to_dict()
+
+
+def _save(database: str, name: str, **values) -> None:
+    with SessionLocal() as db:
+        db.execute(
+            update(BackfillCheckpoint)
+            .where(BackfillCheckpoint.database == database, BackfillCheckpoint.name == name)
+            .values(updated_at=_now(), **values)
+        )
+        db.commit()
+
+
+def run_backfill(
+    connection: Connection,
+    name: str,
+    table: str,
+    set_clause: str,
+    where: Optional[str] = None,
+    key: str = "id",
+    batch_size: Optional[int] = None,
+    sleep_seconds: Optional[float] = None,
+) -> Dict[str, Any]:
+    """UPDATE a table in primary key ranges, one committed batch at a time.
+
+    ``connection`` must be in autocommit mode so every batch commits on its
+    own. Progress is checkpointed per database after each batch; running the
+    same ``name`` on the same database again resumes after the last
+    committed range, and does nothing once the backfill has completed there. A batch may be applied twice when the
+    process dies between its commit and its checkpoint, so ``set_clause``
+    has to be idempotent.
+    """
+    batch_size = batch_size or settings.BACKFILL_BATCH_SIZE
+    sleep_seconds = settings.BACKFILL_SLEEP_SECONDS if sleep_seconds is None else sleep_seconds
+    key_column = connection.dialect.identifier_preparer.quote(key)
+
+    database = database_key(connection)
+    checkpoint = _start(database, name, table, key, batch_size, _estimate_rows(connection, table))
+    if checkpoint["status"] == "completed":
+        logger.info(f"Backfill {name} already completed, skipping")
+        return checkpoint
+    if checkpoint["last_key"] is not None:
+        logger.info(f"Resuming backfill {name} after {key} {checkpoint['last_key']}")
+
+    last_key = checkpoint["last_key"]
+    batches = checkpoint["batches"]
+    rows_updated = checkpoint["rows_updated"]
+    try:
+        while True:
+            started = time.perf_counter()
+            lower = f" WHERE {key_column} > :last_key" if last_key is not None else ""
+            # Upper bound of the next range: the batch_size-th key after the last one
+            upper_key = connection.execute(
+                text(f"SELECT {key_column} FROM {table}{lower} ORDER BY {key_column} LIMIT 1 OFFSET :offset"),
+                {"last_key": last_key, "offset": batch_size - 1}
+            ).scalar()
+
+            conditions = []
+            if last_key is not None:
+                conditions.append(f"{key_column} > :last_key")
+            if upper_key is not None:
+                conditions.append(f"{key_column} <= :upper_key")
+            if where:
+                conditions.append(f"({where})")
+            result = connection.execute(
+                text(f"UPDATE {table} SET {set_clause} WHERE {' AND '.join(conditions) or '1 = 1'}"),
+                {"last_key": last_key, "upper_key": upper_key}
+            )
+
+            batches += 1
+            rows_updated += max(result.rowcount, 0)
+            last_key = str(upper_key) if upper_key is not None else last_key
+            _save(
+                database,
+                name,
+                last_key=last_key,
+                batches=BackfillCheckpoint.batches + 1,
+                rows_scanned=BackfillCheckpoint.rows_scanned + batch_size,
+                rows_updated=BackfillCheckpoint.rows_updated + max(result.rowcount, 0),
+                duration_seconds=BackfillCheckpoint.duration_seconds + (time.perf_counter() - started),
+            )
+            if upper_key is None:
+                break
+            if batches % LOG_EVERY_BATCHES == 0:
+                logger.info(f"Backfill {name}: {batches} batches, {rows_updated} rows updated, at {key} {last_key}")
+            if sleep_seconds:
+                time.sleep(sleep_seconds)
+    except Exception as e:
+        _save(database, name, status="failed", error=str(e))
+        raise
+
+    _save(database, name, status="completed", finished_at=_now())
+    logger.info(f"Backfill {name} completed: {batches} batches, {rows_updated} rows updated")
+    return get_backfill(database, name)
+
+
+def list_backfills(name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Checkpoints of every database, or of one backfill, newest first"""
+    query = select(BackfillCheckpoint).order_by(BackfillCheckpoint.started_at.desc())
+    if name is not None:
+        query = query.where(BackfillCheckpoint.name == name)
+    with SessionLocal() as db:
+        return [checkpoint.to_dict() for checkpoint in db.execute(query).scalars().all()]
+
+
+def get_backfill(database: str, name: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        checkpoint = db.get(BackfillCheckpoint, (database, name))
+        return checkpoint.to_dict() if checkpoint else None
+
+
+def reset_backfill(name: str, database: Optional[str] = None) -> bool:
+    """Forget a backfill's checkpoint so the next run starts from the beginning.
+
+    Only the checkpoint of ``database`` is removed when given, the one of
+    every database otherwise.
+    """
+    BackfillCheckpoint.__table__.create(bind=engine, checkfirst=True)
+    statement = delete(BackfillCheckpoint).where(BackfillCheckpoint.name == name)
+    if database is not None:
+        statement = statement.where(BackfillCheckpoint.database == database)
+    with SessionLocal() as db:
+        deleted = db.execute(statement).rowcount
+        db.commit()
+        return bool(deleted)
@@ -0,0 +1,132 @@
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from src.core.database import SessionLocal
+from src.models.backup_catalog import BackupCatalogEntry
+
+logger = structlog.get_logger()
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def _parse_timestamp(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    # Manifests store local naive timestamps
+    return timestamp if timestamp.tzinfo else timestamp.astimezone()
+
+
+def compute_checksum(path: str) -> str:
+    """sha256 over a backup file, or over every file of a backup directory"""
+    digest = hashlib.sha256()
+    if os.path.isfile(path):
+        paths = [path]
+    else:
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, files in os.walk(path)
+            for name in files
+            if name != "manifest.json"
+        )
+    for file_path in paths:
+        digest.update(os.path.relpath(file_path, path).encode())
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def record(manifest: Dict[str, Any], location: str, checksum: Optional[str] = None) -> None:
+    """Insert or update the catalog row of a backup.
+
+    A single INSERT ... ON CONFLICT, so a reconcile and the backup job
+    recording the same backup concurrently do not race into a duplicate key.
+    """
+    values = {
+        "service": manifest.get("service"),
+        "description": manifest.get("description"),
+        "database": manifest.get("database"),
+        "format": manifest["format"],
+        "jobs": manifest.get("jobs", 1),
+        "compression": manifest.get("compression", 0),
+        "schemas": manifest.get("schemas"),
+        "size_bytes": manifest.get("size_bytes", 0),
+        "checksum": checksum or manifest.get("checksum"),
+        "duration_seconds": manifest.get("duration_seconds"),
+        "source_revision": manifest.get("source_revision"),
+        "location": location,
+        "created_at": _parse_timestamp(manifest["created_at"]),
+    }
+    statement = insert(BackupCatalogEntry).values(backup_id=manifest["backup_id"], **values)
+    with SessionLocal() as db:
+        db.execute(statement.on_conflict_do_update(index_elements=[BackupCatalogEntry.backup_id], set_=values))
+        db.commit()
+
+
+def remove(backup_id: str) -> None:
+    with SessionLocal() as db:
+        entry = db.get(BackupCatalogEntry, backup_id)
+        if entry is not None:
+            db.delete(entry)
+            db.commit()
+
+
+def backup_ids() -> set:
+    with SessionLocal() as db:
+        return set(db.execute(select(BackupCatalogEntry.backup_id)).scalars().all())
+
+
+def encode_cursor(entry: BackupCatalogEntry) -> str:
+    payload = json.dumps([entry.created_at.isoformat(), entry.backup_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, backup_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), backup_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def query(
+    service: Optional[str] = None,
+    format: Optional[str] = None,
+    schema: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """A page of catalog entries, newest first, and the cursor of the next page"""
+    statement = select(BackupCatalogEntry)
+    if service:
+        statement = statement.where(BackupCatalogEntry.service == service)
+    if format:
+        statement = statement.where(BackupCatalogEntry.format == format)
+    if schema:
+        statement = statement.where(BackupCatalogEntry.schemas.any(schema))
+    if created_after:
+        statement = statement.where(BackupCatalogEntry.created_at >= created_after)
+    if created_before:
+        statement = statement.where(BackupCatalogEntry.created_at < created_before)
+    if cursor:
+        statement = statement.where(
+            tuple_(BackupCatalogEntry.created_at, BackupCatalogEntry.backup_id) < tuple_(*decode_cursor(cursor))
+        )
+    statement = statement.order_by(
+        BackupCatalogEntry.created_at.desc(), BackupCatalogEntry.backup_id.desc()
+    ).limit(limit + 1)
+
+    with SessionLocal() as db:
+        entries = db.execute(statement).scalars().all()
+
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return [entry.to_dict() for entry in entries[:limit]], next_cursor
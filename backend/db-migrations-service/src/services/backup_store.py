@@ -0,0 +1,173 @@
+import hashlib
+import os
+import time
+import zlib
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional
+
+import structlog
+
+from src.core.config import settings
+
+logger = structlog.get_logger()
+
+# Content defined chunking bounds. A chunk boundary is placed after a line
+# whose crc32 falls below its length relative to the target size, so on
+# average one cut happens every BACKUP_CHUNK_TARGET bytes, independently of
+# where earlier data was inserted or removed.
+MIN_CHUNK_FACTOR = 4
+MAX_CHUNK_FACTOR = 4
+
+
+def store_path() -> str:
+    return os.path.join(settings.BACKUP_PATH, "store")
+
+
+def chunk_path(digest: str) -> str:
+    return os.path.join(store_path(), "chunks", digest[:2], digest)
+
+
+def iter_chunks(stream: BinaryIO, target_size: int = None) -> Iterator[bytes]:
+    """Split a line oriented stream (such as a plain SQL dump) into chunks"""
+    target_size = target_size or settings.BACKUP_CHUNK_TARGET
+    min_size = target_size // MIN_CHUNK_FACTOR
+    max_size = target_size * MAX_CHUNK_FACTOR
+    buffer: List[bytes] = []
+    size = 0
+
+    for line in stream:
+        # Flushed before a line would push the chunk past max_size
+        if buffer and size + len(line) > max_size:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+        # A single huge line (large bytea/text values) is split at max_size
+        while len(line) > max_size:
+            yield line[:max_size]
+            line = line[max_size:]
+        buffer.append(line)
+        size += len(line)
+        if size >= max_size or (size >= min_size and zlib.crc32(line) % target_size < len(line)):
+            yield b"".join(buffer)
+            buffer, size = [], 0
+
+    if buffer:
+        yield b"".join(buffer)
+
+
+def put_chunk(data: bytes) -> Dict[str, int]:
+    """Store a chunk under its sha256 unless an identical chunk exists"""
+    digest = hashlib.sha256(data).hexdigest()
+    path = chunk_path(digest)
+    if os.path.exists(path):
+        # Refresh mtime so a concurrent garbage collection keeps the chunk
+        os.utime(path)
+        return {"digest": digest, "stored_bytes": 0}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = zlib.compress(data, settings.BACKUP_COMPRESSION or 1)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(compressed)
+    os.replace(tmp_path, path)
+    return {"digest": digest, "stored_bytes": len(compressed)}
+
+
+def get_chunk(digest: str) -> bytes:
+    with open(chunk_path(digest), "rb") as f:
+        data = zlib.decompress(f.read())
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"Chunk {digest} is corrupted")
+    return data
+
+
+def write_stream(stream: BinaryIO, chunk_list_path: str, on_chunk: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+    """Chunk ``stream`` into the store and record the chunk list in a file"""
+    logical_bytes = 0
+    stored_bytes = 0
+    chunks = 0
+    new_chunks = 0
+    with open(chunk_list_path, "w") as chunk_list:
+        for data in iter_chunks(stream):
+            result = put_chunk(data)
+            chunk_list.write(result["digest"] + "\n")
+            logical_bytes += len(data)
+            stored_bytes += result["stored_bytes"]
+            chunks += 1
+            new_chunks += 1 if result["stored_bytes"] else 0
+            if on_chunk:
+                on_chunk(logical_bytes)
+    return {
+        "logical_bytes": logical_bytes,
+        "stored_bytes": stored_bytes,
+        "chunks": chunks,
+        "new_chunks": new_chunks,
+    }
+
+
+def read_chunk_list(chunk_list_path: str) -> List[str]:
+    with open(chunk_list_path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+class ChunkReader:
+    """File-like reader that reassembles a chunked part on demand"""
+
+    def __init__(self, digests: List[str]):
+        self._digests = iter(digests)
+        self._buffer = b""
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        while size < 0 or len(self._buffer) < size:
+            digest = next(self._digests, None)
+            if digest is None:
+                break
+            self._buffer += get_chunk(digest)
+        if size < 0:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_read += len(data)
+        return data
+
+    def close(self) -> None:
+        self._buffer = b""
+
+    def __enter__(self) -> "ChunkReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def collect_garbage(referenced: set, grace_seconds: int) -> Dict[str, int]:
+    """Delete chunks no manifest references, skipping recently written ones"""
+    chunks_dir = os.path.join(store_path(), "chunks")
+    cutoff = time.time() - grace_seconds
+    removed = 0
+    removed_bytes = 0
+    kept = 0
+    kept_bytes = 0
+
+    if not os.path.isdir(chunks_dir):
+        return {"removed_chunks": 0, "removed_bytes": 0, "chunks": 0, "stored_bytes": 0}
+
+    for prefix in os.listdir(chunks_dir):
+        prefix_dir = os.path.join(chunks_dir, prefix)
+        with os.scandir(prefix_dir) as entries:
+            for entry in entries:
+                stat = entry.stat()
+                if entry.name in referenced or stat.st_mtime > cutoff:
+                    kept += 1
+                    kept_bytes += stat.st_size
+                    continue
+                os.remove(entry.path)
+                removed += 1
+                removed_bytes += stat.st_size
+
+    logger.info(f"Backup store garbage collection removed {removed} chunks ({removed_bytes} bytes)")
+    return {
+        "removed_chunks": removed,
+        "removed_bytes": removed_bytes,
+        "chunks": kept,
+        "stored_bytes": kept_bytes,
+    }
@@ -0,0 +1,647 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import structlog
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.database import async_master_engine, master_engine
+from src.core.metrics import BACKUP_BYTES, BACKUP_SIZE
+from src.core.schemas import SCHEMAS, parse_names, schemas_for
+from src.services import backup_catalog, backup_store, database_admin, object_storage
+from src.services.jobs import Job
+from src.services.migration_engine import migration_engine
+from src.utils.process import run_streaming, run_with_stdout
+
+logger = structlog.get_logger()
+
+# pg_dump --verbose / pg_restore --verbose lines announcing table data
+TABLE_DATA_PATTERN = re.compile(r'(?:dumping contents of|processing data for) table "?([^"\s]+)"?')
+
+BACKUP_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+MANIFEST_NAME = "manifest.json"
+
+# pg_dump -F flag and on-disk part name for every supported format
+BACKUP_FORMATS = {
+    "plain": ("p", "dump.sql"),
+    "custom": ("c", "dump.dump"),
+    "directory": ("d", "dump"),
+    # Plain SQL streamed into the deduplicated chunk store
+    "chunked": ("p", "dump.chunks"),
+}
+
+# Formats replayed through psql rather than pg_restore
+SQL_FORMATS = ("plain", "chunked")
+
+# Formats pg_dump can write to stdout, and so stream to BACKUP_STORAGE
+STREAMABLE_FORMATS = ("plain", "custom")
+
+
+class BackupNotFound(Exception):
+    """Raised when a backup id does not exist in BACKUP_PATH"""
+
+
+def backup_path_for(backup_id: str) -> str:
+    if not BACKUP_ID_PATTERN.match(backup_id) or backup_id in (".", ".."):
+        raise ValueError(f"Invalid backup id {backup_id}")
+    return os.path.join(settings.BACKUP_PATH, backup_id)
+
+
+def pg_connection(url: str = None) -> Tuple[List[str], Dict[str, str]]:
+    """Command line arguments and environment for the pg_* client tools"""
+    url = make_url(url or settings.MASTER_DATABASE_URL)
+    args = ["-h", url.host or "localhost", "-p", str(url.port or 5432), "-U", url.username or "postgres"]
+    env = os.environ.copy()
+    if url.password:
+        env["PGPASSWORD"] = url.password
+    return args, env
+
+
+def _database_name(url: str = None) -> str:
+    return make_url(url or settings.MASTER_DATABASE_URL).database
+
+
+def _count_tables(schemas: Optional[List[str]] = None, engine=None) -> int:
+    """Number of user tables, used as the denominator for table progress"""
+    try:
+        with (engine or master_engine).connect() as conn:
+            if schemas:
+                return conn.execute(
+                    text("SELECT count(*) FROM pg_catalog.pg_tables WHERE schemaname = ANY(:schemas)"),
+                    {"schemas": schemas}
+                ).scalar() or 0
+            return conn.execute(text(
+                "SELECT count(*) FROM pg_catalog.pg_tables "
+                "WHERE schemaname NOT IN ('pg_catalog', 'information_schema')"
+            )).scalar() or 0
+    except Exception as e:
+        logger.warning(f"Could not count tables for progress reporting: {str(e)}")
+        return 0
+
+
+def _path_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+class TableProgress:
+    """Forwards tool output to a job and derives per-table progress from it"""
+
+    def __init__(self, job: Job, total_tables: int):
+        self.job = job
+        self.total_tables = total_tables
+        self.tables_done = 0
+        # Shared by concurrent per-schema dumps
+        self._lock = threading.Lock()
+
+    def __call__(self, line: str) -> None:
+        self.job.log(line)
+        match = TABLE_DATA_PATTERN.search(line)
+        if not match:
+            return
+        with self._lock:
+            self.tables_done += 1
+        progress = (self.tables_done / self.total_tables * 100) if self.total_tables else 0
+        self.job.emit("table", table=match.group(1), tables_done=self.tables_done, tables_total=self.total_tables)
+        self.job.update_progress(min(progress, 99.0), f"Table {match.group(1)}")
+
+
+def read_manifest(backup_id: str) -> Dict[str, Any]:
+    """Manifest of a backup; legacy single-file .sql dumps get a synthetic one"""
+    backup_path = backup_path_for(backup_id)
+    manifest_path = os.path.join(backup_path, MANIFEST_NAME)
+
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    if os.path.isfile(backup_path) and backup_id.endswith(".sql"):
+        return {
+            "backup_id": backup_id,
+            "format": "plain",
+            "jobs": 1,
+            "compression": 0,
+            "parts": [{"path": "", "size_bytes": os.path.getsize(backup_path)}],
+            "size_bytes": os.path.getsize(backup_path),
+            "created_at": datetime.fromtimestamp(os.path.getmtime(backup_path)).isoformat(),
+            "legacy": True,
+        }
+
+    raise BackupNotFound(f"Backup {backup_id} not found")
+
+
+def _write_manifest(backup_path: str, manifest: Dict[str, Any]) -> None:
+    tmp_path = os.path.join(backup_path, MANIFEST_NAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(backup_path, MANIFEST_NAME))
+
+
+def list_backups() -> List[Dict[str, Any]]:
+    """Manifests of every backup in BACKUP_PATH"""
+    backups = []
+    if not os.path.exists(settings.BACKUP_PATH):
+        return backups
+    for name in sorted(os.listdir(settings.BACKUP_PATH)):
+        try:
+            backups.append(read_manifest(name))
+        except (BackupNotFound, ValueError):
+            continue
+    return backups
+
+
+def _storage_key(manifest: Dict[str, Any], part: Dict[str, Any] = None) -> str:
+    """Object key of an uploaded backup's part, or its key prefix"""
+    _, prefix = object_storage.parse_storage_url(manifest["storage"])
+    return prefix + part["path"] if part else prefix
+
+
+def delete_backup(backup_id: str) -> None:
+    # Only ids with a manifest (or legacy dumps) are deletable, never the
+    # wal/, base/ or pitr/ directories that share BACKUP_PATH
+    manifest = read_manifest(backup_id)
+    if manifest.get("storage"):
+        object_storage.delete_prefix(_storage_key(manifest))
+    backup_path = backup_path_for(backup_id)
+    if os.path.isdir(backup_path):
+        shutil.rmtree(backup_path)
+    elif os.path.isfile(backup_path):
+        os.remove(backup_path)
+    else:
+        raise BackupNotFound(f"Backup {backup_id} not found")
+    backup_catalog.remove(backup_id)
+
+
+def _source_revision() -> Optional[str]:
+    try:
+        return ",".join(migration_engine.current_heads()) or None
+    except Exception as e:
+        logger.warning(f"Could not read source revision: {str(e)}")
+        return None
+
+
+@contextmanager
+def _exported_snapshot(needed: bool) -> Iterator[Optional[str]]:
+    """A snapshot the concurrent pg_dumps share, so the parts of a backup
+    are consistent with each other (cross-schema foreign keys).
+
+    The exporting transaction has to stay open until every dump started.
+    """
+    if not needed:
+        yield None
+        return
+    with master_engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+        with conn.begin():
+            yield conn.execute(text("SELECT pg_export_snapshot()")).scalar()
+
+
+def _dump_part(
+    job: Job,
+    progress: "TableProgress",
+    backup_path: str,
+    format: str,
+    jobs: int,
+    compression: int,
+    schemas: Optional[List[str]],
+    storage_prefix: Optional[str] = None,
+    snapshot: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Run one pg_dump, optionally restricted to a set of schemas"""
+    format_flag, part_name = BACKUP_FORMATS[format]
+    if schemas:
+        part_name = "-".join(schemas) + os.path.splitext(part_name)[1]
+    if format == "plain" and compression:
+        part_name += ".gz"
+    part_path = os.path.join(backup_path, part_name)
+
+    args, env = pg_connection()
+    cmd = [
+        "pg_dump",
+        *args,
+        "-d", _database_name(),
+        "-F", format_flag,
+        "--verbose"
+    ]
+    for schema in schemas or []:
+        cmd += ["-n", schema]
+    if snapshot:
+        cmd += ["--snapshot", snapshot]
+    if jobs > 1:
+        cmd += ["-j", str(jobs)]
+
+    if format == "chunked":
+        # Uncompressed SQL on stdout; chunks are compressed individually
+        stats: Dict[str, int] = {}
+        run_with_stdout(
+            cmd,
+            lambda stdout: stats.update(backup_store.write_stream(stdout, part_path)),
+            progress,
+            env=env,
+            cwd=settings.BACKUP_PATH,
+        )
+        return {"path": part_name, "schemas": schemas, "size_bytes": stats["stored_bytes"], **stats}
+
+    if storage_prefix is not None:
+        # stdout goes straight into a multipart upload, nothing touches BACKUP_PATH
+        cmd += ["-Z", str(compression)]
+        stats = {}
+        run_with_stdout(
+            cmd,
+            lambda stdout: stats.update(object_storage.upload_stream(stdout, storage_prefix + part_name)),
+            progress,
+            env=env,
+            cwd=settings.BACKUP_PATH,
+        )
+        return {"path": part_name, "schemas": schemas, "size_bytes": stats["size_bytes"], "sha256": stats["sha256"]}
+
+    cmd += ["-Z", str(compression), "-f", part_path]
+    run_streaming(cmd, progress, env=env, cwd=settings.BACKUP_PATH)
+    return {"path": part_name, "schemas": schemas, "size_bytes": _path_size(part_path)}
+
+
+def create_backup(
+    job: Job,
+    service: Optional[str] = None,
+    description: str = "Manual backup",
+    format: str = None,
+    jobs: int = None,
+    compression: int = None,
+) -> Dict[str, Any]:
+    """Dump the master database, or only the schemas of the given services, into BACKUP_PATH"""
+    format = format or settings.BACKUP_FORMAT
+    jobs = jobs or settings.BACKUP_JOBS
+    compression = settings.BACKUP_COMPRESSION if compression is None else compression
+    if format not in BACKUP_FORMATS:
+        raise ValueError(f"Unsupported backup format {format}")
+    upload = settings.BACKUP_UPLOAD_ENABLED
+    if upload and format not in STREAMABLE_FORMATS:
+        raise ValueError(f"{format} backups cannot be streamed to {settings.BACKUP_STORAGE}")
+
+    services = parse_names(service)
+    schemas = schemas_for(services) if services else None
+    # One dump per schema, run concurrently; a full backup is a single dump
+    part_schemas = [[schema] for schema in schemas] if schemas else [None]
+    workers = min(len(part_schemas), jobs)
+    # Only the directory format can be dumped by several workers, so the
+    # remaining job budget is shared between the concurrent schema dumps
+    dump_jobs = max(1, jobs // workers) if format == "directory" else 1
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_id = f"backup_{'_'.join(services)}_{timestamp}" if services else f"backup_{timestamp}"
+    backup_path = backup_path_for(backup_id)
+    # Uploaded backups keep only their manifest in BACKUP_PATH
+    storage_prefix = object_storage.object_key(backup_id) + "/" if upload else None
+    os.makedirs(backup_path)
+
+    logger.info(f"Creating {format} backup: {backup_id} (schemas={schemas or 'all'}, workers={workers}, jobs={dump_jobs})")
+    job.update_progress(0, f"Dumping to {backup_id}")
+    source_revision = _source_revision()
+    progress = TableProgress(job, _count_tables(schemas))
+    started = time.monotonic()
+
+    try:
+        with _exported_snapshot(len(part_schemas) > 1) as snapshot, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pg_dump") as executor:
+            futures = [
+                executor.submit(
+                    _dump_part,
+                    job, progress, backup_path, format, dump_jobs, compression, part, storage_prefix, snapshot
+                )
+                for part in part_schemas
+            ]
+            parts = [future.result() for future in futures]
+    except Exception:
+        shutil.rmtree(backup_path, ignore_errors=True)
+        if storage_prefix is not None:
+            object_storage.delete_prefix(storage_prefix)
+        raise
+
+    if storage_prefix is not None:
+        location = object_storage.object_url(storage_prefix)
+        checksum = hashlib.sha256(
+            "".join(f"{part['path']}:{part['sha256']}\n" for part in parts).encode()
+        ).hexdigest()
+    else:
+        location = backup_path
+        checksum = backup_catalog.compute_checksum(backup_path)
+
+    manifest = {
+        "backup_id": backup_id,
+        "service": service,
+        "description": description,
+        "database": _database_name(),
+        "schemas": schemas,
+        "format": format,
+        "jobs": dump_jobs * workers,
+        "compression": compression,
+        "parts": parts,
+        "size_bytes": sum(part["size_bytes"] for part in parts),
+        "checksum": checksum,
+        "source_revision": source_revision,
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "created_at": datetime.now().isoformat(),
+    }
+    if storage_prefix is not None:
+        manifest["storage"] = location
+        object_storage.upload_bytes(
+            storage_prefix + MANIFEST_NAME, json.dumps(manifest, indent=2).encode(), "application/json"
+        )
+    _write_manifest(backup_path, manifest)
+    backup_catalog.record(manifest, location)
+    BACKUP_BYTES.labels(direction="written", format=format).inc(manifest["size_bytes"])
+    BACKUP_SIZE.labels(format=format).observe(manifest["size_bytes"])
+    return {**manifest, "path": location}
+
+
+def _restore_part(
+    job: Job,
+    manifest: Dict[str, Any],
+    part: Dict[str, Any],
+    part_path: str,
+    jobs: int,
+    schemas: Optional[List[str]],
+    database: str = None,
+) -> None:
+    args, env = pg_connection()
+    database = database or _database_name()
+
+    storage = manifest.get("storage")
+
+    if manifest["format"] not in SQL_FORMATS:
+        cmd = [
+            "pg_restore",
+            *args,
+            "-d", database,
+            "--clean",
+            "--if-exists",
+            "--verbose"
+        ]
+        for schema in schemas or []:
+            cmd += ["-n", schema]
+        progress = TableProgress(job, _count_tables(schemas))
+        if storage:
+            # pg_restore reads a streamed archive from stdin, which it can
+            # only restore with a single worker
+            with object_storage.ObjectReader(_storage_key(manifest, part)) as source:
+                run_streaming(cmd, progress, env=env, cwd=settings.BACKUP_PATH, stdin=source)
+            return
+        cmd += ["-j", str(jobs), part_path]
+        run_streaming(cmd, progress, env=env, cwd=settings.BACKUP_PATH)
+        return
+
+    if manifest["format"] == "chunked":
+        total_bytes = part["logical_bytes"]
+    elif storage:
+        total_bytes = part["size_bytes"]
+    else:
+        total_bytes = os.path.getsize(part_path)
+    fed = {"bytes": 0}
+
+    def on_bytes(count: int) -> None:
+        fed["bytes"] += count
+        if total_bytes:
+            job.update_progress(min(fed["bytes"] / total_bytes * 100, 99.0), f"{fed['bytes']} bytes replayed")
+
+    cmd = ["psql", *args, "-d", database, "-f", "-"]
+    with ExitStack() as stack:
+        if manifest["format"] == "chunked":
+            source = stack.enter_context(backup_store.ChunkReader(backup_store.read_chunk_list(part_path)))
+        elif storage:
+            source = stack.enter_context(object_storage.ObjectReader(_storage_key(manifest, part)))
+            if manifest.get("compression"):
+                source = stack.enter_context(gzip.GzipFile(fileobj=source, mode="rb"))
+        elif manifest.get("compression"):
+            source = stack.enter_context(gzip.open(part_path, "rb"))
+        else:
+            source = stack.enter_context(open(part_path, "rb"))
+        run_streaming(cmd, job.log, env=env, cwd=settings.BACKUP_PATH, stdin=source, on_stdin_bytes=on_bytes)
+
+
+def plan_restore(manifest: Dict[str, Any], schemas: Optional[List[str]] = None) -> List[Tuple[Dict[str, Any], Optional[List[str]]]]:
+    """Parts to replay and the schemas to restore from each of them"""
+    if not schemas:
+        return [(part, None) for part in manifest["parts"]]
+
+    plan = []
+    for part in manifest["parts"]:
+        part_schemas = part.get("schemas")
+        if part_schemas is None:
+            if manifest["format"] in SQL_FORMATS:
+                raise ValueError("Per-schema restore needs a custom or directory backup, or a per-service backup")
+            plan.append((part, schemas))
+            continue
+        selected = [schema for schema in part_schemas if schema in schemas]
+        if selected:
+            plan.append((part, None if selected == part_schemas else selected))
+
+    restored = {schema for part, selected in plan for schema in (selected or part.get("schemas") or schemas)}
+    missing = [schema for schema in schemas if schema not in restored]
+    if missing:
+        raise ValueError(f"Backup {manifest['backup_id']} does not contain schemas {', '.join(missing)}")
+    return plan
+
+
+def check_shadow(manifest: Dict[str, Any], schemas: Optional[List[str]] = None) -> None:
+    """Refuse shadow restores that would not replace the whole database"""
+    if schemas:
+        raise ValueError("Shadow restores replace the whole database and cannot select schemas")
+    # A per-service backup only holds some schemas; swapping it in would
+    # drop every other schema of the live database
+    if manifest.get("schemas"):
+        raise ValueError(
+            f"Backup {manifest['backup_id']} only contains schemas {', '.join(manifest['schemas'])}; "
+            "shadow restores need a full database backup"
+        )
+
+
+def _validate_shadow(manifest: Dict[str, Any], shadow: str) -> Dict[str, Any]:
+    """Check a restored shadow database before it replaces the live one"""
+    engine = create_engine(database_admin.database_url(shadow), poolclass=NullPool)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                "SELECT n.nspname, count(c.oid) FROM pg_catalog.pg_namespace n "
+                "LEFT JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relkind IN ('r', 'p') "
+                "WHERE n.nspname = ANY(:schemas) GROUP BY n.nspname"
+            ), {"schemas": SCHEMAS}).all()
+            tables = {schema: count for schema, count in rows}
+
+            missing = [schema for schema in SCHEMAS if schema not in tables]
+            if missing:
+                raise ValueError(f"Shadow database {shadow} is missing schemas {', '.join(missing)}")
+            if not sum(tables.values()):
+                raise ValueError(f"Shadow database {shadow} contains no tables")
+
+            # Fresh statistics, so the first queries after the swap get sane plans
+            conn.execute(text("ANALYZE"))
+            conn.commit()
+    finally:
+        engine.dispose()
+
+    live_tables = _count_tables(SCHEMAS)
+    if live_tables and live_tables != sum(tables.values()):
+        logger.warning(f"Shadow database {shadow} has {sum(tables.values())} tables, live database has {live_tables}")
+    return {"tables": tables, "live_tables": live_tables}
+
+
+def _restore_shadow(
+    job: Job,
+    manifest: Dict[str, Any],
+    plan: List[Tuple[Dict[str, Any], Optional[List[str]]]],
+    backup_path: str,
+    jobs: int,
+) -> Dict[str, Any]:
+    """Restore into a new database and swap it with the live one by renaming"""
+    live = _database_name()
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    shadow = f"{live}_shadow_{timestamp}"
+    previous = f"{live}_pre_restore_{timestamp}"
+
+    database_admin.create_database(shadow, owner=database_admin.database_owner(live))
+    try:
+        # The live database keeps serving traffic while the shadow is loaded
+        for part, part_schemas in plan:
+            part_path = os.path.join(backup_path, part["path"]) if part["path"] else backup_path
+            _restore_part(job, manifest, part, part_path, jobs, part_schemas, database=shadow)
+
+        job.update_progress(99, f"Validating {shadow}")
+        validation = _validate_shadow(manifest, shadow)
+    except Exception:
+        database_admin.drop_database(shadow)
+        raise
+
+    job.update_progress(99, f"Swapping {shadow} into {live}")
+    # Our own pooled connections to the live database would block the rename.
+    # The async pool belongs to the event loop, so this thread only drops it
+    # (close=False) and the rename evicts its connections server side.
+    master_engine.dispose()
+    async_master_engine.sync_engine.dispose(close=False)
+    downtime = database_admin.swap_databases(live, shadow, previous)
+
+    if not settings.BACKUP_SHADOW_KEEP_PREVIOUS:
+        database_admin.drop_database(previous)
+        previous = None
+
+    return {
+        "shadow_database": shadow,
+        "previous_database": previous,
+        "validation": validation,
+        "swap_seconds": round(downtime, 3),
+    }
+
+
+def restore_backup(
+    job: Job,
+    backup_id: str,
+    jobs: int = None,
+    schemas: Optional[List[str]] = None,
+    shadow: bool = False,
+) -> Dict[str, Any]:
+    """Replay a backup, or only some of its schemas, into the master database.
+
+    With ``shadow`` the whole backup is loaded into a new database which is
+    validated and then renamed over the live one.
+    """
+    manifest = read_manifest(backup_id)
+    backup_path = backup_path_for(backup_id)
+    jobs = jobs or settings.BACKUP_JOBS
+    if shadow:
+        check_shadow(manifest, schemas)
+    plan = plan_restore(manifest, schemas)
+
+    logger.info(f"Restoring {manifest['format']} backup: {backup_id} (jobs={jobs}, schemas={schemas or 'all'}, shadow={shadow})")
+    job.update_progress(0, f"Restoring {backup_id}")
+    started = time.monotonic()
+
+    swap = None
+    if shadow:
+        swap = _restore_shadow(job, manifest, plan, backup_path, jobs)
+    else:
+        # Parts are replayed one after another in schema dependency order, since
+        # foreign keys from later schemas need the rows of earlier ones
+        for part, part_schemas in plan:
+            part_path = os.path.join(backup_path, part["path"]) if part["path"] else backup_path
+            _restore_part(job, manifest, part, part_path, jobs, part_schemas)
+
+    BACKUP_BYTES.labels(direction="read", format=manifest["format"]).inc(
+        sum(part.get("size_bytes", 0) for part, _ in plan)
+    )
+
+    result = {
+        "backup_id": backup_id,
+        "format": manifest["format"],
+        "schemas": schemas,
+        "jobs": jobs if manifest["format"] not in SQL_FORMATS and not manifest.get("storage") else 1,
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
+    if swap:
+        result.update(swap)
+    return result
+
+
+def apply_retention(job: Job, retention_days: int = None) -> Dict[str, Any]:
+    """Delete backups older than the retention period and unreferenced chunks.
+
+    The newest ``BACKUP_RETENTION_MIN_KEEP`` backups are kept whatever their
+    age, so a stalled backup schedule never expires the last ones.
+    """
+    retention_days = settings.BACKUP_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = datetime.now() - timedelta(days=retention_days)
+    expired = []
+    referenced = set()
+
+    job.update_progress(0, f"Expiring backups created before {cutoff.isoformat()}")
+    manifests = sorted(list_backups(), key=lambda manifest: manifest["created_at"], reverse=True)
+    for index, manifest in enumerate(manifests):
+        if index >= settings.BACKUP_RETENTION_MIN_KEEP and datetime.fromisoformat(manifest["created_at"]) < cutoff:
+            delete_backup(manifest["backup_id"])
+            expired.append(manifest["backup_id"])
+            continue
+        if manifest["format"] == "chunked":
+            backup_path = backup_path_for(manifest["backup_id"])
+            for part in manifest["parts"]:
+                referenced.update(backup_store.read_chunk_list(os.path.join(backup_path, part["path"])))
+
+    job.update_progress(50, f"Expired {len(expired)} backups, collecting unreferenced chunks")
+    store = backup_store.collect_garbage(referenced, settings.BACKUP_GC_GRACE_SECONDS)
+    return {"retention_days": retention_days, "expired_backups": expired, "store": store}
+
+
+def reconcile_catalog(job: Job) -> Dict[str, Any]:
+    """Bring the backup catalog in line with the backups present on disk"""
+    manifests = {manifest["backup_id"]: manifest for manifest in list_backups()}
+    cataloged = backup_catalog.backup_ids()
+
+    removed = sorted(cataloged - set(manifests))
+    for backup_id in removed:
+        backup_catalog.remove(backup_id)
+
+    added = sorted(set(manifests) - cataloged)
+    for index, backup_id in enumerate(added):
+        manifest = manifests[backup_id]
+        location = manifest.get("storage") or backup_path_for(backup_id)
+        backup_catalog.record(manifest, location, manifest.get("checksum") or backup_catalog.compute_checksum(location))
+        job.update_progress((index + 1) / len(added) * 100, f"Cataloged {backup_id}")
+
+    logger.info(f"Backup catalog reconciled: {len(added)} added, {len(removed)} removed")
+    return {
+        "backups_on_disk": len(manifests),
+        "added": added,
+        "removed": removed,
+    }
@@ -0,0 +1,172 @@
+import time
+from typing import List, Optional
+
+import structlog
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+
+logger = structlog.get_logger()
+
+# Database that CREATE/DROP/ALTER DATABASE statements are issued from
+MAINTENANCE_DATABASE = "postgres"
+# Terminated backends need a moment to exit before a rename succeeds
+RENAME_ATTEMPTS = 10
+RENAME_RETRY_DELAY = 0.5
+
+
+def database_url(database: str, url: str = None) -> str:
+    """MASTER_DATABASE_URL pointing at another database of the same server"""
+    return make_url(url or settings.MASTER_DATABASE_URL).set(database=database).render_as_string(hide_password=False)
+
+
+def maintenance_engine(url: str = None) -> Engine:
+    return create_engine(
+        database_url(MAINTENANCE_DATABASE, url),
+        isolation_level="AUTOCOMMIT",
+        poolclass=NullPool,
+    )
+
+
+def _quote(conn: Connection, name: str) -> str:
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def terminate_connections(conn: Connection, database: str) -> int:
+    """Terminate every other backend connected to ``database``"""
+    return conn.execute(
+        text(
+            "SELECT count(pg_terminate_backend(pid)) FROM pg_stat_activity "
+            "WHERE datname = :database AND pid <> pg_backend_pid()"
+        ),
+        {"database": database}
+    ).scalar() or 0
+
+
+def database_owner(database: str) -> Optional[str]:
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                text("SELECT pg_get_userbyid(datdba) FROM pg_database WHERE datname = :database"),
+                {"database": database}
+            ).scalar()
+    finally:
+        engine.dispose()
+
+
+def database_exists(database: str) -> bool:
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            return bool(conn.execute(
+                text("SELECT 1 FROM pg_database WHERE datname = :database"),
+                {"database": database}
+            ).scalar())
+    finally:
+        engine.dispose()
+
+
+def list_databases(prefix: str) -> List[str]:
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            return list(conn.execute(
+                text("SELECT datname FROM pg_database WHERE starts_with(datname, :prefix) ORDER BY datname"),
+                {"prefix": prefix}
+            ).scalars())
+    finally:
+        engine.dispose()
+
+
+def create_database(database: str, owner: Optional[str] = None, template: str = "template0") -> None:
+    """CREATE DATABASE; any template other than template0 is copied file by file"""
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            if template != "template0":
+                # CREATE DATABASE fails while anyone else is connected to the template
+                terminate_connections(conn, template)
+            statement = f"CREATE DATABASE {_quote(conn, database)} TEMPLATE {_quote(conn, template)}"
+            if owner:
+                statement += f" OWNER {_quote(conn, owner)}"
+            conn.execute(text(statement))
+        logger.info(f"Created database {database} from {template}")
+    finally:
+        engine.dispose()
+
+
+def set_template(database: str, is_template: bool) -> None:
+    """Flag a database as a template, so only owners and superusers may clone it"""
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(
+                f"ALTER DATABASE {_quote(conn, database)} WITH IS_TEMPLATE {'true' if is_template else 'false'}"
+            ))
+    finally:
+        engine.dispose()
+
+
+def drop_database(database: str) -> None:
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            # Template databases cannot be dropped
+            conn.execute(text(f"ALTER DATABASE {_quote(conn, database)} WITH IS_TEMPLATE false ALLOW_CONNECTIONS false"))
+            terminate_connections(conn, database)
+            conn.execute(text(f"DROP DATABASE IF EXISTS {_quote(conn, database)}"))
+        logger.info(f"Dropped database {database}")
+    finally:
+        engine.dispose()
+
+
+def _rename(conn: Connection, source: str, target: str) -> None:
+    """Rename a database, evicting its connections until the rename succeeds"""
+    for attempt in range(RENAME_ATTEMPTS):
+        terminate_connections(conn, source)
+        try:
+            conn.execute(text(f"ALTER DATABASE {_quote(conn, source)} RENAME TO {_quote(conn, target)}"))
+            return
+        except OperationalError:
+            # "database is being accessed by other users"
+            if attempt == RENAME_ATTEMPTS - 1:
+                raise
+            time.sleep(RENAME_RETRY_DELAY)
+
+
+def swap_databases(live: str, shadow: str, previous: str) -> float:
+    """Move ``live`` aside as ``previous`` and rename ``shadow`` into its place.
+
+    Clients are locked out of ``live`` only between the two renames; they
+    reconnect to the same name and land on the restored database. Returns
+    how long ``live`` was unavailable, in seconds.
+    """
+    engine = maintenance_engine()
+    try:
+        with engine.connect() as conn:
+            started = time.monotonic()
+            conn.execute(text(f"ALTER DATABASE {_quote(conn, live)} WITH ALLOW_CONNECTIONS false"))
+            try:
+                _rename(conn, live, previous)
+            except Exception:
+                conn.execute(text(f"ALTER DATABASE {_quote(conn, live)} WITH ALLOW_CONNECTIONS true"))
+                raise
+
+            try:
+                _rename(conn, shadow, live)
+            except Exception:
+                # Put the original database back before giving up
+                _rename(conn, previous, live)
+                conn.execute(text(f"ALTER DATABASE {_quote(conn, live)} WITH ALLOW_CONNECTIONS true"))
+                raise
+            downtime = time.monotonic() - started
+
+            conn.execute(text(f"ALTER DATABASE {_quote(conn, previous)} WITH ALLOW_CONNECTIONS true"))
+        logger.info(f"Swapped {shadow} into {live} in {downtime:.2f}s; previous database kept as {previous}")
+        return downtime
+    finally:
+        engine.dispose()
@@ -0,0 +1,149 @@
+"""Purge of expired auth rows (sessions and password resets).
+
+Expired rows are deleted in batches of ``PURGE_BATCH_SIZE``, oldest
+``expires_at`` first, each batch in its own short transaction. Rows locked
+by a request are skipped rather than waited for, and every statement runs
+under ``lock_timeout``, so a batch never holds or queues for locks long.
+Between batches the purge pauses ``PURGE_SLEEP_SECONDS`` and, while a
+standby replays more than ``PURGE_MAX_REPLICATION_LAG_SECONDS`` behind,
+waits for it to catch up. A run stops after ``PURGE_MAX_SECONDS``; the
+next one picks up the rest.
+"""
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+import structlog
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.core.metrics import PURGED_ROWS
+from src.services.jobs import Job
+from src.services.migration_targets import MASTER_TARGET, select_targets
+
+logger = structlog.get_logger()
+
+
+@dataclass(frozen=True)
+class PurgePolicy:
+    # Indexed by revision 0009, the batches walk it in order
+    column: str
+    key: Sequence[str]
+
+
+PURGED_TABLES = {
+    "auth.sessions": PurgePolicy("expires_at", ("id", "created_at")),
+    "auth.password_resets": PurgePolicy("expires_at", ("id",)),
+}
+
+
+def _replication_lag(connection: Connection) -> float:
+    """Replay lag of the slowest standby, in seconds"""
+    try:
+        return float(connection.execute(
+            text("SELECT coalesce(max(extract(epoch FROM replay_lag)), 0) FROM pg_catalog.pg_stat_replication")
+        ).scalar())
+    finally:
+        # No snapshot is held while sleeping between checks
+        connection.rollback()
+
+
+def _set_batch_timeouts(connection: Connection) -> None:
+    """Limits of the current batch; SET LOCAL ends them with its transaction"""
+    connection.exec_driver_sql(f"SET LOCAL lock_timeout = {int(settings.PURGE_LOCK_TIMEOUT_MS)}")
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(settings.PURGE_STATEMENT_TIMEOUT_MS)}")
+
+
+def _throttle(connection: Connection, deadline: float) -> float:
+    """Pause between batches; the seconds spent waiting on replication"""
+    if settings.PURGE_SLEEP_SECONDS:
+        time.sleep(settings.PURGE_SLEEP_SECONDS)
+    waited = 0.0
+    while time.monotonic() < deadline and _replication_lag(connection) > settings.PURGE_MAX_REPLICATION_LAG_SECONDS:
+        time.sleep(settings.PURGE_REPLICATION_POLL_SECONDS)
+        waited += settings.PURGE_REPLICATION_POLL_SECONDS
+    return waited
+
+
+def _purge_table(connection: Connection, qualified: str, policy: PurgePolicy, deadline: float) -> Dict[str, Any]:
+    schema, table = qualified.split(".")
+    name = f'"{schema}"."{table}"'
+    key = ", ".join(f'"{column}"' for column in policy.key)
+    statement = text(
+        f"DELETE FROM {name} WHERE ({key}) IN ("
+        f'  SELECT {key} FROM {name} WHERE "{policy.column}" < now() - make_interval(secs => :grace)'
+        f'  ORDER BY "{policy.column}" LIMIT :batch_size FOR UPDATE SKIP LOCKED'
+        ")"
+    )
+    result: Dict[str, Any] = {"table": qualified, "purged": 0, "batches": 0, "replication_wait_seconds": 0.0}
+    started = time.monotonic()
+    while True:
+        _set_batch_timeouts(connection)
+        deleted = max(connection.execute(
+            statement, {"grace": settings.PURGE_GRACE_SECONDS, "batch_size": settings.PURGE_BATCH_SIZE}
+        ).rowcount, 0)
+        connection.commit()
+        result["batches"] += 1
+        result["purged"] += deleted
+        PURGED_ROWS.labels(table=qualified).inc(deleted)
+        if deleted < settings.PURGE_BATCH_SIZE:
+            break
+        if time.monotonic() >= deadline:
+            result["incomplete"] = True
+            break
+        result["replication_wait_seconds"] += _throttle(connection, deadline)
+    result["duration_seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def purge_expired(connectable: Engine, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Delete the expired rows of every purged table present in one database"""
+    deadline = deadline or time.monotonic() + settings.PURGE_MAX_SECONDS
+    results = []
+    # Every batch commits on its own, with its timeouts set in its transaction
+    with connectable.connect() as connection:
+        for qualified, policy in PURGED_TABLES.items():
+            if connection.execute(text("SELECT to_regclass(:name)"), {"name": qualified}).scalar() is None:
+                continue
+            try:
+                results.append(_purge_table(connection, qualified, policy, deadline))
+            except DBAPIError as e:
+                connection.rollback()
+                # Typically lock_timeout behind DDL; the next run retries
+                logger.warning(f"Purge of {qualified} stopped: {str(e.orig).strip()}")
+                results.append({"table": qualified, "error": str(e.orig).strip()})
+    return results
+
+
+def purge_expired_job(job: Job, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Job entry point for ``/api/maintenance/purge`` and the periodic purge"""
+    targets = select_targets(names)
+    deadline = time.monotonic() + settings.PURGE_MAX_SECONDS
+    results: Dict[str, Any] = {}
+    purged = 0
+    for index, (name, url) in enumerate(targets.items()):
+        connectable = master_engine if name == MASTER_TARGET else create_engine(url, poolclass=NullPool)
+        try:
+            results[name] = purge_expired(connectable, deadline)
+        except Exception as e:
+            logger.error(f"Purge on {name} failed: {str(e)}")
+            results[name] = {"error": str(e)}
+            job.log(f"{name}: failed: {str(e)}", stream="purge")
+        else:
+            for table in results[name]:
+                purged += table.get("purged", 0)
+                job.log(
+                    f"{name}: {table['table']} "
+                    + (f"failed: {table['error']}" if "error" in table else f"purged {table['purged']} rows"),
+                    stream="purge"
+                )
+        finally:
+            if connectable is not master_engine:
+                connectable.dispose()
+        job.update_progress((index + 1) / len(targets) * 100, f"{index + 1} of {len(targets)} databases done")
+    logger.info(f"Purged {purged} expired rows")
+    return {"purged": purged, "targets": results}
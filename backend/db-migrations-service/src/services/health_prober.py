@@ -0,0 +1,124 @@
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, Optional
+
+import structlog
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.core.config import settings
+from src.core.database import async_engine, async_master_engine
+
+logger = structlog.get_logger()
+
+
+def _percentile(values, percent: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class ProbeTarget:
+    name: str
+    engine: AsyncEngine
+    healthy: Optional[bool] = None
+    error: Optional[str] = None
+    latency_ms: Optional[float] = None
+    checked_at: Optional[datetime] = None
+    checked_monotonic: Optional[float] = None
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=settings.HEALTH_LATENCY_WINDOW))
+    in_flight: Optional[asyncio.Task] = None
+
+    def staleness(self) -> Optional[float]:
+        if self.checked_monotonic is None:
+            return None
+        return time.monotonic() - self.checked_monotonic
+
+    def is_fresh(self) -> bool:
+        staleness = self.staleness()
+        return staleness is not None and staleness <= settings.HEALTH_MAX_STALENESS_SECONDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        staleness = self.staleness()
+        latencies = list(self.latencies)
+        return {
+            "status": "unknown" if self.healthy is None else "healthy" if self.healthy else "unhealthy",
+            "latency_ms": self.latency_ms,
+            "p50_ms": _percentile(latencies, 50),
+            "p99_ms": _percentile(latencies, 99),
+            "samples": len(latencies),
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+            "staleness_seconds": round(staleness, 3) if staleness is not None else None,
+            "error": self.error,
+        }
+
+
+class HealthProber:
+    """Probes each database in the background and serves cached results.
+
+    Requests never hit the database directly: they read the last result, and
+    when it is stale they join the probe that is already running, if any.
+    """
+
+    def __init__(self, targets: Dict[str, AsyncEngine]):
+        self.targets = {name: ProbeTarget(name, engine) for name, engine in targets.items()}
+
+    async def _select_one(self, target: ProbeTarget) -> None:
+        async with target.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def _check(self, target: ProbeTarget) -> None:
+        started = time.perf_counter()
+        try:
+            # The timeout covers the connect too: a full pool or an
+            # unreachable server hangs there, not in the query
+            await asyncio.wait_for(self._select_one(target), timeout=settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+            target.healthy = True
+            target.error = None
+        except Exception as e:
+            if target.healthy is not False:
+                logger.error(f"Health probe for {target.name} failed: {str(e)}")
+            target.healthy = False
+            target.error = str(e) or type(e).__name__
+        finally:
+            target.latency_ms = round((time.perf_counter() - started) * 1000, 3)
+            # Failed probes (mostly timeouts) would skew the percentiles
+            if target.healthy:
+                target.latencies.append(target.latency_ms)
+            target.checked_at = datetime.now()
+            target.checked_monotonic = time.monotonic()
+
+    async def probe(self, name: str) -> ProbeTarget:
+        """Run a probe, or wait for the one already in flight"""
+        target = self.targets[name]
+        if target.in_flight is None or target.in_flight.done():
+            target.in_flight = asyncio.create_task(self._check(target))
+        # Shielded so a cancelled request does not cancel the shared probe
+        await asyncio.shield(target.in_flight)
+        return target
+
+    async def get(self, name: str) -> ProbeTarget:
+        """Cached result, refreshed first if it is missing or stale"""
+        target = self.targets[name]
+        if target.is_fresh():
+            return target
+        return await self.probe(name)
+
+    async def run(self) -> None:
+        """Probe every target on HEALTH_PROBE_INTERVAL_SECONDS until cancelled"""
+        while True:
+            await asyncio.gather(*(self.probe(name) for name in self.targets), return_exceptions=True)
+            await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL_SECONDS)
+
+
+health_prober = HealthProber({
+    "migrations_db": async_engine,
+    "master_db": async_master_engine,
+})
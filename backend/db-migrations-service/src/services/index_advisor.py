@@ -0,0 +1,428 @@
+"""Index advice from the statistics of the master database.
+
+Missing indexes come from two sources:
+
+- ``pg_stat_statements``: columns compared in WHERE/ON clauses of the
+  recorded statements that no index leads with. The benefit of an index is
+  the execution time of those statements, weighted by how often the table
+  is read sequentially (``pg_stat_user_tables``) and by the selectivity of
+  the column (``pg_stats``), minus the cost of maintaining it on writes.
+- Single column foreign keys with no index, which make deletes and updates
+  of the referenced row scan the whole table.
+
+Unused indexes are the non-unique ones ``pg_stat_user_indexes`` never saw
+scanned since the statistics were reset.
+
+Partitions are folded into their partitioned table (``pg_partition_tree``):
+statistics are summed onto the parent, indexes are judged on the parent, and
+no advice names a partition, since indexes of a partitioned table are
+created on the parent.
+
+The winners are written as an Alembic revision per schema, on the branch of
+the schema, building the indexes with ``create_index_concurrently``.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import structlog
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.core.schemas import SCHEMAS
+from src.services.migration_branches import branch_labels
+from src.services.migration_engine import migration_engine
+
+logger = structlog.get_logger()
+
+# PostgreSQL identifiers are limited to 63 bytes
+MAX_IDENTIFIER = 63
+
+# Planner default selectivity of a range comparison
+RANGE_SELECTIVITY = 1 / 3
+
+IDENTIFIER = r'"?([A-Za-z_][A-Za-z0-9_]*)"?'
+TABLE_REFERENCE = re.compile(
+    rf"\b(?:FROM|JOIN|UPDATE|INTO)\s+(?:ONLY\s+)?{IDENTIFIER}(?:\.{IDENTIFIER})?(?:\s+(?:AS\s+)?{IDENTIFIER})?",
+    re.IGNORECASE
+)
+PREDICATE = re.compile(
+    rf"(?:{IDENTIFIER}\.)?{IDENTIFIER}\s*(=\s*ANY\b|=|<=|>=|<|>|\bIN\b|\bBETWEEN\b)",
+    re.IGNORECASE
+)
+# Assignments are not predicates
+SET_CLAUSE = re.compile(r"\bSET\b.*?(?=\bWHERE\b|\bFROM\b|\bRETURNING\b|$)", re.IGNORECASE | re.DOTALL)
+# Words that may follow a table name and are not an alias
+NOT_ALIASES = {
+    "where", "join", "inner", "left", "right", "full", "cross", "on", "using", "set", "group", "order",
+    "limit", "offset", "for", "returning", "values", "select", "union", "natural", "lateral", "as",
+}
+
+
+@dataclass
+class Candidate:
+    schema: str
+    table: str
+    column: str
+    reasons: Set[str] = field(default_factory=set)
+    queries: Dict[str, float] = field(default_factory=dict)
+    calls: int = 0
+    benefit_ms: float = 0.0
+    foreign_key: Optional[str] = None
+
+
+def _index_name(table: str, column: str) -> str:
+    return f"idx_{table}_{column}"[:MAX_IDENTIFIER]
+
+
+def _referenced_tables(query: str, columns: Dict[Tuple[str, str], Set[str]]) -> Dict[str, Tuple[str, str]]:
+    """Tables of the service schemas a statement reads, keyed by alias and name"""
+    by_name = defaultdict(list)
+    for schema, table in columns:
+        by_name[table].append((schema, table))
+    tables = {}
+    for first, second, alias in TABLE_REFERENCE.findall(query):
+        if second:
+            key = (first, second)
+            if key not in columns:
+                continue
+        elif len(by_name.get(first, [])) == 1:
+            # Unqualified names are only trusted when no other schema has them
+            key = by_name[first][0]
+        else:
+            continue
+        tables[key[1]] = key
+        if alias and alias.lower() not in NOT_ALIASES:
+            tables[alias] = key
+    return tables
+
+
+def _predicates(query: str, columns: Dict[Tuple[str, str], Set[str]]) -> List[Tuple[Tuple[str, str], str, bool]]:
+    """(table, column, equality) of the comparisons in a statement"""
+    tables = _referenced_tables(query, columns)
+    if not tables:
+        return []
+    found = []
+    for qualifier, column, operator in PREDICATE.findall(SET_CLAUSE.sub(" ", query)):
+        if qualifier:
+            owners = [tables[qualifier]] if qualifier in tables else []
+        else:
+            owners = list({key for key in tables.values() if column in columns[key]})
+        if len(owners) != 1 or column not in columns[owners[0]]:
+            continue
+        equality = operator.strip().upper() not in ("<", ">", "<=", ">=", "BETWEEN")
+        found.append((owners[0], column, equality))
+    return found
+
+
+def _fetch(connection, sql: str, **params) -> List[Any]:
+    return connection.execute(text(sql), params).all()
+
+
+def _statements(connection) -> Optional[List[Any]]:
+    """Most expensive statements of this database, None without pg_stat_statements"""
+    installed = connection.execute(
+        text("SELECT 1 FROM pg_catalog.pg_extension WHERE extname = 'pg_stat_statements'")
+    ).scalar()
+    if not installed:
+        return None
+    # total_time was split into plan and execution time in PostgreSQL 13
+    total = "total_exec_time" if connection.dialect.server_version_info >= (13,) else "total_time"
+    try:
+        return _fetch(
+            connection,
+            f"SELECT queryid::text, query, calls, {total} FROM pg_stat_statements "
+            "WHERE dbid = (SELECT oid FROM pg_catalog.pg_database WHERE datname = current_database()) "
+            f"AND calls >= :min_calls ORDER BY {total} DESC LIMIT :limit",
+            min_calls=settings.INDEX_ADVISOR_MIN_CALLS,
+            limit=settings.INDEX_ADVISOR_STATEMENT_LIMIT,
+        )
+    except Exception as e:
+        # Installed but not in shared_preload_libraries
+        logger.warning(f"Could not read pg_stat_statements: {str(e)}")
+        connection.rollback()
+        return None
+
+
+def _selectivity(stats: Optional[Tuple[float, int]], rows: int) -> Optional[float]:
+    """Fraction of the rows an equality on the column matches, from pg_stats"""
+    if stats is None or stats[0] is None or stats[0] == 0:
+        return None
+    n_distinct = stats[0]
+    # Negative values are a fraction of the row count
+    distinct = -n_distinct * rows if n_distinct < 0 else n_distinct
+    return 1 / max(distinct, 1)
+
+
+def _partition_parents(connection, schemas: List[str]) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    """Every partition (at any level) mapped to its top-level partitioned table"""
+    return {
+        (schema, table): (root_schema, root)
+        for root_schema, root, schema, table in _fetch(
+            connection,
+            "SELECT rn.nspname, r.relname, n.nspname, c.relname FROM pg_catalog.pg_class r "
+            "JOIN pg_catalog.pg_namespace rn ON rn.oid = r.relnamespace "
+            "CROSS JOIN LATERAL pg_partition_tree(r.oid) t "
+            "JOIN pg_catalog.pg_class c ON c.oid = t.relid "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE r.relkind = 'p' AND NOT r.relispartition AND t.level > 0 AND rn.nspname = ANY(:schemas)",
+            schemas=schemas,
+        )
+    }
+
+
+def advise() -> Dict[str, Any]:
+    """Missing indexes ranked by estimated benefit, and unused indexes"""
+    with master_engine.connect() as connection:
+        if connection.dialect.name != "postgresql":
+            raise ValueError("The index advisor needs PostgreSQL statistics")
+        schemas = list(SCHEMAS)
+        parents = _partition_parents(connection, schemas)
+
+        columns: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+        for schema, table, column in _fetch(
+            connection,
+            "SELECT table_schema, table_name, column_name FROM information_schema.columns "
+            "WHERE table_schema = ANY(:schemas)",
+            schemas=schemas,
+        ):
+            if (schema, table) not in parents:
+                columns[(schema, table)].add(column)
+
+        tables: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for schema, table, seq_scan, seq_tup_read, idx_scan, live, inserts, updates, deletes, size in _fetch(
+            connection,
+            "SELECT schemaname, relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup, "
+            "n_tup_ins, n_tup_upd - n_tup_hot_upd, n_tup_del, pg_relation_size(relid) "
+            "FROM pg_catalog.pg_stat_user_tables WHERE schemaname = ANY(:schemas)",
+            schemas=schemas,
+        ):
+            # Rows and scans are counted on the partitions; a scan of the
+            # parent counts once per partition it reads
+            totals = tables.setdefault(parents.get((schema, table), (schema, table)), {
+                "seq_scan": 0, "seq_tup_read": 0, "idx_scan": 0, "rows": 0, "index_writes": 0, "table_bytes": 0,
+            })
+            totals["seq_scan"] += seq_scan or 0
+            totals["seq_tup_read"] += seq_tup_read or 0
+            totals["idx_scan"] += idx_scan
+            totals["rows"] += live or 0
+            # HOT updates leave the indexes alone
+            totals["index_writes"] += (inserts or 0) + (updates or 0) + (deletes or 0)
+            totals["table_bytes"] += size or 0
+
+        # Columns some valid index already leads with
+        covered = set()
+        for schema, table, leading in _fetch(
+            connection,
+            "SELECT n.nspname, t.relname, a.attname FROM pg_catalog.pg_index x "
+            "JOIN pg_catalog.pg_class t ON t.oid = x.indrelid "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = t.relnamespace "
+            "JOIN pg_catalog.pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0] "
+            "WHERE x.indisvalid AND n.nspname = ANY(:schemas)",
+            schemas=schemas,
+        ):
+            covered.add((schema, table, leading))
+
+        column_stats = {
+            (schema, table, column): (n_distinct, avg_width)
+            for schema, table, column, n_distinct, avg_width in _fetch(
+                connection,
+                "SELECT schemaname, tablename, attname, n_distinct, avg_width FROM pg_catalog.pg_stats "
+                "WHERE schemaname = ANY(:schemas)",
+                schemas=schemas,
+            )
+        }
+
+        candidates: Dict[Tuple[str, str, str], Candidate] = {}
+
+        def candidate(schema: str, table: str, column: str) -> Optional[Candidate]:
+            # Partitions inherit the indexes and foreign keys of their parent
+            if (schema, table, column) in covered or (schema, table) in parents:
+                return None
+            key = (schema, table, column)
+            if key not in candidates:
+                candidates[key] = Candidate(schema, table, column)
+            return candidates[key]
+
+        statements = _statements(connection)
+        for queryid, query, calls, total_ms in statements or []:
+            predicates = _predicates(query, columns)
+            per_table = defaultdict(set)
+            for key, column, equality in predicates:
+                per_table[key].add((column, equality))
+            for (schema, table), found in per_table.items():
+                stats = tables.get((schema, table))
+                if stats is None:
+                    continue
+                reads = stats["seq_scan"] + stats["idx_scan"]
+                sequential = stats["seq_scan"] / reads if reads else 1.0
+                for column, equality in found:
+                    entry = candidate(schema, table, column)
+                    if entry is None:
+                        continue
+                    selectivity = _selectivity(column_stats.get((schema, table, column)), stats["rows"])
+                    if not equality:
+                        selectivity = RANGE_SELECTIVITY
+                    # The statement's time is shared among the columns it filters on
+                    share = total_ms / len(found)
+                    entry.benefit_ms += share * sequential * (1 - (selectivity or 0))
+                    entry.queries[queryid] = round(total_ms, 3)
+                    entry.calls += calls
+                    entry.reasons.add("filtered in pg_stat_statements")
+
+        for schema, table, column, constraint, referenced in _fetch(
+            connection,
+            "SELECT n.nspname, t.relname, a.attname, c.conname, c.confrelid::regclass::text "
+            "FROM pg_catalog.pg_constraint c "
+            "JOIN pg_catalog.pg_class t ON t.oid = c.conrelid "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = t.relnamespace "
+            "JOIN pg_catalog.pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1] "
+            "WHERE c.contype = 'f' AND array_length(c.conkey, 1) = 1 AND n.nspname = ANY(:schemas)",
+            schemas=schemas,
+        ):
+            entry = candidate(schema, table, column)
+            if entry is not None:
+                entry.foreign_key = f"{constraint} -> {referenced}"
+                entry.reasons.add("foreign key without index")
+
+        unused = [
+            {
+                "schema": schema,
+                "table": table,
+                "index": index,
+                "size_bytes": size,
+                "definition": definition,
+                "table_writes": tables.get((schema, table), {}).get("index_writes"),
+            }
+            for schema, table, index, size, definition in _fetch(
+                connection,
+                # Indexes of partitioned tables are judged as a whole: the
+                # scans and sizes of the partition indexes under them, summed
+                "SELECT n.nspname, t.relname, i.relname, sum(pg_relation_size(p.relid)) AS size_bytes, "
+                "pg_get_indexdef(i.oid) FROM pg_catalog.pg_index x "
+                "JOIN pg_catalog.pg_class i ON i.oid = x.indexrelid "
+                "JOIN pg_catalog.pg_class t ON t.oid = x.indrelid "
+                "JOIN pg_catalog.pg_namespace n ON n.oid = t.relnamespace "
+                "CROSS JOIN LATERAL pg_partition_tree(i.oid) p "
+                "LEFT JOIN pg_catalog.pg_stat_user_indexes s ON s.indexrelid = p.relid "
+                "WHERE n.nspname = ANY(:schemas) AND NOT i.relispartition AND x.indisvalid "
+                "AND NOT x.indisunique AND NOT x.indisprimary "
+                "AND NOT EXISTS (SELECT 1 FROM pg_catalog.pg_constraint c WHERE c.conindid = i.oid) "
+                "GROUP BY n.nspname, t.relname, i.relname, i.oid "
+                "HAVING coalesce(sum(s.idx_scan), 0) = 0 "
+                "ORDER BY size_bytes DESC",
+                schemas=schemas,
+            )
+        ]
+
+        stats_reset = connection.execute(
+            text("SELECT stats_reset FROM pg_catalog.pg_stat_database WHERE datname = current_database()")
+        ).scalar()
+
+    missing = []
+    for entry in candidates.values():
+        stats = tables.get((entry.schema, entry.table))
+        if stats is None or stats["rows"] < settings.INDEX_ADVISOR_MIN_TABLE_ROWS:
+            continue
+        n_distinct, avg_width = column_stats.get((entry.schema, entry.table, entry.column), (None, None))
+        write_cost_ms = stats["index_writes"] * settings.INDEX_ADVISOR_WRITE_COST_MS
+        missing.append({
+            "schema": entry.schema,
+            "table": entry.table,
+            "columns": [entry.column],
+            "index_name": _index_name(entry.table, entry.column),
+            "reasons": sorted(entry.reasons),
+            "foreign_key": entry.foreign_key,
+            "queries": sorted(entry.queries, key=entry.queries.get, reverse=True),
+            "calls": entry.calls,
+            "table_rows": stats["rows"],
+            "seq_scan": stats["seq_scan"],
+            "seq_tup_read": stats["seq_tup_read"],
+            "selectivity": _selectivity((n_distinct, avg_width), stats["rows"]),
+            # B-tree entries: the key plus an 8 byte tuple header and 4 byte item pointer, 90% full pages
+            "estimated_size_bytes": int(stats["rows"] * ((avg_width or 16) + 12) / 0.9),
+            "estimated_benefit_ms": round(entry.benefit_ms - write_cost_ms, 3),
+        })
+    # Statement evidence first; unindexed foreign keys are ranked by how much
+    # their table is read sequentially
+    missing.sort(key=lambda item: (item["estimated_benefit_ms"], item["seq_tup_read"]), reverse=True)
+
+    return {
+        "stats_reset": stats_reset.isoformat() if stats_reset else None,
+        "pg_stat_statements": statements is not None,
+        "statements_analyzed": len(statements or []),
+        "missing": missing,
+        "unused": unused,
+    }
+
+
+def _winners(advice: Dict[str, Any], limit: Optional[int], names: Optional[List[str]]) -> List[Dict[str, Any]]:
+    if names:
+        selected = [item for item in advice["missing"] if item["index_name"] in names]
+        unknown = set(names) - {item["index_name"] for item in selected}
+        if unknown:
+            raise ValueError(f"No advice for indexes {', '.join(sorted(unknown))}")
+        return selected
+    limit = settings.INDEX_ADVISOR_MAX_INDEXES if limit is None else limit
+    return [
+        item for item in advice["missing"]
+        if item["estimated_benefit_ms"] > 0 or "foreign key without index" in item["reasons"]
+    ][:limit]
+
+
+def _next_revision_id() -> str:
+    numbers = [int(rev.revision) for rev in migration_engine.ordered_revisions() if rev.revision.isdigit()]
+    return f"{max(numbers, default=0) + 1:04d}"
+
+
+def _evidence(item: Dict[str, Any]) -> str:
+    parts = [f"{item['schema']}.{item['table']}.{item['columns'][0]}: {', '.join(item['reasons'])}"]
+    if item["calls"]:
+        parts.append(f"{item['calls']} calls in {len(item['queries'])} statements")
+    parts.append(f"{item['seq_scan']} sequential scans, est. benefit {item['estimated_benefit_ms']} ms")
+    return "; ".join(parts)
+
+
+def generate_revisions(limit: Optional[int] = None, names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Write a revision per schema creating the advised indexes concurrently"""
+    winners = _winners(advise(), limit, names)
+    by_schema = defaultdict(list)
+    for item in winners:
+        by_schema[item["schema"]].append(item)
+    labels = branch_labels()
+    missing_branches = [schema for schema in by_schema if schema not in labels]
+    if missing_branches:
+        raise ValueError(f"No migration branch for schemas {', '.join(missing_branches)}")
+
+    generated = []
+    created_at = datetime.now(timezone.utc).isoformat()
+    for schema in [label for label in labels if label in by_schema]:
+        items = by_schema[schema]
+        upgrades, downgrades = [], []
+        for item in items:
+            upgrades.append(f"# {_evidence(item)}")
+            upgrades.append(
+                f"create_index_concurrently({item['index_name']!r}, {item['table']!r}, "
+                f"{item['columns']!r}, schema={schema!r})"
+            )
+            downgrades.append(f"drop_index_concurrently({item['index_name']!r}, {item['table']!r}, schema={schema!r})")
+        revision = migration_engine.script.generate_revision(
+            _next_revision_id(),
+            f"Add advised indexes on {schema}",
+            head=f"{schema}@head",
+            imports="from src.utils.migration_ops import create_index_concurrently, drop_index_concurrently",
+            upgrades=f"# Generated by the index advisor on {created_at}; review before merging\n    "
+            + "\n    ".join(upgrades),
+            downgrades="\n    ".join(reversed(downgrades)),
+        )
+        logger.info(f"Generated revision {revision.revision} with {len(items)} advised indexes on {schema}")
+        generated.append({
+            "revision": revision.revision,
+            "path": revision.path,
+            "schema": schema,
+            "indexes": [item["index_name"] for item in items],
+        })
+    return generated
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import structlog
+
+from src.core.config import settings
+from src.core.metrics import OPERATION_DURATION
+
+logger = structlog.get_logger()
+
+
+class JobState(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class Job:
+    """A long running operation executed on the worker pool"""
+    kind: str
+    params: Dict[str, Any]
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    state: JobState = JobState.QUEUED
+    progress: float = 0.0
+    message: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=_now)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Bounded ring of log/progress events; old events are dropped first
+    events: Deque[Dict[str, Any]] = field(
+        default_factory=lambda: deque(maxlen=settings.JOB_LOG_BUFFER), repr=False
+    )
+    event_count: int = 0
+    _events_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def emit(self, event_type: str, **data) -> None:
+        """Append an event for live streaming"""
+        with self._events_lock:
+            self.event_count += 1
+            self.events.append({"seq": self.event_count, "type": event_type, "ts": time.time(), **data})
+
+    def log(self, line: str, stream: str = "output") -> None:
+        self.emit("log", stream=stream, line=line)
+
+    def events_since(self, seq: int) -> Tuple[List[Dict[str, Any]], int]:
+        """Events newer than ``seq`` and how many were dropped in between"""
+        with self._events_lock:
+            events = [event for event in self.events if event["seq"] > seq]
+        dropped = (events[0]["seq"] - seq - 1) if events else 0
+        return events, dropped
+
+    def update_progress(self, progress: float, message: Optional[str] = None) -> None:
+        """Record progress (0-100) and an optional status message"""
+        self.progress = max(self.progress, min(float(progress), 100.0))
+        if message is not None:
+            self.message = message
+        self.emit("progress", progress=round(self.progress, 2), message=self.message)
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (JobState.SUCCEEDED, JobState.FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        queue_seconds = None
+        duration_seconds = None
+        if self.started_at:
+            queue_seconds = (self.started_at - self.created_at).total_seconds()
+            end = self.finished_at or _now()
+            duration_seconds = (end - self.started_at).total_seconds()
+
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "state": self.state.value,
+            "progress": round(self.progress, 2),
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "queue_seconds": queue_seconds,
+            "duration_seconds": duration_seconds,
+            "events": self.event_count,
+        }
+
+
+class JobManager:
+    """Runs jobs on a local thread pool and keeps a bounded job history"""
+
+    def __init__(self, max_workers: int, history_limit: int):
+        self.history_limit = history_limit
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[..., Optional[Dict[str, Any]]], **params) -> Job:
+        """Queue ``fn(job, **params)`` and return the job immediately"""
+        job = Job(kind=kind, params=params)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        logger.info(f"Job {job.id} ({kind}) queued")
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Optional[Dict[str, Any]]]) -> None:
+        job.state = JobState.RUNNING
+        job.started_at = _now()
+        started = time.perf_counter()
+        logger.info(f"Job {job.id} ({job.kind}) started")
+        try:
+            job.result = fn(job, **job.params)
+            job.progress = 100.0
+            job.state = JobState.SUCCEEDED
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            job.error = str(e)
+            job.state = JobState.FAILED
+        finally:
+            job.finished_at = _now()
+            OPERATION_DURATION.labels(operation=job.kind, outcome=job.state.value).observe(
+                time.perf_counter() - started
+            )
+            job.emit("state", state=job.state.value, error=job.error)
+            logger.info(f"Job {job.id} ({job.kind}) finished with state {job.state.value}")
+
+    def _prune(self) -> None:
+        """Drop the oldest finished jobs once the history limit is reached"""
+        overflow = len(self._jobs) - self.history_limit
+        if overflow <= 0:
+            return
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished][:overflow]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if kind:
+            jobs = [job for job in jobs if job.kind == kind]
+        return list(reversed(jobs))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Global job manager instance
+job_manager = JobManager(settings.JOB_WORKERS, settings.JOB_HISTORY_LIMIT)
+
+
+async def run_periodically(kind: str, fn: Callable[..., Optional[Dict[str, Any]]], interval_seconds: float, **params) -> None:
+    """Submit ``fn`` as a job every interval unless the previous run is still going"""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        if any(not job.finished for job in job_manager.list(kind)):
+            logger.info(f"Skipping scheduled {kind} job, previous run still in progress")
+            continue
+        job_manager.submit(kind, fn, **params)
@@ -0,0 +1,237 @@
+"""Per-service migration branches, upgraded in dependency waves.
+
+Every service schema has its own Alembic branch, labelled with the schema
+name, rooted at ``0001`` (schema creation). ``depends_on`` edges are only
+added where foreign keys cross schemas, so branches can be upgraded alone
+(``/run?service=plans-service`` upgrades ``plans@head``) or side by side.
+
+Upgrading several branches proceeds in waves: a branch joins a wave once
+everything its pending revisions depend on is applied. The branches of a
+wave run in separate worker processes, since alembic.op and alembic.context
+are process-wide proxies.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import structlog
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.core.schemas import SCHEMAS, schemas_for
+from src.services.jobs import Job
+from src.services.migration_engine import migration_engine, upgrade_job
+from src.services.migration_profiler import MigrationProfiler, record_run
+
+logger = structlog.get_logger()
+
+# The revisions used to form a single linear chain. A database stamped with
+# one of them alone is restamped with the equivalent branch heads.
+LEGACY_CHAIN = ("0001", "0002", "0003", "0004", "0005")
+
+
+def branch_labels() -> List[str]:
+    """Branch labels of the revision graph, in schema dependency order"""
+    labels = set()
+    for rev in migration_engine.ordered_revisions():
+        labels.update(rev.branch_labels)
+    return sorted(labels, key=lambda label: (SCHEMAS.index(label) if label in SCHEMAS else len(SCHEMAS), label))
+
+
+def labels_for_service(service: str) -> List[str]:
+    """Branches owning the schemas of a service (or of a schema name)"""
+    labels = branch_labels()
+    branches = [schema for schema in schemas_for([service]) if schema in labels]
+    if not branches:
+        raise ValueError(f"No migration branch for {service}")
+    return branches
+
+
+def _ancestors(revision: str) -> Set[str]:
+    return {rev.revision for rev in migration_engine.script.iterate_revisions(revision, "base")} - {revision}
+
+
+def _unit(rev) -> str:
+    """Branch label of a revision, or the revision itself when unlabelled"""
+    return min(rev.branch_labels) if rev.branch_labels else rev.revision
+
+
+def _holds_tables(connectable: Engine, schemas: Set[str]) -> bool:
+    inspector = inspect(connectable)
+    existing = set(inspector.get_schema_names())
+    return all(schema in existing and inspector.get_table_names(schema=schema) for schema in schemas)
+
+
+def restamp_legacy(connectable: Optional[Engine] = None) -> Optional[List[str]]:
+    """Restamp a database migrated with the former linear chain.
+
+    ``0005`` used to imply every revision before it; in the branched graph
+    it only implies its own dependencies, so the version table is rewritten
+    with the heads of what was really applied. Nothing is executed.
+
+    A branch upgrade can leave the same single row behind (``plans`` alone
+    stamps ``0005``), so the database only counts as legacy when the schemas
+    of the revisions the row no longer implies already hold tables.
+    """
+    connectable = connectable or master_engine
+    current = migration_engine.current_heads(connectable)
+    if len(current) != 1 or current[0] not in LEGACY_CHAIN:
+        return None
+    applied = set(LEGACY_CHAIN[:LEGACY_CHAIN.index(current[0]) + 1])
+    missing = applied - migration_engine.applied_revisions(current)
+    if not missing:
+        return None
+    script = migration_engine.script
+    if not _holds_tables(connectable, {_unit(script.get_revision(revision)) for revision in missing}):
+        return None
+    heads = sorted(
+        revision for revision in applied
+        if not any(revision in _ancestors(other) for other in applied if other != revision)
+    )
+    migration_engine.stamp(heads, connectable)
+    logger.info(f"Restamped linear revision {current[0]} as branch heads {', '.join(heads)}")
+    return heads
+
+
+def _next_wave(targets: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """Branches that can be upgraded together now, and those that must wait.
+
+    Pending revisions of other branches that the targets depend on are
+    scheduled as branches of their own, upgraded only as far as needed:
+    Alembic cannot move one version table row twice in a single upgrade,
+    which happens when a target pulls in two sibling branches at once.
+    """
+    current = migration_engine.current_heads()
+    applied = migration_engine.applied_revisions(current)
+    pending = {}
+    for target in targets:
+        for rev in migration_engine.pending_revisions(current, target):
+            pending[rev.revision] = rev
+    units: Dict[str, list] = {}
+    for rev in migration_engine.ordered_revisions():
+        if rev.revision in pending:
+            units.setdefault(_unit(rev), []).append(rev)
+
+    wave, waiting = {}, []
+    moved_rows: Set[str] = set()
+    for unit, revisions in units.items():
+        own = {rev.revision for rev in revisions}
+        requires = {down for rev in revisions for down in rev._all_down_revisions} - own
+        if not requires <= applied:
+            waiting.append(unit)
+            continue
+        # Version table rows this upgrade rewrites; Alembic updates a row in
+        # place, so two upgrades moving the same row cannot run together
+        rows = requires & set(current)
+        if rows & moved_rows:
+            waiting.append(unit)
+            continue
+        moved_rows |= rows
+        # Revisions come base first, the last one is as far as the branch goes
+        wave[unit] = revisions[-1].revision
+    return wave, waiting
+
+
+def _count_pending(current: Tuple[str, ...], targets: List[str]) -> int:
+    return len({rev.revision for target in targets for rev in migration_engine.pending_revisions(current, target)})
+
+
+def _upgrade_branch(target: str, online: Optional[bool], job_id: str) -> Dict[str, Any]:
+    """Worker process entry point: upgrade one branch and record the run"""
+    profiler = MigrationProfiler()
+    started_at = datetime.now(timezone.utc)
+    try:
+        migration_engine.upgrade(target, online=online, profiler=profiler)
+    except Exception as e:
+        record_run(profiler, "upgrade", target, started_at, error=str(e), job_id=job_id)
+        # Driver exceptions do not always survive pickling
+        raise RuntimeError(f"{target}: {str(e)}") from None
+    run_id = record_run(profiler, "upgrade", target, started_at, job_id=job_id)
+    return {"target": target, "run_id": run_id, "timings": profiler.summary()}
+
+
+def _upgrade_in_process(job: Job, target: str, online: Optional[bool]) -> Dict[str, Any]:
+    result = upgrade_job(job, target=target, online=online)
+    return {"target": target, "run_id": result["run_id"], "timings": result["timings"]}
+
+
+def _run_wave(job: Job, wave: Dict[str, str], online: Optional[bool], pool: Optional[ProcessPoolExecutor]) -> Dict[str, Any]:
+    if pool is None or len(wave) == 1:
+        return {unit: _upgrade_in_process(job, target, online) for unit, target in wave.items()}
+
+    futures = {unit: pool.submit(_upgrade_branch, target, online, job.id) for unit, target in wave.items()}
+    runs, errors = {}, []
+    # Every branch is waited for: the ones that succeed are committed anyway
+    for unit, future in futures.items():
+        try:
+            runs[unit] = future.result()
+            job.log(f"Branch {unit} upgraded to {wave[unit]}", stream="branches")
+        except Exception as e:
+            errors.append(str(e))
+            job.log(f"Branch {unit} failed: {str(e)}", stream="branches")
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return runs
+
+
+def upgrade_branches_job(
+    job: Job,
+    labels: Optional[List[str]] = None,
+    online: Optional[bool] = None,
+    **context
+) -> Dict[str, Any]:
+    """Job entry point for ``/api/migrations/run``: upgrade branches in waves"""
+    requested = labels or branch_labels()
+    targets = ["heads"] if labels is None else [f"{label}@head" for label in labels]
+    waves: List[List[str]] = []
+    runs: Dict[str, Any] = {}
+    pool = None
+    # Nothing else in this process may run Alembic meanwhile
+    with migration_engine.exclusive():
+        restamp_legacy()
+        initial = migration_engine.current_heads()
+        total = _count_pending(initial, targets)
+        job.update_progress(0, f"Applying {total} pending revisions on branches {', '.join(requested)}")
+        try:
+            while True:
+                wave, waiting = _next_wave(targets)
+                if not wave:
+                    if waiting:
+                        raise RuntimeError(f"Branches {', '.join(waiting)} depend on revisions that cannot be applied")
+                    break
+                before = migration_engine.current_heads()
+                job.emit("wave", branches=list(wave), index=len(waves) + 1)
+                if len(wave) > 1 and pool is None and settings.MIGRATION_BRANCH_WORKERS > 1:
+                    pool = ProcessPoolExecutor(
+                        max_workers=settings.MIGRATION_BRANCH_WORKERS,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                runs.update(_run_wave(job, wave, online, pool))
+                waves.append(list(wave))
+                after = migration_engine.current_heads()
+                if after == before:
+                    raise RuntimeError(f"Upgrading {', '.join(wave)} applied nothing")
+                if total:
+                    done = total - _count_pending(after, targets)
+                    job.update_progress(min(done / total * 100, 99.0), f"Wave {len(waves)} done")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    status = migration_engine.status()
+    applied = (
+        migration_engine.applied_revisions(tuple(status["current"]))
+        - migration_engine.applied_revisions(initial)
+    )
+    return {
+        **context,
+        "branches": requested,
+        "online": online,
+        "waves": waves,
+        "runs": runs,
+        "applied": [rev.revision for rev in migration_engine.ordered_revisions() if rev.revision in applied],
+        **status,
+    }
@@ -0,0 +1,312 @@
+import io
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import structlog
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.environment import EnvironmentContext
+from alembic.runtime.migration import MigrationContext
+from alembic.script import Script, ScriptDirectory
+from alembic.util import CommandError, to_tuple
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.core.metrics import set_current_revisions
+from src.services.jobs import Job
+from src.services.migration_profiler import MigrationProfiler, latest_revision_timings, record_run
+
+logger = structlog.get_logger()
+
+
+class MigrationEngine:
+    """In-process Alembic runner with a cached revision graph"""
+
+    def __init__(self, config_path: str, script_location: str):
+        self.config_path = config_path
+        self.script_location = script_location
+        self._script: Optional[ScriptDirectory] = None
+        self._script_signature: Tuple = ()
+        self._script_lock = threading.Lock()
+        # alembic.context and alembic.op are module-level proxies, so only
+        # one command can be running inside this process at any time.
+        # Reentrant so a multi-step operation can hold it across commands.
+        self._command_lock = threading.RLock()
+
+    def make_config(self, output_buffer: Optional[io.StringIO] = None, **attributes) -> Config:
+        """Build an Alembic config pointing at the service migrations"""
+        config = Config(self.config_path, output_buffer=output_buffer)
+        config.set_main_option("script_location", self.script_location)
+        # env.py must not reconfigure logging of the running service
+        config.attributes["configure_logger"] = False
+        config.attributes.update(attributes)
+        return config
+
+    def _versions_signature(self) -> Tuple:
+        """Names and mtimes of revision files, used to invalidate the cache"""
+        versions_dir = os.path.join(self.script_location, "versions")
+        if not os.path.isdir(versions_dir):
+            return ()
+        with os.scandir(versions_dir) as entries:
+            return tuple(sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in entries
+                if entry.name.endswith(".py")
+            ))
+
+    @property
+    def script(self) -> ScriptDirectory:
+        """Parsed revision graph, re-read only when revision files change"""
+        signature = self._versions_signature()
+        with self._script_lock:
+            if self._script is None or signature != self._script_signature:
+                script = ScriptDirectory.from_config(self.make_config())
+                # Force the revision map to be parsed while holding the lock
+                script.get_heads()
+                self._script = script
+                self._script_signature = signature
+                logger.info(f"Loaded revision graph with {len(signature)} revision files")
+            return self._script
+
+    def current_heads(self, connectable: Optional[Engine] = None) -> Tuple[str, ...]:
+        """Revisions currently stamped in the target database"""
+        with (connectable or master_engine).connect() as connection:
+            context = MigrationContext.configure(connection)
+            return context.get_current_heads()
+
+    def applied_revisions(self, current: Tuple[str, ...]) -> set:
+        """All revisions implied by the given version table heads"""
+        script = self.script
+        applied = set()
+        for revision_id in current:
+            applied.update(rev.revision for rev in script.iterate_revisions(revision_id, "base"))
+        return applied
+
+    def ordered_revisions(self) -> List[Script]:
+        """All revisions ordered from base to heads"""
+        return list(reversed(list(self.script.walk_revisions())))
+
+    def pending_revisions(self, current: Tuple[str, ...], target: str = "heads") -> List[Script]:
+        """Revisions not yet applied, ordered from base to heads.
+
+        With a target such as ``plans@head`` only the revisions an upgrade to
+        it would run are returned, dependencies in other branches included.
+        """
+        applied = self.applied_revisions(current)
+        wanted = None
+        if target != "heads":
+            wanted = {rev.revision for rev in self.script.iterate_revisions(target, "base")}
+        return [
+            rev for rev in self.ordered_revisions()
+            if rev.revision not in applied and (wanted is None or rev.revision in wanted)
+        ]
+
+    @staticmethod
+    def describe(revision: Script) -> Dict[str, Any]:
+        """JSON friendly description of a revision"""
+        return {
+            "revision": revision.revision,
+            "down_revisions": list(to_tuple(revision.down_revision, default=())),
+            "depends_on": list(to_tuple(revision.dependencies, default=())),
+            "branch_labels": sorted(revision.branch_labels),
+            "description": revision.doc,
+            "is_head": revision.is_head,
+        }
+
+    def status(self, connectable: Optional[Engine] = None) -> Dict[str, Any]:
+        """Current revision, heads and pending revisions"""
+        current = self.current_heads(connectable)
+        pending = self.pending_revisions(current)
+        if connectable is None:
+            set_current_revisions(current)
+        return {
+            "current": list(current),
+            "heads": list(self.script.get_heads()),
+            "pending": [self.describe(rev) for rev in pending],
+            "up_to_date": not pending,
+        }
+
+    def history(self, connectable: Optional[Engine] = None) -> List[Dict[str, Any]]:
+        """Every revision from base to heads with its applied flag"""
+        applied = self.applied_revisions(self.current_heads(connectable))
+        try:
+            timings = latest_revision_timings()
+        except Exception as e:
+            logger.warning(f"Could not read migration timings: {str(e)}")
+            timings = {}
+        history = []
+        for rev in self.ordered_revisions():
+            entry = self.describe(rev)
+            entry["applied"] = rev.revision in applied
+            entry["last_upgrade"] = timings.get(rev.revision)
+            history.append(entry)
+        return history
+
+    def upgrade(self, target: str = "heads", **attributes) -> Dict[str, Any]:
+        """Upgrade the database to the given target"""
+        with self._command_lock:
+            command.upgrade(self.make_config(**attributes), target)
+        return self.status()
+
+    def downgrade(self, target: str, **attributes) -> Dict[str, Any]:
+        """Downgrade the database to the given target"""
+        with self._command_lock:
+            command.downgrade(self.make_config(**attributes), target)
+        return self.status()
+
+    def render_sql(self, target: str = "heads", start: Sequence[str] = (), **attributes) -> str:
+        """SQL an upgrade from the ``start`` heads (default: base) to ``target`` would run (offline mode)"""
+        output = io.StringIO()
+        config = self.make_config(output_buffer=output, **attributes)
+        script = self.script
+        # command.upgrade() only takes a single starting revision as "start:target"
+        with self._command_lock, EnvironmentContext(
+            config,
+            script,
+            fn=lambda rev, context: script._upgrade_revs(target, rev),
+            as_sql=True,
+            starting_rev=list(start) or None,
+            destination_rev=target,
+        ):
+            script.run_env()
+        return output.getvalue()
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """Hold off every other Alembic command of this process"""
+        with self._command_lock:
+            yield
+
+    def stamp(self, revisions: Sequence[str], connectable: Optional[Engine] = None) -> None:
+        """Replace the version table contents with ``revisions``, running nothing"""
+        attributes = {"database_url": connectable.url.render_as_string(hide_password=False)} if connectable else {}
+        with self._command_lock:
+            command.stamp(self.make_config(**attributes), list(revisions), purge=True)
+
+    def upgrade_database(self, url: str, target: str = "heads", **attributes) -> Dict[str, Any]:
+        """Upgrade another database than the master one, e.g. a template"""
+        with self._command_lock:
+            command.upgrade(self.make_config(database_url=url, **attributes), target)
+        connectable = create_engine(url, poolclass=NullPool)
+        try:
+            return self.status(connectable)
+        finally:
+            connectable.dispose()
+
+    def validate(self) -> Dict[str, Any]:
+        """Validate the revision graph and compare models against the database"""
+        errors = []
+        script = self.script
+        heads = script.get_heads()
+        try:
+            revisions = self.ordered_revisions()
+        except CommandError as e:
+            return {"valid": False, "heads": list(heads), "revisions": 0, "errors": [str(e)]}
+
+        with self._command_lock:
+            try:
+                command.check(self.make_config())
+            except CommandError as e:
+                errors.append(str(e))
+
+        return {
+            "valid": not errors,
+            "heads": list(heads),
+            "revisions": len(revisions),
+            "errors": errors,
+        }
+
+
+# Global engine instance
+migration_engine = MigrationEngine(settings.ALEMBIC_CONFIG, settings.MIGRATIONS_PATH)
+
+
+class _JobLogHandler(logging.Handler):
+    """Forwards Alembic log records emitted by the job's thread to the job"""
+
+    def __init__(self, job: Job, total: int):
+        super().__init__(level=logging.INFO)
+        self.job = job
+        self.total = total
+        self.applied = 0
+        self.thread_id = threading.get_ident()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread_id:
+            return
+        message = record.getMessage()
+        self.job.log(message, stream=record.name)
+        if message.startswith("Running upgrade") or message.startswith("Running downgrade"):
+            self.applied += 1
+            self.job.emit("revision", message=message, done=self.applied, total=self.total)
+            if self.total:
+                self.job.update_progress(min(self.applied / self.total * 100, 99.0), message)
+
+
+@contextmanager
+def _capture_alembic_logs(job: Job, total: int) -> Iterator[None]:
+    alembic_logger = logging.getLogger("alembic")
+    handler = _JobLogHandler(job, total)
+    previous_level = alembic_logger.level
+    alembic_logger.addHandler(handler)
+    if alembic_logger.getEffectiveLevel() > logging.INFO:
+        alembic_logger.setLevel(logging.INFO)
+    try:
+        yield
+    finally:
+        alembic_logger.removeHandler(handler)
+        alembic_logger.setLevel(previous_level)
+
+
+def _profiled(job: Job, operation: str, target: str, run) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Run an Alembic command with a profiler and record the run"""
+    profiler = MigrationProfiler()
+    started_at = datetime.now(timezone.utc)
+    try:
+        status = run(profiler=profiler)
+    except Exception as e:
+        record_run(profiler, operation, target, started_at, error=str(e), job_id=job.id)
+        raise
+    run_id = record_run(profiler, operation, target, started_at, job_id=job.id)
+    return status, {"run_id": run_id, "timings": profiler.summary()}
+
+
+def upgrade_job(job: Job, target: str = "heads", online: Optional[bool] = None, **context) -> Dict[str, Any]:
+    """Job entry point for ``/api/migrations/run``"""
+    pending = migration_engine.pending_revisions(migration_engine.current_heads(), target)
+    job.update_progress(0, f"Applying {len(pending)} pending revisions")
+    with _capture_alembic_logs(job, len(pending)):
+        status, profile = _profiled(
+            job,
+            "upgrade",
+            target,
+            lambda **attributes: migration_engine.upgrade(target, online=online, **attributes)
+        )
+    return {
+        **context,
+        "target": target,
+        "online": online,
+        "applied": [rev.revision for rev in pending],
+        **status,
+        **profile,
+    }
+
+
+def downgrade_job(job: Job, revision: str, online: Optional[bool] = None) -> Dict[str, Any]:
+    """Job entry point for ``/api/migrations/rollback``"""
+    job.update_progress(0, f"Downgrading to {revision}")
+    with _capture_alembic_logs(job, 0):
+        status, profile = _profiled(
+            job,
+            "downgrade",
+            revision,
+            lambda **attributes: migration_engine.downgrade(revision, online=online, **attributes)
+        )
+    return {"revision": revision, "online": online, **status, **profile}
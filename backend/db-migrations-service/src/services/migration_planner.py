@@ -0,0 +1,395 @@
+"""Dry-run of pending migrations: the SQL they render and what it will cost.
+
+The SQL comes from the offline (``--sql``) path of ``migrations/env.py``.
+Each statement is classified by the lock it takes and whether it scans or
+rewrites its table, then weighed against the live size of that table in
+the master database.
+"""
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.services.migration_engine import migration_engine
+
+# Table lock modes, weakest to strongest
+ROW_EXCLUSIVE = "ROW EXCLUSIVE"
+SHARE_UPDATE_EXCLUSIVE = "SHARE UPDATE EXCLUSIVE"
+SHARE = "SHARE"
+SHARE_ROW_EXCLUSIVE = "SHARE ROW EXCLUSIVE"
+ACCESS_EXCLUSIVE = "ACCESS EXCLUSIVE"
+LOCK_ORDER = (ROW_EXCLUSIVE, SHARE_UPDATE_EXCLUSIVE, SHARE, SHARE_ROW_EXCLUSIVE, ACCESS_EXCLUSIVE)
+
+# What concurrent sessions cannot do on the table while the lock is held
+BLOCKS = {
+    ROW_EXCLUSIVE: "nothing (row locks only)",
+    SHARE_UPDATE_EXCLUSIVE: "DDL and VACUUM",
+    SHARE: "writes",
+    SHARE_ROW_EXCLUSIVE: "writes",
+    ACCESS_EXCLUSIVE: "reads and writes",
+}
+
+IDENT = r'(?:"[^"]+"|[\w$]+)'
+NAME = rf'({IDENT}(?:\.{IDENT})?)'
+
+REVISION_MARKER = re.compile(r"^-- Running (upgrade|downgrade) (.*?) -> (\S+)")
+
+# Defaults evaluated per row force a rewrite even on PostgreSQL 11+
+VOLATILE_DEFAULT = re.compile(
+    r"\bDEFAULT\s+(?:gen_random_uuid|uuid_generate_v[14]|random|clock_timestamp|timeofday|nextval)\s*\(",
+    re.I
+)
+SERIAL_TYPE = re.compile(r"\b(?:SMALL|BIG)?SERIAL\b", re.I)
+
+DOLLAR_QUOTE = re.compile(r"\$(?:[A-Za-z_][\w]*)?\$")
+
+
+@dataclass
+class StatementEffect:
+    operation: str
+    table: Optional[str] = None
+    index: Optional[str] = None
+    referenced: Optional[str] = None
+    lock: Optional[str] = None
+    rewrite: bool = False
+    scan: bool = False
+    dml: bool = False
+    new_table: bool = False
+
+
+def _strongest(locks) -> Optional[str]:
+    locks = [lock for lock in locks if lock]
+    return max(locks, key=LOCK_ORDER.index) if locks else None
+
+
+def _split_top_level(clause: str) -> List[str]:
+    """Split ALTER TABLE subcommands on commas outside parentheses"""
+    parts, depth, start = [], 0, 0
+    for position, char in enumerate(clause):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(clause[start:position].strip())
+            start = position + 1
+    parts.append(clause[start:].strip())
+    return [part for part in parts if part]
+
+
+def _alter_table_action(action: str) -> Tuple[str, bool, bool]:
+    """Lock, rewrite and scan of one ALTER TABLE subcommand"""
+    upper = action.upper()
+    not_valid = "NOT VALID" in upper
+    if re.match(r"ADD\s+(?:COLUMN\s+)?(?!CONSTRAINT\b|PRIMARY\b|UNIQUE\b|FOREIGN\b|CHECK\b|EXCLUDE\b)", upper):
+        rewrite = bool(
+            VOLATILE_DEFAULT.search(action)
+            or SERIAL_TYPE.search(action)
+            or re.search(r"\bGENERATED\s+ALWAYS\s+AS\s*\(.*\)\s*STORED", upper)
+        )
+        return ACCESS_EXCLUSIVE, rewrite, False
+    if re.search(r"\bFOREIGN\s+KEY\b", upper):
+        return SHARE_ROW_EXCLUSIVE, False, not not_valid
+    if re.search(r"\bCHECK\s*\(", upper):
+        return ACCESS_EXCLUSIVE, False, not not_valid
+    if re.search(r"\b(?:PRIMARY\s+KEY|UNIQUE|EXCLUDE)\b", upper):
+        # Builds an index unless attached with USING INDEX
+        return ACCESS_EXCLUSIVE, False, "USING INDEX" not in upper
+    if upper.startswith("VALIDATE CONSTRAINT"):
+        return SHARE_UPDATE_EXCLUSIVE, False, True
+    if re.match(r"ALTER\s+(?:COLUMN\s+)?\S+\s+(?:SET\s+DATA\s+)?TYPE\b", upper):
+        # Binary compatible changes (e.g. widening a varchar) skip the rewrite
+        return ACCESS_EXCLUSIVE, True, True
+    if re.match(r"ALTER\s+(?:COLUMN\s+)?\S+\s+SET\s+NOT\s+NULL", upper):
+        return ACCESS_EXCLUSIVE, False, True
+    if re.match(r"ALTER\s+(?:COLUMN\s+)?\S+\s+SET\s+STATISTICS", upper) or upper.startswith("SET ("):
+        return SHARE_UPDATE_EXCLUSIVE, False, False
+    if re.match(r"SET\s+(?:TABLESPACE|LOGGED|UNLOGGED|ACCESS\s+METHOD)\b", upper):
+        return ACCESS_EXCLUSIVE, True, True
+    return ACCESS_EXCLUSIVE, False, False
+
+
+def classify(statement: str) -> StatementEffect:
+    """Operation, target table and table-level effects of a DDL/DML statement"""
+    sql = " ".join(statement.split()).rstrip(";").strip()
+
+    match = re.match(rf"CREATE (?:UNIQUE )?INDEX (CONCURRENTLY )?.*? ON (?:ONLY )?{NAME}", sql, re.I)
+    if match:
+        concurrently = bool(match.group(1))
+        return StatementEffect(
+            "create_index_concurrently" if concurrently else "create_index",
+            table=match.group(2),
+            lock=SHARE_UPDATE_EXCLUSIVE if concurrently else SHARE,
+            scan=True,
+        )
+
+    match = re.match(rf"DROP INDEX (CONCURRENTLY )?(?:IF EXISTS )?{NAME}", sql, re.I)
+    if match:
+        return StatementEffect(
+            "drop_index",
+            index=match.group(2),
+            lock=SHARE_UPDATE_EXCLUSIVE if match.group(1) else ACCESS_EXCLUSIVE,
+        )
+
+    match = re.match(rf"CREATE (?:UNLOGGED )?TABLE (?:IF NOT EXISTS )?{NAME}", sql, re.I)
+    if match:
+        referenced = re.search(rf"\bREFERENCES {NAME}", sql, re.I)
+        return StatementEffect(
+            "create_table",
+            table=match.group(1),
+            referenced=referenced.group(1) if referenced else None,
+            lock=ACCESS_EXCLUSIVE,
+            new_table=True,
+        )
+
+    match = re.match(rf"ALTER TABLE (?:IF EXISTS )?(?:ONLY )?{NAME} (.*)", sql, re.I)
+    if match:
+        table, clause = match.groups()
+        if re.match(r"RENAME\b", clause, re.I):
+            return StatementEffect("rename", table=table, lock=ACCESS_EXCLUSIVE)
+        effects = [_alter_table_action(action) for action in _split_top_level(clause)]
+        referenced = re.search(rf"\bREFERENCES {NAME}", clause, re.I)
+        return StatementEffect(
+            "alter_table",
+            table=table,
+            referenced=referenced.group(1) if referenced else None,
+            lock=_strongest(lock for lock, _, _ in effects),
+            rewrite=any(rewrite for _, rewrite, _ in effects),
+            scan=any(scan or rewrite for _, rewrite, scan in effects),
+        )
+
+    match = re.match(rf"(?:DROP TABLE (?:IF EXISTS )?|TRUNCATE (?:TABLE )?(?:ONLY )?){NAME}", sql, re.I)
+    if match:
+        operation = "drop_table" if sql.upper().startswith("DROP") else "truncate"
+        return StatementEffect(operation, table=match.group(1), lock=ACCESS_EXCLUSIVE)
+
+    match = re.match(rf"(UPDATE (?:ONLY )?|DELETE FROM (?:ONLY )?|INSERT INTO ){NAME}", sql, re.I)
+    if match:
+        operation = match.group(1).split()[0].lower()
+        return StatementEffect(operation, table=match.group(2), lock=ROW_EXCLUSIVE, dml=True)
+
+    match = re.match(rf"CREATE (?:OR REPLACE )?(?:CONSTRAINT )?TRIGGER .*? ON {NAME}", sql, re.I)
+    if match:
+        return StatementEffect("create_trigger", table=match.group(1), lock=SHARE_ROW_EXCLUSIVE)
+
+    words = sql.split()
+    return StatementEffect("_".join(words[:2]).lower() if words else "empty")
+
+
+def split_statements(sql: str) -> List[Dict[str, Any]]:
+    """Group rendered offline SQL into revisions and statements.
+
+    Alembic separates statements with a blank line; bodies such as
+    functions may contain blank lines themselves, so chunks are joined
+    until one ends with the statement terminator.
+    """
+    revisions: List[Dict[str, Any]] = []
+    current: Optional[Dict[str, Any]] = None
+    buffer: List[str] = []
+
+    for chunk in sql.split("\n\n"):
+        stripped = chunk.strip()
+        if not stripped:
+            continue
+        marker = REVISION_MARKER.match(stripped)
+        if marker and not buffer:
+            direction, from_revisions, revision = marker.groups()
+            current = {
+                "revision": revision,
+                "direction": direction,
+                "from_revisions": [rev for rev in re.split(r"[\s,]+", from_revisions) if rev],
+                "statements": [],
+            }
+            revisions.append(current)
+            continue
+        buffer.append(chunk)
+        if not stripped.endswith(";"):
+            continue
+        statement = "\n\n".join(buffer).strip()
+        buffer = []
+        if current is None or statement.upper() in ("BEGIN;", "COMMIT;") or "alembic_version" in statement:
+            continue
+        current["statements"].append(statement)
+    return revisions
+
+
+def _table_stats(connection, name: str) -> Optional[Dict[str, Any]]:
+    row = connection.execute(
+        text(
+            "SELECT c.reltuples::bigint, pg_relation_size(c.oid), pg_total_relation_size(c.oid) "
+            "FROM pg_catalog.pg_class c WHERE c.oid = to_regclass(:name)"
+        ),
+        {"name": name}
+    ).first()
+    if row is None:
+        return None
+    reltuples, table_bytes, total_bytes = row
+    return {
+        # -1 means the table was never analyzed
+        "rows": reltuples if reltuples >= 0 else None,
+        "table_bytes": table_bytes,
+        "total_bytes": total_bytes,
+    }
+
+
+def _index_table(connection, index: str) -> Optional[str]:
+    return connection.execute(
+        text("SELECT indrelid::regclass::text FROM pg_catalog.pg_index WHERE indexrelid = to_regclass(:name)"),
+        {"name": index}
+    ).scalar()
+
+
+def _is_single_statement(sql: str) -> bool:
+    """Whether ``sql`` is one statement, ignoring ``;`` in quotes and comments"""
+    position, length = 0, len(sql)
+    terminated = False
+    while position < length:
+        char = sql[position]
+        if sql.startswith("--", position):
+            position = sql.find("\n", position)
+            if position < 0:
+                break
+        elif sql.startswith("/*", position):
+            position = sql.find("*/", position + 2)
+            if position < 0:
+                return False
+            position += 1
+        elif char.isspace():
+            pass
+        elif terminated:
+            # Something other than comments follows a terminator
+            return False
+        elif char in ("'", '"'):
+            position = sql.find(char, position + 1)
+            if position < 0:
+                return False
+        elif char == "$" and DOLLAR_QUOTE.match(sql, position):
+            tag = DOLLAR_QUOTE.match(sql, position).group(0)
+            position = sql.find(tag, position + len(tag))
+            if position < 0:
+                return False
+            position += len(tag) - 1
+        elif char == ";":
+            terminated = True
+        position += 1
+    return True
+
+
+def _explain_rows(connection, statement: str) -> Optional[int]:
+    """Planner row estimate of a DML statement, without executing it"""
+    # The simple query protocol runs every statement of a multi-statement
+    # string, so EXPLAIN would only cover the first and execute the rest
+    if not _is_single_statement(statement):
+        return None
+    try:
+        plan = connection.exec_driver_sql(
+            f"EXPLAIN (FORMAT JSON) {statement.rstrip().rstrip(';')}",
+            execution_options={"no_parameters": True}
+        ).scalar()
+    except Exception:
+        # Usually a table created earlier in the same upgrade
+        return None
+    finally:
+        connection.rollback()
+    node = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+    # ModifyTable reports no rows of its own; its input is what gets touched
+    if node.get("Node Type") == "ModifyTable" and node.get("Plans"):
+        node = node["Plans"][0]
+    return int(node.get("Plan Rows", 0))
+
+
+def _estimate_seconds(effect: StatementEffect, stats: Optional[Dict[str, Any]]) -> Optional[float]:
+    if stats is None or not (effect.rewrite or effect.scan):
+        return None
+    if effect.rewrite:
+        # The heap and every index are written again
+        return stats["total_bytes"] / (settings.MIGRATION_PLAN_REWRITE_MB_PER_SECOND * 1024 * 1024)
+    return stats["table_bytes"] / (settings.MIGRATION_PLAN_SCAN_MB_PER_SECOND * 1024 * 1024)
+
+
+def annotate(statement: str, connection=None, cache: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Statement with its lock, rewrite/scan flags and the size of its table"""
+    effect = classify(statement)
+    cache = {} if cache is None else cache
+    table = effect.table
+    stats = None
+    rows_estimate = None
+
+    if connection is not None:
+        if table is None and effect.index is not None:
+            table = _index_table(connection, effect.index)
+        if table is not None and not effect.new_table:
+            if table not in cache:
+                cache[table] = _table_stats(connection, table)
+            stats = cache[table]
+        if effect.dml:
+            rows_estimate = _explain_rows(connection, statement)
+        elif stats is not None and (effect.scan or effect.rewrite):
+            rows_estimate = stats["rows"]
+
+    estimated_seconds = _estimate_seconds(effect, stats)
+    blocking = effect.lock in (SHARE, SHARE_ROW_EXCLUSIVE, ACCESS_EXCLUSIVE) and not effect.new_table
+    heavy = (
+        (estimated_seconds is not None and estimated_seconds >= settings.MIGRATION_PLAN_HEAVY_SECONDS)
+        or (rows_estimate is not None and effect.dml and rows_estimate >= settings.MIGRATION_PLAN_HEAVY_ROWS)
+    )
+    return {
+        "statement": statement,
+        "operation": effect.operation,
+        "table": table,
+        "referenced_table": effect.referenced,
+        "lock": effect.lock,
+        "blocks": BLOCKS.get(effect.lock) if not effect.new_table else None,
+        "rewrite": effect.rewrite,
+        "scan": effect.scan,
+        "new_table": effect.new_table,
+        "table_rows": stats["rows"] if stats else None,
+        "table_bytes": stats["table_bytes"] if stats else None,
+        "total_bytes": stats["total_bytes"] if stats else None,
+        "rows_estimate": rows_estimate,
+        "estimated_seconds": round(estimated_seconds, 3) if estimated_seconds is not None else None,
+        "heavy": heavy,
+        "blocking": blocking,
+    }
+
+
+def plan_upgrade(target: str = "heads", online: Optional[bool] = None) -> Dict[str, Any]:
+    """Rendered SQL of the pending revisions, annotated with their cost"""
+    current = migration_engine.current_heads()
+    sql = migration_engine.render_sql(target, current, online=online)
+    revisions = split_statements(sql)
+    script = migration_engine.script
+    cache: Dict[str, Any] = {}
+
+    with master_engine.connect() as connection:
+        # Sizes only exist in PostgreSQL; other dialects get the static analysis
+        inspect = connection if connection.dialect.name == "postgresql" else None
+        for revision in revisions:
+            revision["description"] = script.get_revision(revision["revision"]).doc
+            revision["statements"] = [annotate(statement, inspect, cache) for statement in revision["statements"]]
+            revision["estimated_seconds"] = round(
+                sum(statement["estimated_seconds"] or 0 for statement in revision["statements"]), 3
+            )
+
+    statements = [statement for revision in revisions for statement in revision["statements"]]
+    heavy = [statement for statement in statements if statement["heavy"]]
+    return {
+        "current": list(current),
+        "target": target,
+        "online": online,
+        "revisions": revisions,
+        "summary": {
+            "revisions": len(revisions),
+            "statements": len(statements),
+            "rewrites": sum(1 for statement in statements if statement["rewrite"]),
+            "blocking": sum(1 for statement in statements if statement["blocking"]),
+            "heavy": len(heavy),
+            "estimated_seconds": round(sum(revision["estimated_seconds"] for revision in revisions), 3),
+            "off_peak_recommended": bool(heavy),
+        },
+        "sql": sql,
+    }
@@ -0,0 +1,260 @@
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+from sqlalchemy import create_engine, event, func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.database import SessionLocal
+from src.models.migration_history import MigrationRevisionTiming, MigrationRun, MigrationStatementTiming
+
+logger = structlog.get_logger()
+
+# Statements are stored truncated; DDL with large inline data is rare but possible
+MAX_STATEMENT_LENGTH = 4000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class StatementTiming:
+    statement: str
+    started: float
+    duration_ms: float = 0.0
+    lock_wait_ms: float = 0.0
+    rows: Optional[int] = None
+
+
+@dataclass
+class RevisionTiming:
+    revision: str
+    from_revisions: List[str]
+    direction: str
+    started_at: datetime
+    duration_ms: float
+    statements: List[StatementTiming] = field(default_factory=list)
+
+    @property
+    def lock_wait_ms(self) -> float:
+        return sum(statement.lock_wait_ms for statement in self.statements)
+
+    @property
+    def rows(self) -> int:
+        return sum(statement.rows or 0 for statement in self.statements)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "revision": self.revision,
+            "direction": self.direction,
+            "duration_ms": round(self.duration_ms, 3),
+            "lock_wait_ms": round(self.lock_wait_ms, 3),
+            "statements": len(self.statements),
+            "rows": self.rows,
+        }
+
+
+class MigrationProfiler:
+    """Times every statement and revision of a migration run.
+
+    ``migrations/env.py`` attaches it to the migration connection and passes
+    ``on_version_apply`` to ``context.configure``. Lock waits are sampled from
+    pg_stat_activity by a side connection while a statement is running.
+    """
+
+    def __init__(self):
+        self.revisions: List[RevisionTiming] = []
+        self._statements: List[StatementTiming] = []
+        self._current: Optional[StatementTiming] = None
+        self._revision_started = time.perf_counter()
+        self._revision_started_at = _now()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def attach(self, connection: Connection) -> None:
+        if connection.dialect.name == "postgresql":
+            # Asked from the driver: a query would autobegin a transaction,
+            # which Alembic then treats as external and never commits
+            pid = connection.connection.driver_connection.get_backend_pid()
+            self._sampler = threading.Thread(
+                target=self._sample_lock_waits,
+                args=(connection.engine.url, pid),
+                name="migration-lock-sampler",
+                daemon=True,
+            )
+            self._sampler.start()
+        event.listen(connection, "before_cursor_execute", self._before_execute)
+        event.listen(connection, "after_cursor_execute", self._after_execute)
+        self._revision_started = time.perf_counter()
+        self._revision_started_at = _now()
+
+    def detach(self, connection: Connection) -> None:
+        event.remove(connection, "before_cursor_execute", self._before_execute)
+        event.remove(connection, "after_cursor_execute", self._after_execute)
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        with self._lock:
+            self._current = StatementTiming(statement.strip()[:MAX_STATEMENT_LENGTH], time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        with self._lock:
+            timing = self._current
+            self._current = None
+        if timing is None:
+            return
+        timing.duration_ms = (time.perf_counter() - timing.started) * 1000
+        timing.rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        self._statements.append(timing)
+
+    def _sample_lock_waits(self, url, pid: int) -> None:
+        engine = create_engine(url, poolclass=NullPool)
+        interval = settings.MIGRATION_LOCK_SAMPLE_INTERVAL_SECONDS
+        try:
+            with engine.connect() as conn:
+                last = time.perf_counter()
+                while not self._stop.wait(interval):
+                    waiting = conn.execute(
+                        text("SELECT wait_event_type = 'Lock' FROM pg_stat_activity WHERE pid = :pid"),
+                        {"pid": pid}
+                    ).scalar()
+                    conn.rollback()
+                    now = time.perf_counter()
+                    with self._lock:
+                        if waiting and self._current is not None:
+                            self._current.lock_wait_ms += (now - last) * 1000
+                    last = now
+        except Exception as e:
+            logger.warning(f"Lock wait sampling stopped: {str(e)}")
+        finally:
+            engine.dispose()
+
+    def discard_pending(self) -> None:
+        """Forget the statements of a revision attempt that was rolled back"""
+        with self._lock:
+            self._current = None
+        self._statements = []
+
+    def on_version_apply(self, ctx, step, heads, run_args) -> None:
+        """Alembic callback, invoked once a revision has been applied"""
+        now = time.perf_counter()
+        timing = RevisionTiming(
+            revision=step.up_revision_id,
+            from_revisions=list(step.down_revision_ids),
+            direction="upgrade" if step.is_upgrade else "downgrade",
+            started_at=self._revision_started_at,
+            duration_ms=(now - self._revision_started) * 1000,
+            statements=self._statements,
+        )
+        self.revisions.append(timing)
+        logger.info(
+            f"Revision {timing.revision} ({timing.direction}) took {timing.duration_ms:.1f}ms, "
+            f"{timing.lock_wait_ms:.1f}ms waiting on locks"
+        )
+        self._statements = []
+        self._revision_started = now
+        self._revision_started_at = _now()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        return [revision.summary() for revision in self.revisions]
+
+
+def record_run(
+    profiler: MigrationProfiler,
+    operation: str,
+    target: str,
+    started_at: datetime,
+    error: Optional[str] = None,
+    job_id: Optional[str] = None,
+) -> Optional[str]:
+    """Store a profiled run; failures are logged, never raised"""
+    finished_at = _now()
+    run_id = str(uuid.uuid4())
+    run = MigrationRun(
+        id=run_id,
+        job_id=job_id,
+        operation=operation,
+        target=target,
+        status="failed" if error else "succeeded",
+        error=error,
+        started_at=started_at,
+        finished_at=finished_at,
+        duration_ms=(finished_at - started_at).total_seconds() * 1000,
+    )
+    for position, revision in enumerate(profiler.revisions):
+        run.revisions.append(MigrationRevisionTiming(
+            position=position,
+            revision=revision.revision,
+            from_revisions=",".join(revision.from_revisions) or None,
+            direction=revision.direction,
+            started_at=revision.started_at,
+            duration_ms=revision.duration_ms,
+            lock_wait_ms=revision.lock_wait_ms,
+            statements=len(revision.statements),
+            rows=revision.rows,
+            statement_timings=[
+                MigrationStatementTiming(
+                    position=index,
+                    statement=statement.statement,
+                    duration_ms=statement.duration_ms,
+                    lock_wait_ms=statement.lock_wait_ms,
+                    rows=statement.rows,
+                )
+                for index, statement in enumerate(revision.statements)
+            ],
+        ))
+
+    try:
+        with SessionLocal() as db:
+            db.add(run)
+            db.commit()
+        return run_id
+    except Exception as e:
+        logger.warning(f"Could not record migration run: {str(e)}")
+        return None
+
+
+def latest_revision_timings() -> Dict[str, Dict[str, Any]]:
+    """Most recent upgrade timing of every revision"""
+    latest = (
+        select(func.max(MigrationRevisionTiming.id))
+        .where(MigrationRevisionTiming.direction == "upgrade")
+        .group_by(MigrationRevisionTiming.revision)
+    )
+    with SessionLocal() as db:
+        timings = db.execute(
+            select(MigrationRevisionTiming).where(MigrationRevisionTiming.id.in_(latest))
+        ).scalars().all()
+        return {timing.revision: {"run_id": timing.run_id, **timing.to_dict()} for timing in timings}
+
+
+def list_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    with SessionLocal() as db:
+        runs = db.execute(
+            select(MigrationRun)
+            .options(selectinload(MigrationRun.revisions))
+            .order_by(MigrationRun.started_at.desc())
+            .limit(limit)
+        ).scalars().all()
+        return [run.to_dict() for run in runs]
+
+
+def get_run(run_id: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        run = db.execute(
+            select(MigrationRun)
+            .options(selectinload(MigrationRun.revisions).selectinload(MigrationRevisionTiming.statement_timings))
+            .where(MigrationRun.id == run_id)
+        ).scalar_one_or_none()
+        return run.to_dict(statements=True) if run else None
@@ -0,0 +1,147 @@
+"""Fan-out of a migration run across several databases.
+
+``MIGRATION_TARGETS`` names the databases besides the master one, e.g. the
+per-service instances of docker-compose.yml. Every target is upgraded in its
+own worker process (alembic.op and alembic.context are process-wide), at most
+``MIGRATION_TARGET_WORKERS`` at a time. A failing target is reported in the
+result and does not stop the others.
+"""
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.schemas import parse_names
+from src.services.jobs import Job
+from src.services.migration_branches import restamp_legacy
+from src.services.migration_engine import migration_engine
+from src.services.migration_profiler import MigrationProfiler, record_run
+
+logger = structlog.get_logger()
+
+TARGET_NAME = re.compile(r"^[a-z0-9_-]+$")
+
+MASTER_TARGET = "master"
+
+
+def configured_targets() -> Dict[str, str]:
+    """Target names and URLs: the master database and ``MIGRATION_TARGETS``"""
+    targets = {MASTER_TARGET: settings.MASTER_DATABASE_URL}
+    for entry in parse_names(settings.MIGRATION_TARGETS):
+        name, separator, url = entry.partition("=")
+        name = name.strip()
+        if not separator or not TARGET_NAME.match(name) or not url.strip():
+            raise ValueError(f"Invalid MIGRATION_TARGETS entry {entry!r}, expected name=url")
+        targets[name] = url.strip()
+    return targets
+
+
+def public_url(url: str) -> str:
+    return make_url(url).render_as_string(hide_password=True)
+
+
+def list_targets() -> List[Dict[str, str]]:
+    return [{"name": name, "url": public_url(url)} for name, url in configured_targets().items()]
+
+
+def select_targets(names: Optional[List[str]] = None) -> Dict[str, str]:
+    """Configured targets restricted to ``names`` (all of them by default)"""
+    targets = configured_targets()
+    if not names:
+        return targets
+    unknown = [name for name in names if name not in targets]
+    if unknown:
+        raise ValueError(f"Unknown migration targets {', '.join(unknown)}")
+    return {name: targets[name] for name in names}
+
+
+def _migrate_target(name: str, url: str, target: str, online: Optional[bool], job_id: str) -> Dict[str, Any]:
+    """Worker process entry point: upgrade one database and record the run.
+
+    Errors are returned rather than raised so every target reports back.
+    """
+    profiler = MigrationProfiler()
+    started_at = datetime.now(timezone.utc)
+    started = time.monotonic()
+    result: Dict[str, Any] = {"name": name, "url": public_url(url)}
+    connectable = create_engine(url, poolclass=NullPool)
+    try:
+        restamp_legacy(connectable)
+        before = migration_engine.applied_revisions(migration_engine.current_heads(connectable))
+        status = migration_engine.upgrade_database(url, target, online=online, profiler=profiler)
+        after = migration_engine.applied_revisions(tuple(status["current"]))
+        run_id = record_run(profiler, "upgrade", f"{name}:{target}", started_at, job_id=job_id)
+        result.update(
+            status="succeeded",
+            applied=[rev.revision for rev in migration_engine.ordered_revisions() if rev.revision in after - before],
+            current=status["current"],
+            up_to_date=status["up_to_date"],
+            run_id=run_id,
+            timings=profiler.summary(),
+        )
+    except Exception as e:
+        record_run(profiler, "upgrade", f"{name}:{target}", started_at, error=str(e), job_id=job_id)
+        result.update(status="failed", error=str(e))
+    finally:
+        connectable.dispose()
+    result["duration_seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def migrate_targets_job(
+    job: Job,
+    names: Optional[List[str]] = None,
+    target: str = "heads",
+    online: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Job entry point for ``/api/migrations/targets/run``"""
+    targets = select_targets(names)
+    workers = max(1, min(settings.MIGRATION_TARGET_WORKERS, len(targets)))
+    job.update_progress(0, f"Migrating {len(targets)} databases, {workers} at a time")
+    started = time.monotonic()
+    results: Dict[str, Dict[str, Any]] = {}
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    # The master database may be among the targets: keep /run jobs out meanwhile
+    with migration_engine.exclusive():
+        try:
+            futures = {
+                pool.submit(_migrate_target, name, url, target, online, job.id): name
+                for name, url in targets.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    results[name] = {
+                        "name": name, "url": public_url(targets[name]), "status": "failed", "error": str(e)
+                    }
+                outcome = results[name]
+                if outcome["status"] == "failed":
+                    job.log(f"{name}: failed: {outcome['error']}", stream="targets")
+                else:
+                    job.log(f"{name}: upgraded in {outcome['duration_seconds']}s", stream="targets")
+                job.update_progress(len(results) / len(targets) * 100, f"{len(results)} of {len(targets)} databases done")
+        finally:
+            pool.shutdown()
+
+    failed = [name for name in targets if results[name]["status"] == "failed"]
+    if failed:
+        logger.error(f"Migration failed on {', '.join(failed)}")
+    return {
+        "target": target,
+        "online": online,
+        "targets": [results[name] for name in targets],
+        "succeeded": len(targets) - len(failed),
+        "failed": failed,
+        "duration_seconds": round(time.monotonic() - started, 3),
+    }
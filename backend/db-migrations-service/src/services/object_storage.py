@@ -0,0 +1,223 @@
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import BinaryIO, Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import structlog
+
+from src.core.config import settings
+
+logger = structlog.get_logger()
+
+# S3 rejects multipart parts smaller than 5 MiB (except the last one)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def parse_storage_url(url: str = None) -> Tuple[str, str]:
+    """Bucket and key prefix of an ``s3://bucket/prefix/`` URL"""
+    parsed = urlparse(url or settings.BACKUP_STORAGE)
+    if parsed.scheme != "s3" or not parsed.netloc:
+        raise ValueError(f"Unsupported backup storage {url or settings.BACKUP_STORAGE}")
+    prefix = parsed.path.strip("/")
+    return parsed.netloc, f"{prefix}/" if prefix else ""
+
+
+def object_key(*parts: str) -> str:
+    _, prefix = parse_storage_url()
+    return prefix + "/".join(parts)
+
+
+def object_url(key: str) -> str:
+    bucket, _ = parse_storage_url()
+    return f"s3://{bucket}/{key}"
+
+
+@lru_cache(maxsize=1)
+def get_client():
+    """Shared S3 client; boto3 clients are safe to use from several threads"""
+    import boto3
+    from botocore.config import Config
+
+    return boto3.client(
+        "s3",
+        endpoint_url=settings.BACKUP_STORAGE_ENDPOINT_URL,
+        region_name=settings.BACKUP_STORAGE_REGION,
+        config=Config(
+            # Room for the concurrent parts of a few simultaneous transfers
+            max_pool_connections=max(10, settings.BACKUP_UPLOAD_CONCURRENCY * 4),
+            retries={"max_attempts": 5, "mode": "standard"},
+        ),
+    )
+
+
+def _part_size() -> int:
+    return max(settings.BACKUP_UPLOAD_PART_SIZE, MIN_PART_SIZE)
+
+
+def _read_exactly(stream: BinaryIO, size: int) -> bytes:
+    """Read ``size`` bytes unless the stream ends first; pipes return short reads"""
+    blocks = []
+    remaining = size
+    while remaining:
+        block = stream.read(remaining)
+        if not block:
+            break
+        blocks.append(block)
+        remaining -= len(block)
+    return b"".join(blocks)
+
+
+def upload_stream(stream: BinaryIO, key: str, on_bytes: Optional[Callable[[int], None]] = None) -> Dict[str, object]:
+    """Multipart upload of ``stream`` to ``key`` without spooling it to disk.
+
+    Parts are uploaded concurrently while the next ones are read; at most
+    BACKUP_UPLOAD_CONCURRENCY + 1 parts are held in memory at a time.
+    """
+    client = get_client()
+    bucket, _ = parse_storage_url()
+    part_size = _part_size()
+    concurrency = settings.BACKUP_UPLOAD_CONCURRENCY
+    digest = hashlib.sha256()
+    size = 0
+
+    upload_id = client.create_multipart_upload(Bucket=bucket, Key=key)["UploadId"]
+    slots = threading.BoundedSemaphore(concurrency + 1)
+    futures: List[Future] = []
+
+    def upload_part(part_number: int, data: bytes) -> Dict[str, object]:
+        response = client.upload_part(
+            Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=data
+        )
+        return {"PartNumber": part_number, "ETag": response["ETag"]}
+
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="s3_upload") as executor:
+            part_number = 1
+            while True:
+                data = _read_exactly(stream, part_size)
+                # An empty stream still needs one (empty) part
+                if not data and part_number > 1:
+                    break
+                digest.update(data)
+                size += len(data)
+
+                slots.acquire()
+                failed = next((future for future in futures if future.done() and future.exception()), None)
+                if failed is not None:
+                    slots.release()
+                    raise failed.exception()
+                future = executor.submit(upload_part, part_number, data)
+                future.add_done_callback(lambda _: slots.release())
+                futures.append(future)
+
+                if on_bytes:
+                    on_bytes(size)
+                if len(data) < part_size:
+                    break
+                part_number += 1
+
+            parts = [future.result() for future in futures]
+
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        try:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort multipart upload of {key}: {str(e)}")
+        raise
+
+    return {"key": key, "size_bytes": size, "sha256": digest.hexdigest(), "upload_parts": len(parts)}
+
+
+def upload_bytes(key: str, data: bytes, content_type: str = "application/octet-stream") -> None:
+    bucket, _ = parse_storage_url()
+    get_client().put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+
+
+class ObjectReader:
+    """File-like reader that downloads an object as concurrent ranged GETs.
+
+    Ranges are fetched ahead of the consumer in a bounded window and handed
+    out in order, so a restore reads at multipart speed without a local copy.
+    """
+
+    def __init__(self, key: str):
+        self.client = get_client()
+        self.bucket, _ = parse_storage_url()
+        self.key = key
+        self.size = self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        self.bytes_read = 0
+
+        part_size = _part_size()
+        self._ranges = iter(range(0, self.size, part_size))
+        self._part_size = part_size
+        self._window = settings.BACKUP_UPLOAD_CONCURRENCY
+        self._executor = ThreadPoolExecutor(max_workers=self._window, thread_name_prefix="s3_download")
+        self._pending: Deque[Future] = deque()
+        self._current = b""
+        self._offset = 0
+        self._fill()
+
+    def _get_range(self, start: int) -> bytes:
+        end = min(start + self._part_size, self.size) - 1
+        response = self.client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}")
+        return response["Body"].read()
+
+    def _fill(self) -> None:
+        while len(self._pending) < self._window:
+            start = next(self._ranges, None)
+            if start is None:
+                break
+            self._pending.append(self._executor.submit(self._get_range, start))
+
+    def read(self, size: int = -1) -> bytes:
+        blocks = []
+        wanted = size
+        while wanted != 0:
+            if self._offset >= len(self._current):
+                if not self._pending:
+                    break
+                self._current = self._pending.popleft().result()
+                self._offset = 0
+                self._fill()
+                continue
+            end = len(self._current) if wanted < 0 else min(len(self._current), self._offset + wanted)
+            blocks.append(self._current[self._offset:end])
+            if wanted > 0:
+                wanted -= end - self._offset
+            self._offset = end
+        data = b"".join(blocks)
+        self.bytes_read += len(data)
+        return data
+
+    def close(self) -> None:
+        for future in self._pending:
+            future.cancel()
+        self._pending.clear()
+        self._current = b""
+        self._executor.shutdown(wait=False)
+
+    def __enter__(self) -> "ObjectReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def delete_prefix(prefix: str) -> int:
+    """Delete every object under ``prefix``; returns how many were removed"""
+    client = get_client()
+    bucket, _ = parse_storage_url()
+    removed = 0
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        objects = [{"Key": item["Key"]} for item in page.get("Contents", [])]
+        if objects:
+            client.delete_objects(Bucket=bucket, Delete={"Objects": objects, "Quiet": True})
+            removed += len(objects)
+    return removed
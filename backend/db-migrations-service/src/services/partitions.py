@@ -0,0 +1,301 @@
+"""Time-based range partitions of the append-heavy tables.
+
+A table listed in ``PARTITIONED_TABLES`` is converted by a revision with
+``src.utils.migration_ops.partition_by_range``: the existing rows become a
+single ``<table>_legacy`` partition and new rows go to one partition per
+day, week or month of the partition column.
+
+``maintain_partitions_job`` keeps every partitioned table of every migration
+target ahead of time: partitions up to ``PARTITION_PREMAKE`` periods in the
+future are created (``CREATE TABLE`` then ``ATTACH``, which only takes a
+SHARE UPDATE EXCLUSIVE lock on the parent), and partitions entirely older
+than the retention are detached with ``DETACH PARTITION CONCURRENTLY`` and
+dropped, instead of purging their rows with ``DELETE``. A table whose rows
+expire on their own column (sessions) only loses a partition once every
+row in it has expired. Tables of the registry that are not partitioned
+(yet) in a database are skipped.
+"""
+import re
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.core.schemas import parse_names
+from src.services.jobs import Job
+from src.services.migration_targets import MASTER_TARGET, select_targets
+
+logger = structlog.get_logger()
+
+# Partition name suffix of each period, as strftime formats
+PERIODS = {
+    "day": "%Y%m%d",
+    "week": "%Y%m%d",
+    "month": "%Y%m",
+}
+
+BOUNDS = re.compile(r"FROM \((.+)\) TO \((.+)\)")
+
+
+@dataclass(frozen=True)
+class PartitionPolicy:
+    column: str
+    interval: str
+    # Whole periods kept before the current one; None keeps every partition
+    retention: Optional[int] = None
+    # Rows stay valid until this column; a partition past the retention is
+    # kept while any of its rows has not expired yet
+    expires: Optional[str] = None
+
+
+PARTITIONED_TABLES = {
+    "auth.sessions": PartitionPolicy("created_at", "month", retention=3, expires="expires_at"),
+    "plans.plan_results": PartitionPolicy("created_at", "month"),
+    "chat.chat_messages": PartitionPolicy("created_at", "month", retention=12),
+}
+
+
+def policies() -> Dict[str, PartitionPolicy]:
+    """``PARTITIONED_TABLES`` with the retentions of ``PARTITION_RETENTION``"""
+    result = dict(PARTITIONED_TABLES)
+    for entry in parse_names(settings.PARTITION_RETENTION):
+        name, separator, periods = entry.partition("=")
+        name, periods = name.strip(), periods.strip()
+        if not separator or name not in result or not (periods.isdigit() or periods == "none"):
+            raise ValueError(f"Invalid PARTITION_RETENTION entry {entry!r}, expected schema.table=periods|none")
+        result[name] = replace(result[name], retention=None if periods == "none" else int(periods))
+    return result
+
+
+def period_start(moment: datetime, interval: str) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "month":
+        return start.replace(day=1)
+    if interval == "week":
+        return start - timedelta(days=start.weekday())
+    return start
+
+
+def advance(start: datetime, interval: str, periods: int = 1) -> datetime:
+    if interval == "month":
+        year, month = divmod(start.month - 1 + periods, 12)
+        return start.replace(year=start.year + year, month=month + 1)
+    return start + timedelta(days=periods * (7 if interval == "week" else 1))
+
+
+def partition_name(table: str, start: datetime, interval: str) -> str:
+    return f"{table}_p{start.strftime(PERIODS[interval])}"
+
+
+def literal(moment: datetime) -> str:
+    return f"'{moment.isoformat()}'"
+
+
+def _parse_bound(bound: str) -> Optional[datetime]:
+    """Timestamp of a partition bound, None for MINVALUE/MAXVALUE"""
+    bound = bound.strip("'")
+    if bound in ("MINVALUE", "MAXVALUE"):
+        return None
+    if re.search(r"[+-]\d\d$", bound):
+        bound += ":00"
+    return datetime.fromisoformat(bound)
+
+
+def _is_partitioned(connection: Connection, schema: str, table: str) -> bool:
+    return bool(connection.execute(
+        text(
+            "SELECT 1 FROM pg_catalog.pg_partitioned_table p "
+            "JOIN pg_catalog.pg_class c ON c.oid = p.partrelid "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = :schema AND c.relname = :table"
+        ),
+        {"schema": schema, "table": table}
+    ).scalar())
+
+
+def _partitions(connection: Connection, schema: str, table: str) -> List[Dict[str, Any]]:
+    """Partitions of a table with their bounds, oldest first"""
+    # inhdetachpending only exists from PostgreSQL 14 on
+    pending = "i.inhdetachpending" if connection.dialect.server_version_info >= (14,) else "false"
+    rows = connection.execute(
+        text(
+            f"SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound, {pending} AS detach_pending, "
+            "pg_total_relation_size(c.oid) AS size_bytes "
+            "FROM pg_catalog.pg_inherits i "
+            "JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass)"
+        ),
+        {"parent": f'"{schema}"."{table}"'}
+    ).all()
+    partitions = []
+    for row in rows:
+        match = BOUNDS.search(row.bound or "")
+        partitions.append({
+            "name": row.name,
+            "from": _parse_bound(match.group(1)) if match else None,
+            "to": _parse_bound(match.group(2)) if match else None,
+            "default": not match,
+            "detach_pending": row.detach_pending,
+            "size_bytes": row.size_bytes,
+        })
+    return sorted(partitions, key=lambda p: p["from"] or datetime.min.replace(tzinfo=timezone.utc))
+
+
+def _describe(partition: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **partition,
+        "from": partition["from"].isoformat() if partition["from"] else None,
+        "to": partition["to"].isoformat() if partition["to"] else None,
+    }
+
+
+def _all_expired(connection: Connection, schema: str, name: str, column: str) -> bool:
+    """Whether every row of a partition expired; the expiry index makes this cheap"""
+    return bool(connection.execute(
+        text(f'SELECT coalesce(max("{column}") < now(), true) FROM "{schema}"."{name}"')
+    ).scalar())
+
+
+def create_partition_sql(schema: str, table: str, start: datetime, interval: str) -> List[str]:
+    """Statements adding the partition of the period starting at ``start``"""
+    name = partition_name(table, start, interval)
+    return [
+        f'CREATE TABLE IF NOT EXISTS "{schema}"."{name}" '
+        f'(LIKE "{schema}"."{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE)',
+        f'ALTER TABLE "{schema}"."{table}" ATTACH PARTITION "{schema}"."{name}" '
+        f"FOR VALUES FROM ({literal(start)}) TO ({literal(advance(start, interval))})",
+    ]
+
+
+def _maintain_table(
+    connection: Connection,
+    qualified: str,
+    policy: PartitionPolicy,
+    now: datetime,
+) -> Optional[Dict[str, Any]]:
+    schema, table = qualified.split(".")
+    if not _is_partitioned(connection, schema, table):
+        return None
+    partitions = _partitions(connection, schema, table)
+    result: Dict[str, Any] = {"table": qualified, "created": [], "detached": [], "dropped": [], "kept": []}
+    concurrently = connection.dialect.server_version_info >= (14,)
+
+    # A DETACH ... CONCURRENTLY interrupted midway leaves the partition pending
+    for partition in partitions:
+        if partition["detach_pending"]:
+            connection.exec_driver_sql(
+                f'ALTER TABLE "{schema}"."{table}" DETACH PARTITION "{schema}"."{partition["name"]}" FINALIZE'
+            )
+
+    current = period_start(now, policy.interval)
+    horizon = advance(current, policy.interval, settings.PARTITION_PREMAKE + 1)
+    uppers = [p["to"] for p in partitions if p["to"] is not None]
+    # Periods before the newest partition are never filled in: rows for
+    # them could not have been inserted anyway
+    start = max(max(uppers, default=current), current)
+    while start < horizon:
+        for statement in create_partition_sql(schema, table, start, policy.interval):
+            connection.exec_driver_sql(statement)
+        result["created"].append(partition_name(table, start, policy.interval))
+        start = advance(start, policy.interval)
+
+    if policy.retention is not None:
+        cutoff = advance(current, policy.interval, -policy.retention)
+        for partition in partitions:
+            if partition["detach_pending"] or partition["to"] is None or partition["to"] > cutoff:
+                continue
+            name = partition["name"]
+            # Long-lived rows (such as remembered sessions, or the whole
+            # _legacy partition) outlive the period they were created in
+            if policy.expires and not _all_expired(connection, schema, name, policy.expires):
+                result["kept"].append(name)
+                continue
+            connection.exec_driver_sql(
+                f'ALTER TABLE "{schema}"."{table}" DETACH PARTITION "{schema}"."{name}"'
+                + (" CONCURRENTLY" if concurrently else "")
+            )
+            result["detached"].append(name)
+            if settings.PARTITION_DROP_EXPIRED:
+                connection.exec_driver_sql(f'DROP TABLE "{schema}"."{name}"')
+                result["dropped"].append(name)
+    return result
+
+
+def maintain_partitions(connectable: Engine, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Create upcoming and remove expired partitions of one database"""
+    now = now or datetime.now(timezone.utc)
+    results = []
+    # DETACH ... CONCURRENTLY cannot run inside a transaction block
+    with connectable.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # Session-wide, there is no transaction to scope it to; reset
+        # before the connection goes back to the pool
+        connection.exec_driver_sql(f"SET lock_timeout = {int(settings.MIGRATION_LOCK_TIMEOUT_MS)}")
+        try:
+            for qualified, policy in policies().items():
+                try:
+                    result = _maintain_table(connection, qualified, policy, now)
+                except Exception as e:
+                    logger.error(f"Partition maintenance of {qualified} failed: {str(e)}")
+                    result = {"table": qualified, "error": str(e)}
+                if result is not None:
+                    results.append(result)
+        finally:
+            connection.exec_driver_sql("RESET lock_timeout")
+    return results
+
+
+def list_partitions(connectable: Optional[Engine] = None) -> List[Dict[str, Any]]:
+    """Partitioned tables of a database and their partitions"""
+    connectable = connectable or master_engine
+    tables = []
+    with connectable.connect() as connection:
+        for qualified, policy in policies().items():
+            schema, table = qualified.split(".")
+            if not _is_partitioned(connection, schema, table):
+                continue
+            tables.append({
+                "table": qualified,
+                "column": policy.column,
+                "interval": policy.interval,
+                "retention": policy.retention,
+                "partitions": [_describe(p) for p in _partitions(connection, schema, table)],
+            })
+    return tables
+
+
+def maintain_partitions_job(job: Job, names: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Job entry point for ``/api/partitions/maintain`` and the periodic maintenance"""
+    targets = select_targets(names)
+    results: Dict[str, Any] = {}
+    for index, (name, url) in enumerate(targets.items()):
+        connectable = master_engine if name == MASTER_TARGET else create_engine(url, poolclass=NullPool)
+        try:
+            results[name] = maintain_partitions(connectable)
+        except Exception as e:
+            logger.error(f"Partition maintenance on {name} failed: {str(e)}")
+            results[name] = {"error": str(e)}
+        finally:
+            if connectable is not master_engine:
+                connectable.dispose()
+        outcome = results[name]
+        if isinstance(outcome, dict):
+            job.log(f"{name}: failed: {outcome['error']}", stream="partitions")
+        else:
+            for table in outcome:
+                if "error" in table:
+                    job.log(f"{name}: {table['table']} failed: {table['error']}", stream="partitions")
+                elif table["created"] or table["detached"]:
+                    job.log(
+                        f"{name}: {table['table']} created {len(table['created'])}, "
+                        f"detached {len(table['detached'])}, dropped {len(table['dropped'])} partitions",
+                        stream="partitions"
+                    )
+        job.update_progress((index + 1) / len(targets) * 100, f"{index + 1} of {len(targets)} databases done")
+    return {"targets": results}
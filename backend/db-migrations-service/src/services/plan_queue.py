@@ -0,0 +1,280 @@
+"""plans.plan_jobs as a work queue (revision 0006).
+
+Workers take jobs with ``FOR UPDATE SKIP LOCKED``, so concurrent workers
+never block on or hand out the same job. A dequeued job is leased to its
+worker until ``locked_until``; the worker extends the lease with heartbeats
+while it runs. A job whose lease expires is made visible again (or failed
+once it used up ``max_attempts``) by ``release_expired_leases``, and a
+failed attempt is retried after an exponential backoff.
+
+Every status or progress change is published by a trigger on the
+``plan_jobs`` channel; ``plan_job_notifier`` listens on it once and fans the
+notifications out to the streaming endpoints, so clients do not poll.
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import asyncpg
+import structlog
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from src.core.config import settings
+from src.core.database import master_engine
+from src.services.jobs import Job
+
+logger = structlog.get_logger()
+
+CHANNEL = "plan_jobs"
+
+FINAL_STATUSES = ("completed", "failed")
+
+FIELDS = (
+    "id", "plan_id", "teacher_id", "status", "progress", "result_data", "error_message", "attempts",
+    "max_attempts", "run_after", "locked_by", "locked_until", "started_at", "completed_at", "created_at", "updated_at",
+)
+COLUMNS = ", ".join(FIELDS)
+
+
+def _job(row) -> Dict[str, Any]:
+    job = dict(row._mapping)
+    for key, value in job.items():
+        if hasattr(value, "isoformat"):
+            job[key] = value.isoformat()
+        elif key in ("id", "plan_id", "teacher_id") and value is not None:
+            job[key] = str(value)
+    return job
+
+
+def enqueue(teacher_id: str, plan_id: Optional[str] = None, max_attempts: Optional[int] = None) -> Dict[str, Any]:
+    with master_engine.begin() as connection:
+        row = connection.execute(
+            text(
+                "INSERT INTO plans.plan_jobs (teacher_id, plan_id, max_attempts) "
+                f"VALUES (:teacher_id, :plan_id, :max_attempts) RETURNING {COLUMNS}"
+            ),
+            {
+                "teacher_id": teacher_id,
+                "plan_id": plan_id,
+                "max_attempts": max_attempts or settings.PLAN_QUEUE_MAX_ATTEMPTS,
+            }
+        ).one()
+    return _job(row)
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with master_engine.connect() as connection:
+        row = connection.execute(
+            text(f"SELECT {COLUMNS} FROM plans.plan_jobs WHERE id = :id"), {"id": job_id}
+        ).first()
+    return _job(row) if row else None
+
+
+def list_active_jobs(teacher_id: str) -> List[Dict[str, Any]]:
+    """Jobs of a teacher that are not finished yet"""
+    with master_engine.connect() as connection:
+        rows = connection.execute(
+            text(
+                f"SELECT {COLUMNS} FROM plans.plan_jobs "
+                "WHERE teacher_id = :teacher_id AND status NOT IN ('completed', 'failed') ORDER BY created_at"
+            ),
+            {"teacher_id": teacher_id}
+        ).all()
+    return [_job(row) for row in rows]
+
+
+def dequeue(worker_id: str, limit: int = 1, lease_seconds: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Lease up to ``limit`` pending jobs to a worker, oldest first"""
+    lease_seconds = lease_seconds or settings.PLAN_QUEUE_LEASE_SECONDS
+    with master_engine.begin() as connection:
+        rows = connection.execute(
+            text(
+                # Served by idx_plan_jobs_pending; rows another worker is
+                # taking right now are skipped instead of waited for
+                "WITH next AS ("
+                "  SELECT id FROM plans.plan_jobs"
+                "  WHERE status = 'pending' AND run_after <= now()"
+                "  ORDER BY created_at LIMIT :limit FOR UPDATE SKIP LOCKED"
+                ") "
+                "UPDATE plans.plan_jobs j SET status = 'processing', attempts = j.attempts + 1, "
+                "locked_by = :worker_id, locked_until = now() + make_interval(secs => :lease_seconds), "
+                "started_at = coalesce(j.started_at, now()), updated_at = now() "
+                f"FROM next WHERE j.id = next.id RETURNING {', '.join(f'j.{field}' for field in FIELDS)}"
+            ),
+            {"limit": limit, "worker_id": worker_id, "lease_seconds": lease_seconds}
+        ).all()
+    return sorted((_job(row) for row in rows), key=lambda job: job["created_at"])
+
+
+def _update_leased(job_id: str, worker_id: str, assignments: str, **params) -> Optional[Dict[str, Any]]:
+    """Update a job only while ``worker_id`` still holds its lease"""
+    with master_engine.begin() as connection:
+        row = connection.execute(
+            text(
+                f"UPDATE plans.plan_jobs SET {assignments}, updated_at = now() "
+                "WHERE id = :id AND status = 'processing' AND locked_by = :worker_id AND locked_until > now() "
+                f"RETURNING {COLUMNS}"
+            ),
+            {"id": job_id, "worker_id": worker_id, **params}
+        ).first()
+    return _job(row) if row else None
+
+
+def heartbeat(
+    job_id: str,
+    worker_id: str,
+    progress: Optional[int] = None,
+    lease_seconds: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """Extend the lease and optionally record progress; None once the lease is lost"""
+    return _update_leased(
+        job_id,
+        worker_id,
+        "locked_until = now() + make_interval(secs => :lease_seconds), progress = coalesce(:progress, progress)",
+        progress=progress,
+        lease_seconds=lease_seconds or settings.PLAN_QUEUE_LEASE_SECONDS,
+    )
+
+
+def complete(job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    return _update_leased(
+        job_id,
+        worker_id,
+        "status = 'completed', progress = 100, result_data = CAST(:result AS jsonb), error_message = NULL, "
+        "locked_by = NULL, locked_until = NULL, completed_at = now()",
+        result=json.dumps(result) if result is not None else None,
+    )
+
+
+def fail(job_id: str, worker_id: str, error: str) -> Optional[Dict[str, Any]]:
+    """Give the job back for a retry after a backoff, or fail it after its last attempt"""
+    return _update_leased(
+        job_id,
+        worker_id,
+        "status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+        "run_after = now() + make_interval(secs => least(:backoff * power(2, attempts - 1), :backoff_max)), "
+        "completed_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END, "
+        "error_message = :error, locked_by = NULL, locked_until = NULL",
+        error=error,
+        backoff=settings.PLAN_QUEUE_RETRY_BACKOFF_SECONDS,
+        backoff_max=settings.PLAN_QUEUE_RETRY_BACKOFF_MAX_SECONDS,
+    )
+
+
+def release_expired_leases(job: Optional[Job] = None) -> Dict[str, Any]:
+    """Make jobs whose worker stopped heartbeating visible again.
+
+    Also the entry point of the periodic ``plan_queue_reaper`` job.
+    """
+    with master_engine.begin() as connection:
+        leases = connection.execute(text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_schema = 'plans' AND table_name = 'plan_jobs' AND column_name = 'locked_until'"
+        )).scalar()
+        if not leases:
+            # Revision 0006 is not applied yet
+            return {"released": 0, "failed": 0}
+        rows = connection.execute(
+            text(
+                "UPDATE plans.plan_jobs SET "
+                "status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+                "completed_at = CASE WHEN attempts < max_attempts THEN NULL ELSE now() END, "
+                "error_message = 'Lease of ' || locked_by || ' expired', "
+                "run_after = now(), locked_by = NULL, locked_until = NULL, updated_at = now() "
+                "WHERE status = 'processing' AND locked_until < now() "
+                "RETURNING id, status"
+            )
+        ).all()
+    released = sum(1 for row in rows if row.status == "pending")
+    failed = len(rows) - released
+    if rows:
+        logger.warning(f"Released {released} plan jobs with an expired lease, failed {failed}")
+    return {"released": released, "failed": failed}
+
+
+class PlanJobNotifier:
+    """One LISTEN connection on the master database shared by every subscriber"""
+
+    def __init__(self):
+        self._connection: Optional[asyncpg.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._subscribers: Set[Tuple[asyncio.Queue, Optional[str], Optional[str]]] = set()
+
+    def _dsn(self) -> str:
+        # asyncpg takes a libpq style URL, without the SQLAlchemy driver
+        return make_url(settings.MASTER_DATABASE_URL).set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+
+    async def _ensure_listening(self) -> None:
+        async with self._connect_lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            self._connection = await asyncpg.connect(self._dsn())
+            self._connection.add_termination_listener(self._on_terminated)
+            await self._connection.add_listener(CHANNEL, self._on_notification)
+            logger.info(f"Listening on {CHANNEL}")
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed {CHANNEL} notification")
+            return
+        for queue, job_id, teacher_id in list(self._subscribers):
+            if job_id and event.get("id") != job_id:
+                continue
+            if teacher_id and event.get("teacher_id") != teacher_id:
+                continue
+            if queue.full():
+                # A slow client only misses intermediate progress
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _on_terminated(self, connection) -> None:
+        logger.warning(f"LISTEN connection on {CHANNEL} lost")
+        self._connection = None
+        # Subscribers reconnect on their next wait
+        for queue, _, _ in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait({"type": "reconnect"})
+
+    @asynccontextmanager
+    async def subscribe(
+        self,
+        job_id: Optional[str] = None,
+        teacher_id: Optional[str] = None,
+    ) -> AsyncIterator[AsyncIterator[Dict[str, Any]]]:
+        """Changes of a job, of a teacher's jobs, or of every job.
+
+        Notifications are buffered from the moment the context is entered,
+        so a snapshot read inside it cannot miss a change.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.PLAN_QUEUE_SUBSCRIBER_BUFFER)
+        subscriber = (queue, job_id, teacher_id)
+        self._subscribers.add(subscriber)
+        try:
+            await self._ensure_listening()
+            yield self._events(queue)
+        finally:
+            self._subscribers.discard(subscriber)
+
+    async def _events(self, queue: asyncio.Queue) -> AsyncIterator[Dict[str, Any]]:
+        while True:
+            event = await queue.get()
+            if event.get("type") == "reconnect":
+                # Changes made meanwhile were missed; the consumer re-reads
+                await asyncio.sleep(settings.PLAN_QUEUE_RECONNECT_SECONDS)
+                await self._ensure_listening()
+            yield event
+
+    async def close(self) -> None:
+        if self._connection is not None and not self._connection.is_closed():
+            await self._connection.close()
+        self._connection = None
+
+
+plan_job_notifier = PlanJobNotifier()
@@ -0,0 +1,262 @@
+"""Fast provisioning of databases at head.
+
+Two shortcuts over replaying every revision:
+
+- Baselines: the offline SQL of the revisions from base up to a revision,
+  compiled once into ``MIGRATION_BASELINES_PATH/<revision>.sql``. An empty
+  database runs the newest baseline in a single round trip (it stamps the
+  version table itself) and only the later revisions through Alembic.
+  Revisions with an ``autocommit_block`` (concurrent indexes, partitioning)
+  and everything after them stay out of baselines: their offline SQL
+  depends on the live database and on when it was rendered.
+- Template: a database kept at head and flagged as a template. New
+  databases are created from it with ``CREATE DATABASE ... TEMPLATE``,
+  a file-level copy that takes about a second regardless of the revisions.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+import structlog
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import NullPool
+
+from src.core.config import settings
+from src.services import database_admin
+from src.services.jobs import Job
+from src.services.migration_engine import migration_engine
+from src.services.migration_planner import REVISION_MARKER
+
+logger = structlog.get_logger()
+
+# PostgreSQL identifiers are limited to 63 bytes
+DATABASE_NAME = re.compile(r"^[a-z0-9_]{1,63}$")
+
+# Template refreshes and clones must not interleave
+_template_lock = threading.Lock()
+
+
+def _baseline_path(key: str) -> str:
+    return os.path.join(settings.MIGRATION_BASELINES_PATH, f"{key}.sql")
+
+
+def _autocommit_revisions(sql: str) -> Set[str]:
+    """Revisions whose offline SQL leaves the transaction (``autocommit_block``)"""
+    revisions: Set[str] = set()
+    current, committed = None, False
+    for chunk in sql.split("\n\n"):
+        stripped = chunk.strip()
+        marker = REVISION_MARKER.match(stripped)
+        if marker:
+            current, committed = marker.group(3), False
+        elif current is None or not stripped:
+            continue
+        elif stripped == "COMMIT;":
+            committed = True
+        elif committed and stripped != "BEGIN;":
+            revisions.add(current)
+    return revisions
+
+
+def _independent_heads(revisions: Set[str]) -> List[str]:
+    """Revisions of the set not implied by another one"""
+    return sorted(
+        head for head in revisions
+        if not any(head in migration_engine.applied_revisions((other,)) for other in revisions - {head})
+    )
+
+
+def create_baseline(revision: str) -> Dict[str, Any]:
+    """Compile the revisions from base up to ``revision`` into a baseline.
+
+    ``revision`` may name several heads (``heads``); the baseline is keyed by
+    the ones that are not implied by the others, joined with ``+``. It stops
+    before the first revision that needs autocommit on each branch.
+    """
+    heads = _independent_heads({rev.revision for rev in migration_engine.script.get_revisions(revision)})
+    covered = migration_engine.applied_revisions(tuple(heads))
+    # One transaction for the whole script, so a failed baseline leaves the database empty
+    sql = migration_engine.render_sql(tuple(heads), online=False)
+    skipped = _autocommit_revisions(sql)
+    if skipped:
+        # A revision is kept only when none of its ancestors was skipped either
+        kept = {rev for rev in covered if not migration_engine.applied_revisions((rev,)) & skipped}
+        if not kept:
+            raise ValueError(f"Every revision up to {revision} needs autocommit and cannot be compiled into a baseline")
+        heads = _independent_heads(kept)
+        sql = migration_engine.render_sql(tuple(heads), online=False)
+        logger.info(f"Baseline stops at {', '.join(heads)}; {len(covered - kept)} later revisions run through Alembic")
+    os.makedirs(settings.MIGRATION_BASELINES_PATH, exist_ok=True)
+    key = "+".join(heads)
+    path = _baseline_path(key)
+    header = (
+        f"-- Baseline: revisions from base to {', '.join(heads)}, generated "
+        f"{datetime.now(timezone.utc).isoformat()}\n"
+        "-- Regenerate with POST /api/migrations/baselines instead of editing.\n\n"
+    )
+    # Written aside and renamed so a reader never sees a partial file
+    with open(f"{path}.tmp", "w") as f:
+        f.write(header + sql)
+    os.replace(f"{path}.tmp", path)
+    logger.info(f"Created baseline {path}")
+    return _describe_baseline(key)
+
+
+def _describe_baseline(key: str) -> Dict[str, Any]:
+    path = _baseline_path(key)
+    stat = os.stat(path)
+    return {
+        "revision": key,
+        "heads": key.split("+"),
+        "path": path,
+        "size": stat.st_size,
+        "created_at": datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+    }
+
+
+def list_baselines() -> List[Dict[str, Any]]:
+    """Baselines of known revisions, the one covering fewest revisions first"""
+    if not os.path.isdir(settings.MIGRATION_BASELINES_PATH):
+        return []
+    known = {rev.revision for rev in migration_engine.ordered_revisions()}
+    covered = {}
+    for name in os.listdir(settings.MIGRATION_BASELINES_PATH):
+        key, extension = os.path.splitext(name)
+        if extension == ".sql" and set(key.split("+")) <= known:
+            covered[key] = len(migration_engine.applied_revisions(tuple(key.split("+"))))
+    return [_describe_baseline(key) for key in sorted(covered, key=lambda key: (covered[key], key))]
+
+
+def latest_baseline() -> Optional[str]:
+    baselines = list_baselines()
+    return baselines[-1]["revision"] if baselines else None
+
+
+def apply_baseline(connectable: Engine) -> Optional[str]:
+    """Run the newest baseline on an empty database; returns its revision"""
+    revision = latest_baseline()
+    if revision is None:
+        return None
+    with open(_baseline_path(revision)) as f:
+        sql = f.read()
+    # Compiled before autocommit revisions were left out: CREATE INDEX
+    # CONCURRENTLY cannot run in the script's implicit transaction block
+    if _autocommit_revisions(sql):
+        raise ValueError(f"Baseline {revision} contains revisions that need autocommit, regenerate it")
+    # The script carries its own BEGIN/COMMIT
+    with connectable.execution_options(isolation_level="AUTOCOMMIT").connect() as conn:
+        conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+    logger.info(f"Applied baseline {revision}")
+    return revision
+
+
+def _template_name() -> str:
+    return settings.PROVISION_TEMPLATE_DATABASE or f"{make_url(settings.MASTER_DATABASE_URL).database}_template"
+
+
+def _public_url(database: str) -> str:
+    return make_url(database_admin.database_url(database)).render_as_string(hide_password=True)
+
+
+def _migrate(url: str, job: Optional[Job] = None) -> Dict[str, Any]:
+    """Bring a database to head, starting from a baseline when it is empty"""
+    connectable = create_engine(url, poolclass=NullPool)
+    try:
+        baseline = None
+        if not migration_engine.current_heads(connectable):
+            baseline = apply_baseline(connectable)
+            if baseline and job is not None:
+                job.update_progress(30, f"Applied baseline {baseline}")
+    finally:
+        connectable.dispose()
+    status = migration_engine.upgrade_database(url)
+    return {"baseline": baseline, "current": status["current"], "heads": status["heads"]}
+
+
+def template_status() -> Dict[str, Any]:
+    template = _template_name()
+    status = {"template": template, "exists": database_admin.database_exists(template)}
+    if status["exists"]:
+        connectable = create_engine(database_admin.database_url(template), poolclass=NullPool)
+        try:
+            current = migration_engine.status(connectable)
+        finally:
+            connectable.dispose()
+        status.update(current=current["current"], heads=current["heads"], up_to_date=current["up_to_date"])
+    else:
+        status.update(current=[], heads=list(migration_engine.script.get_heads()), up_to_date=False)
+    return status
+
+
+def _refresh_template(job: Job) -> Dict[str, Any]:
+    template = _template_name()
+    created = not database_admin.database_exists(template)
+    if created:
+        database_admin.create_database(
+            template, owner=database_admin.database_owner(make_url(settings.MASTER_DATABASE_URL).database)
+        )
+    job.update_progress(10, f"Migrating template {template}")
+    result = _migrate(database_admin.database_url(template), job)
+    database_admin.set_template(template, True)
+    logger.info(f"Template {template} at {', '.join(result['current'])}")
+    return {"template": template, "created": created, **result}
+
+
+def refresh_template(job: Job) -> Dict[str, Any]:
+    """Job entry point: create the template if needed and upgrade it to head"""
+    with _template_lock:
+        return _refresh_template(job)
+
+
+def validate_database_name(name: str) -> None:
+    if not DATABASE_NAME.match(name) or not name.startswith(settings.PROVISION_DATABASE_PREFIX):
+        raise ValueError(
+            f"Database name must start with {settings.PROVISION_DATABASE_PREFIX!r} and contain "
+            f"only lowercase letters, digits and underscores (63 characters at most)"
+        )
+
+
+def provision_database(job: Job, name: str) -> Dict[str, Any]:
+    """Job entry point: clone the template, refreshing it first if it is behind head"""
+    validate_database_name(name)
+    if database_admin.database_exists(name):
+        raise ValueError(f"Database {name} already exists")
+    with _template_lock:
+        refreshed = None
+        if not template_status()["up_to_date"]:
+            job.update_progress(0, "Template behind head, refreshing it first")
+            refreshed = _refresh_template(job)
+        template = _template_name()
+        job.update_progress(90, f"Cloning {template} into {name}")
+        started = time.monotonic()
+        database_admin.create_database(
+            name,
+            owner=database_admin.database_owner(template),
+            template=template,
+        )
+        clone_seconds = time.monotonic() - started
+    logger.info(f"Provisioned {name} from {template} in {clone_seconds:.2f}s")
+    return {
+        "database": name,
+        "url": _public_url(name),
+        "template": template,
+        "template_refreshed": refreshed is not None,
+        "clone_seconds": round(clone_seconds, 3),
+    }
+
+
+def list_provisioned() -> List[str]:
+    return database_admin.list_databases(settings.PROVISION_DATABASE_PREFIX)
+
+
+def drop_provisioned(name: str) -> bool:
+    """Drop a provisioned database; others are never touched"""
+    validate_database_name(name)
+    if not database_admin.database_exists(name):
+        return False
+    database_admin.drop_database(name)
+    return True
@@ -0,0 +1,365 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import structlog
+
+from src.core.config import settings
+from src.core.metrics import BACKUP_BYTES, BACKUP_SIZE
+from src.services.backups import pg_connection
+from src.services.jobs import Job
+from src.utils.process import run_streaming
+
+logger = structlog.get_logger()
+
+# pg_basebackup --verbose / --progress output
+START_POINT_PATTERN = re.compile(r"write-ahead log start point: ([0-9A-F]+/[0-9A-F]+) on timeline (\d+)")
+END_POINT_PATTERN = re.compile(r"write-ahead log end point: ([0-9A-F]+/[0-9A-F]+)")
+PROGRESS_PATTERN = re.compile(r"\((\d+)%\)")
+LSN_PATTERN = re.compile(r"^[0-9A-Fa-f]{1,8}/[0-9A-Fa-f]{1,8}$")
+
+# Seconds to wait before restarting pg_receivewal after it exits
+RECEIVER_RESTART_DELAY = 5
+
+
+def wal_archive_path() -> str:
+    return os.path.join(settings.BACKUP_PATH, "wal")
+
+
+def base_backups_path() -> str:
+    return os.path.join(settings.BACKUP_PATH, "base")
+
+
+def parse_lsn(lsn: str) -> int:
+    """Convert an LSN such as 0/3000060 to an integer for comparisons"""
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class WalArchiver:
+    """Supervises pg_receivewal, which streams WAL into BACKUP_PATH/wal"""
+
+    def __init__(self):
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.restarts = 0
+        self.started_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def _create_slot(self) -> None:
+        args, env = pg_connection()
+        run_streaming(
+            ["pg_receivewal", *args, "--slot", settings.WAL_SLOT_NAME, "--create-slot", "--if-not-exists"],
+            lambda line: logger.info(f"pg_receivewal: {line}"),
+            env=env,
+        )
+
+    def _supervise(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._create_slot()
+                args, env = pg_connection()
+                cmd = [
+                    "pg_receivewal",
+                    *args,
+                    "-D", wal_archive_path(),
+                    "--slot", settings.WAL_SLOT_NAME,
+                    "--synchronous",
+                    "--verbose",
+                ]
+                self._process = subprocess.Popen(
+                    cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, text=True
+                )
+                for line in self._process.stdout:
+                    logger.info(f"pg_receivewal: {line.rstrip()}")
+                returncode = self._process.wait()
+                if not self._stop.is_set():
+                    self.last_error = f"pg_receivewal exited with code {returncode}"
+                    logger.warning(self.last_error)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"WAL archiving failed: {str(e)}")
+            if self._stop.wait(RECEIVER_RESTART_DELAY):
+                break
+            self.restarts += 1
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        os.makedirs(wal_archive_path(), exist_ok=True)
+        self._stop.clear()
+        self.started_at = datetime.now(timezone.utc)
+        self._thread = threading.Thread(target=self._supervise, name="wal-archiver", daemon=True)
+        self._thread.start()
+        logger.info("WAL archiving started")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._process and self._process.poll() is None:
+            self._process.terminate()
+        logger.info("WAL archiving stopped")
+
+    def status(self) -> Dict[str, Any]:
+        segments = []
+        partial = None
+        if os.path.isdir(wal_archive_path()):
+            for name in sorted(os.listdir(wal_archive_path())):
+                if name.endswith(".partial"):
+                    partial = name
+                elif len(name) == 24:
+                    segments.append(name)
+        return {
+            "enabled": settings.WAL_ARCHIVE_ENABLED,
+            "running": bool(self._process and self._process.poll() is None),
+            "pid": self._process.pid if self._process and self._process.poll() is None else None,
+            "slot": settings.WAL_SLOT_NAME,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "restarts": self.restarts,
+            "last_error": self.last_error,
+            "archived_segments": len(segments),
+            "oldest_segment": segments[0] if segments else None,
+            "latest_segment": segments[-1] if segments else None,
+            "partial_segment": partial,
+        }
+
+
+# Global archiver instance
+wal_archiver = WalArchiver()
+
+
+def list_base_backups() -> List[Dict[str, Any]]:
+    """Manifests of base backups, oldest first"""
+    manifests = []
+    if not os.path.isdir(base_backups_path()):
+        return manifests
+    for name in sorted(os.listdir(base_backups_path())):
+        manifest_path = os.path.join(base_backups_path(), name, "manifest.json")
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                manifests.append(json.load(f))
+    return manifests
+
+
+def _wal_file_name(timeline: Optional[int], lsn: Optional[str], segment_size: int = 16 * 1024 * 1024) -> Optional[str]:
+    """Name of the WAL segment containing ``lsn`` (default 16MB segments)"""
+    if timeline is None or lsn is None:
+        return None
+    position = parse_lsn(lsn)
+    segments_per_xlogid = 0x100000000 // segment_size
+    segment = position // segment_size
+    return f"{timeline:08X}{segment // segments_per_xlogid:08X}{segment % segments_per_xlogid:08X}"
+
+
+def _cleanup_wal(oldest_needed: str) -> None:
+    """Remove archived segments no restore from ``oldest_needed`` can use.
+
+    A segment name is the timeline followed by the segment number. Segments
+    before the oldest needed one are obsolete on every timeline; segments of
+    earlier timelines are too, since from there on recovery follows the
+    timeline of the base backup or its descendants. Timeline history files
+    are kept.
+    """
+    timeline, segment = oldest_needed[:8], oldest_needed[8:]
+    for name in os.listdir(wal_archive_path()):
+        if len(name) == 24 and (name[8:] < segment or name[:8] < timeline):
+            os.remove(os.path.join(wal_archive_path(), name))
+
+
+def _prune_base_backups() -> None:
+    """Keep BASE_BACKUP_KEEP base backups and the WAL needed to roll them forward"""
+    manifests = list_base_backups()
+    for manifest in manifests[:-settings.BASE_BACKUP_KEEP]:
+        shutil.rmtree(os.path.join(base_backups_path(), manifest["backup_id"]), ignore_errors=True)
+        logger.info(f"Removed expired base backup {manifest['backup_id']}")
+
+    remaining = list_base_backups()
+    if remaining and remaining[0].get("start_wal_file") and os.path.isdir(wal_archive_path()):
+        _cleanup_wal(remaining[0]["start_wal_file"])
+
+
+def create_base_backup(job: Job, label: str = "profe base backup") -> Dict[str, Any]:
+    """Take a compressed tar base backup with pg_basebackup"""
+    backup_id = f"base_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    backup_path = os.path.join(base_backups_path(), backup_id)
+    os.makedirs(backup_path)
+
+    args, env = pg_connection()
+    cmd = [
+        "pg_basebackup",
+        *args,
+        "-D", backup_path,
+        "-F", "t",
+        "-z",
+        "-X", "stream",
+        "-c", "fast",
+        "-l", label,
+        "--progress",
+        "--verbose",
+    ]
+
+    info: Dict[str, Any] = {}
+
+    def on_line(line: str) -> None:
+        job.log(line)
+        start = START_POINT_PATTERN.search(line)
+        if start:
+            info["start_lsn"], info["timeline"] = start.group(1), int(start.group(2))
+        end = END_POINT_PATTERN.search(line)
+        if end:
+            info["end_lsn"] = end.group(1)
+        progress = PROGRESS_PATTERN.search(line)
+        if progress:
+            job.update_progress(min(float(progress.group(1)), 99.0))
+
+    logger.info(f"Creating base backup: {backup_id}")
+    job.update_progress(0, f"Base backup {backup_id}")
+    started_at = datetime.now(timezone.utc)
+
+    try:
+        run_streaming(cmd, on_line, env=env, cwd=settings.BACKUP_PATH)
+    except Exception:
+        shutil.rmtree(backup_path, ignore_errors=True)
+        raise
+
+    manifest = {
+        "backup_id": backup_id,
+        "label": label,
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "start_lsn": info.get("start_lsn"),
+        "end_lsn": info.get("end_lsn"),
+        "timeline": info.get("timeline"),
+        "start_wal_file": _wal_file_name(info.get("timeline"), info.get("start_lsn")),
+        "size_bytes": sum(
+            os.path.getsize(os.path.join(backup_path, name)) for name in os.listdir(backup_path)
+        ),
+    }
+    with open(os.path.join(backup_path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    BACKUP_BYTES.labels(direction="written", format="base").inc(manifest["size_bytes"])
+    BACKUP_SIZE.labels(format="base").observe(manifest["size_bytes"])
+
+    _prune_base_backups()
+    return manifest
+
+
+def select_base_backup(
+    target_time: Optional[datetime] = None,
+    target_lsn: Optional[str] = None,
+    base_backup_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Newest base backup that finished before the recovery target"""
+    manifests = list_base_backups()
+    if base_backup_id:
+        for manifest in manifests:
+            if manifest["backup_id"] == base_backup_id:
+                return manifest
+        raise ValueError(f"Base backup {base_backup_id} not found")
+
+    candidates = []
+    for manifest in manifests:
+        if target_lsn:
+            if manifest.get("end_lsn") and parse_lsn(manifest["end_lsn"]) <= parse_lsn(target_lsn):
+                candidates.append(manifest)
+        elif target_time:
+            finished_at = datetime.fromisoformat(manifest["finished_at"])
+            if target_time.tzinfo is None:
+                target_time = target_time.replace(tzinfo=timezone.utc)
+            if finished_at <= target_time:
+                candidates.append(manifest)
+    if not candidates:
+        raise ValueError("No base backup finished before the recovery target")
+    return candidates[-1]
+
+
+def _hand_over_data_dir(data_dir: str) -> None:
+    """Give the data directory to the postgres user with the modes it requires"""
+    uid, gid = settings.PITR_DATA_OWNER_UID, settings.PITR_DATA_OWNER_GID
+    for root, directories, files in os.walk(data_dir):
+        os.chown(root, uid, gid)
+        os.chmod(root, 0o700)
+        for name in directories:
+            # os.walk does not descend into symlinked directories
+            path = os.path.join(root, name)
+            if os.path.islink(path):
+                os.lchown(path, uid, gid)
+        for name in files:
+            path = os.path.join(root, name)
+            os.lchown(path, uid, gid)
+            if not os.path.islink(path):
+                os.chmod(path, 0o600)
+
+
+def restore_pitr(
+    job: Job,
+    target_time: Optional[datetime] = None,
+    target_lsn: Optional[str] = None,
+    base_backup_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Prepare a data directory that recovers to the target time or LSN.
+
+    The base backup is unpacked into PITR_RESTORE_PATH with recovery.signal
+    and a restore_command reading the WAL archive. A PostgreSQL server
+    started on that directory replays WAL up to the target and promotes.
+    """
+    if target_time is not None and target_time.tzinfo is None:
+        target_time = target_time.replace(tzinfo=timezone.utc)
+    manifest = select_base_backup(target_time, target_lsn, base_backup_id)
+    restore_id = f"pitr_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    data_dir = os.path.join(settings.PITR_RESTORE_PATH, restore_id)
+    backup_path = os.path.join(base_backups_path(), manifest["backup_id"])
+    os.makedirs(data_dir, mode=0o700)
+
+    job.update_progress(0, f"Unpacking base backup {manifest['backup_id']}")
+    # The "data" filter refuses members that would land outside data_dir
+    with tarfile.open(os.path.join(backup_path, "base.tar.gz")) as archive:
+        archive.extractall(data_dir, filter="data")
+
+    wal_dir = os.path.join(data_dir, "pg_wal")
+    os.makedirs(wal_dir, exist_ok=True)
+    streamed_wal = os.path.join(backup_path, "pg_wal.tar.gz")
+    if os.path.exists(streamed_wal):
+        with tarfile.open(streamed_wal) as archive:
+            archive.extractall(wal_dir, filter="data")
+    job.update_progress(70, "Base backup unpacked")
+
+    # The segment pg_receivewal is still writing is only available as .partial
+    status = wal_archiver.status()
+    if status["partial_segment"]:
+        shutil.copy(
+            os.path.join(wal_archive_path(), status["partial_segment"]),
+            os.path.join(wal_dir, status["partial_segment"][:-len(".partial")])
+        )
+
+    recovery_settings = [
+        f"restore_command = 'cp {settings.WAL_RESTORE_SOURCE_PATH}/%f %p'",
+        "recovery_target_action = 'promote'",
+        "recovery_target_inclusive = true",
+    ]
+    if target_lsn:
+        recovery_settings.append(f"recovery_target_lsn = '{target_lsn}'")
+    else:
+        recovery_settings.append(f"recovery_target_time = '{target_time.isoformat()}'")
+
+    with open(os.path.join(data_dir, "postgresql.auto.conf"), "a") as f:
+        f.write("\n# Point-in-time recovery generated by the migration service\n")
+        f.write("\n".join(recovery_settings) + "\n")
+    open(os.path.join(data_dir, "recovery.signal"), "w").close()
+    _hand_over_data_dir(data_dir)
+
+    logger.info(f"Prepared PITR data directory {data_dir} from {manifest['backup_id']}")
+    return {
+        "restore_id": restore_id,
+        "data_directory": data_dir,
+        "base_backup_id": manifest["backup_id"],
+        "target_time": target_time.isoformat() if target_time else None,
+        "target_lsn": target_lsn,
+        "recovery_settings": recovery_settings,
+    }
@@ -0,0 +1,339 @@
+"""Lock-friendly operations for revisions that touch tables under load.
+
+Use from a revision the same way as ``op``::
+
+    from src.utils.migration_ops import create_index_concurrently
+
+    def upgrade() -> None:
+        create_index_concurrently('idx_plans_status', 'plans', ['status'], schema='plans')
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence
+
+from alembic import op
+from sqlalchemy import text
+
+from src.core.config import settings
+from src.services import partitions
+from src.services.backfill import database_key, qualified_name, reset_backfill, run_backfill
+
+
+def _invalid_index_exists(index_name: str, schema: Optional[str]) -> bool:
+    """An index left INVALID by an interrupted CREATE INDEX CONCURRENTLY"""
+    return bool(op.get_bind().execute(
+        text(
+            "SELECT 1 FROM pg_catalog.pg_index i "
+            "JOIN pg_catalog.pg_class c ON c.oid = i.indexrelid "
+            "JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE c.relname = :index_name AND n.nspname = :schema AND NOT i.indisvalid"
+        ),
+        {"index_name": index_name, "schema": schema or "public"}
+    ).scalar())
+
+
+def _partitions_of(table_name: str, schema: Optional[str]) -> Optional[List[str]]:
+    """Partitions of a partitioned table, None for a plain table"""
+    rows = op.get_bind().execute(
+        text(
+            "SELECT c.relname, p.partrelid IS NOT NULL AS partitioned "
+            "FROM pg_catalog.pg_class t "
+            "LEFT JOIN pg_catalog.pg_partitioned_table p ON p.partrelid = t.oid "
+            "LEFT JOIN pg_catalog.pg_inherits i ON i.inhparent = t.oid "
+            "LEFT JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid "
+            "WHERE t.oid = to_regclass(:table)"
+        ),
+        {"table": f'"{schema or "public"}"."{table_name}"'}
+    ).all()
+    if not rows or not rows[0].partitioned:
+        return None
+    return [row.relname for row in rows if row.relname is not None]
+
+
+def _is_partitioned_index(index_name: str, schema: Optional[str]) -> bool:
+    return bool(op.get_bind().execute(
+        text("SELECT 1 FROM pg_catalog.pg_class WHERE oid = to_regclass(:index) AND relkind = 'I'"),
+        {"index": f'"{schema or "public"}"."{index_name}"'}
+    ).scalar())
+
+
+def create_index_concurrently(
+    index_name: str,
+    table_name: str,
+    columns: Sequence[str],
+    schema: Optional[str] = None,
+    unique: bool = False,
+    **kw,
+) -> None:
+    """CREATE INDEX CONCURRENTLY, outside the revision's transaction.
+
+    Writes to the table keep flowing while the index builds. A previous
+    attempt that failed (lock timeout, deadlock) leaves an invalid index
+    behind, which is dropped first so the revision can simply be retried.
+
+    A partitioned table cannot be indexed concurrently as a whole: the index
+    is created ``ON ONLY`` the partitioned table, built concurrently on each
+    partition and attached. Partitions created later get it on ATTACH.
+    """
+    context = op.get_context()
+    with context.autocommit_block():
+        # Offline (--sql) runs have no connection to inspect
+        partition_names = None if context.as_sql else _partitions_of(table_name, schema)
+        if partition_names is not None:
+            _create_partitioned_index(index_name, table_name, columns, schema, unique, partition_names, **kw)
+            return
+        if not context.as_sql and _invalid_index_exists(index_name, schema):
+            op.drop_index(index_name, table_name, schema=schema, postgresql_concurrently=True, if_exists=True)
+        op.create_index(
+            index_name,
+            table_name,
+            columns,
+            schema=schema,
+            unique=unique,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+            **kw
+        )
+
+
+def _create_partitioned_index(
+    index_name: str,
+    table_name: str,
+    columns: Sequence[str],
+    schema: Optional[str],
+    unique: bool,
+    partition_names: List[str],
+    postgresql_using: Optional[str] = None,
+    postgresql_where=None,
+) -> None:
+    schema = schema or "public"
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    using = f" USING {postgresql_using}" if postgresql_using else ""
+    where = f" WHERE {postgresql_where}" if postgresql_where is not None else ""
+    # Stays invalid until every partition has its index attached
+    op.execute(
+        f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{index_name}" '
+        f'ON ONLY "{schema}"."{table_name}"{using} ({column_list}){where}'
+    )
+    for partition in partition_names:
+        child = f"{partition}_{index_name}"[:63]
+        if _invalid_index_exists(child, schema):
+            op.drop_index(child, partition, schema=schema, postgresql_concurrently=True, if_exists=True)
+        op.create_index(
+            child,
+            partition,
+            columns,
+            schema=schema,
+            unique=unique,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+            postgresql_using=postgresql_using,
+            postgresql_where=postgresql_where,
+        )
+        # A no-op when a previous attempt attached it already
+        op.execute(f'ALTER INDEX "{schema}"."{index_name}" ATTACH PARTITION "{schema}"."{child}"')
+
+
+def drop_index_concurrently(index_name: str, table_name: Optional[str] = None, schema: Optional[str] = None) -> None:
+    """DROP INDEX CONCURRENTLY, outside the revision's transaction.
+
+    The index of a partitioned table cannot be dropped concurrently; it is
+    dropped, with the indexes of its partitions, by a plain DROP INDEX.
+    """
+    context = op.get_context()
+    with context.autocommit_block():
+        concurrently = context.as_sql or not _is_partitioned_index(index_name, schema)
+        op.drop_index(index_name, table_name, schema=schema, postgresql_concurrently=concurrently, if_exists=True)
+
+
+def backfill(
+    name: str,
+    table_name: str,
+    set_clause: str,
+    where: Optional[str] = None,
+    schema: Optional[str] = None,
+    key: str = "id",
+    batch_size: Optional[int] = None,
+    sleep_seconds: Optional[float] = None,
+) -> None:
+    """Batched, resumable ``UPDATE table SET set_clause WHERE where``.
+
+    Rows are updated in primary key ranges of ``batch_size`` (default
+    BACKFILL_BATCH_SIZE), each committed outside the revision's transaction
+    and followed by a ``sleep_seconds`` pause (default BACKFILL_SLEEP_SECONDS).
+    The checkpoint is kept under ``name`` and the database being upgraded in
+    the migrations database, so a retried upgrade resumes where it stopped. ``set_clause`` must be
+    idempotent; see ``src.services.backfill.run_backfill``. Give the backfill
+    a revision of its own: whatever ran before it in the revision is
+    committed when the batches start::
+
+        backfill(
+            'plan_results_completion', 'plan_results',
+            'completion_percentage = 100', where='completed_at IS NOT NULL',
+            schema='plans'
+        )
+    """
+    context = op.get_context()
+    table = qualified_name(context.dialect, table_name, schema)
+    if context.as_sql:
+        # Offline (--sql) output shows the work as a single statement
+        op.execute(f"UPDATE {table} SET {set_clause}" + (f" WHERE {where}" if where else ""))
+        return
+    with context.autocommit_block():
+        run_backfill(
+            op.get_bind(),
+            name,
+            table,
+            set_clause,
+            where=where,
+            key=key,
+            batch_size=batch_size,
+            sleep_seconds=sleep_seconds,
+        )
+
+
+def reset_backfill_checkpoint(name: str) -> None:
+    """Forget a backfill's progress on this database, typically from the revision's downgrade()"""
+    if not op.get_context().as_sql:
+        reset_backfill(name, database_key(op.get_bind()))
+
+
+def partition_by_range(
+    table_name: str,
+    column: str,
+    schema: str,
+    interval: str = "month",
+    primary_key: Sequence[str] = ("id",),
+) -> None:
+    """Turn a table into one range-partitioned on ``column``.
+
+    The existing table becomes the ``<table>_legacy`` partition, holding
+    every row up to the end of the next period, and partitions for the
+    following ``PARTITION_PREMAKE`` periods are created; from then on
+    ``src.services.partitions`` keeps them ahead and expires old ones. The
+    primary key gains ``column``, indexes and foreign keys are recreated on
+    the partitioned table under their names.
+
+    The slow parts run concurrently first: the ``(primary key, column)``
+    unique index is built with CREATE INDEX CONCURRENTLY and the bound of
+    the legacy partition is validated as a CHECK constraint, so the swap
+    itself only renames, creates and attaches. Tables referenced by foreign
+    keys cannot be converted (the referenced key would change)::
+
+        partition_by_range('sessions', 'created_at', schema='auth')
+    """
+    now = datetime.now(timezone.utc)
+    bound = partitions.advance(partitions.period_start(now, interval), interval, 2)
+    key = list(primary_key) + ([column] if column not in primary_key else [])
+    check = f"{table_name}_partition_bound"
+    table = f'"{schema}"."{table_name}"'
+    legacy = f"{table_name}_legacy"
+
+    create_index_concurrently(f"{table_name}_partition_key", table_name, key, schema=schema, unique=True)
+    with op.get_context().autocommit_block():
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check}")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {check} "
+            f"CHECK ({column} < {partitions.literal(bound)}) NOT VALID"
+        )
+        # Scans the table without blocking writes
+        op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+
+    op.execute(f"""
+        DO $partition$
+        DECLARE
+            existing regclass := '{table}'::regclass;
+            pk_name text;
+            definitions text[];
+            statement text;
+            r record;
+        BEGIN
+            SELECT conname INTO pk_name FROM pg_constraint WHERE conrelid = existing AND contype = 'p';
+            -- Indexes (besides constraints) and foreign keys, to recreate on the partitioned table
+            SELECT coalesce(array_agg(pg_get_indexdef(i.indexrelid)), '{{}}') INTO definitions
+            FROM pg_index i
+            WHERE i.indrelid = existing
+              AND i.indexrelid <> '"{schema}"."{table_name}_partition_key"'::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid);
+            SELECT definitions || coalesce(array_agg(
+                format('ALTER TABLE {table} ADD CONSTRAINT %I %s', conname, pg_get_constraintdef(oid))
+            ), '{{}}') INTO definitions
+            FROM pg_constraint WHERE conrelid = existing AND contype = 'f';
+
+            -- Free the index names for the partitioned table
+            FOR r IN
+                SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE i.indrelid = existing AND c.relname <> '{table_name}_partition_key'
+            LOOP
+                EXECUTE format('ALTER INDEX "{schema}".%I RENAME TO %I', r.relname, left(r.relname, 56) || '_legacy');
+            END LOOP;
+            ALTER TABLE {table} RENAME TO "{legacy}";
+
+            CREATE TABLE {table} (
+                LIKE "{schema}"."{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+            ) PARTITION BY RANGE ("{column}");
+            ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {check};
+            EXECUTE format('ALTER TABLE {table} ADD CONSTRAINT %I PRIMARY KEY ({", ".join(key)})', pk_name);
+            FOREACH statement IN ARRAY definitions LOOP
+                EXECUTE statement;
+            END LOOP;
+
+            -- The concurrently built index becomes the legacy primary key, which
+            -- the partitioned table's primary key adopts on ATTACH
+            EXECUTE format(
+                'ALTER TABLE "{schema}"."{legacy}" DROP CONSTRAINT %I',
+                (SELECT conname FROM pg_constraint WHERE conrelid = existing AND contype = 'p')
+            );
+            ALTER TABLE "{schema}"."{legacy}" ADD CONSTRAINT "{legacy}_pkey" PRIMARY KEY USING INDEX "{table_name}_partition_key";
+            -- The validated CHECK constraint spares ATTACH its scan
+            ALTER TABLE {table} ATTACH PARTITION "{schema}"."{legacy}" FOR VALUES FROM (MINVALUE) TO ({partitions.literal(bound)});
+            ALTER TABLE "{schema}"."{legacy}" DROP CONSTRAINT {check};
+        END
+        $partition$
+    """)
+
+    start = bound
+    for _ in range(settings.PARTITION_PREMAKE):
+        for statement in partitions.create_partition_sql(schema, table_name, start, interval):
+            op.execute(statement)
+        start = partitions.advance(start, interval)
+
+
+def unpartition(table_name: str, schema: str, primary_key: Sequence[str] = ("id",)) -> None:
+    """Downgrade counterpart of ``partition_by_range``.
+
+    Every row is copied into a plain table under an exclusive lock, so a
+    large table is better restored from a backup.
+    """
+    table = f'"{schema}"."{table_name}"'
+    copy = f"{table_name}_unpartitioned"
+    op.execute(f"""
+        DO $partition$
+        DECLARE
+            existing regclass := '{table}'::regclass;
+            pk_name text;
+            definitions text[];
+            statement text;
+        BEGIN
+            SELECT conname INTO pk_name FROM pg_constraint WHERE conrelid = existing AND contype = 'p';
+            SELECT coalesce(array_agg(pg_get_indexdef(i.indexrelid)), '{{}}') INTO definitions
+            FROM pg_index i
+            WHERE i.indrelid = existing
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid);
+            SELECT definitions || coalesce(array_agg(
+                format('ALTER TABLE {table} ADD CONSTRAINT %I %s', conname, pg_get_constraintdef(oid))
+            ), '{{}}') INTO definitions
+            FROM pg_constraint WHERE conrelid = existing AND contype = 'f';
+
+            CREATE TABLE "{schema}"."{copy}" (
+                LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE INCLUDING COMMENTS
+            );
+            INSERT INTO "{schema}"."{copy}" SELECT * FROM {table};
+            DROP TABLE {table};
+            ALTER TABLE "{schema}"."{copy}" RENAME TO "{table_name}";
+            EXECUTE format('ALTER TABLE {table} ADD CONSTRAINT %I PRIMARY KEY ({", ".join(primary_key)})', pk_name);
+            FOREACH statement IN ARRAY definitions LOOP
+                EXECUTE statement;
+            END LOOP;
+        END
+        $partition$
+    """)
@@ -0,0 +1,146 @@
+import subprocess
+import threading
+from collections import deque
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# How many trailing output lines are kept for error reporting
+ERROR_TAIL_LINES = 50
+# Block size used when feeding a file into a process' stdin
+STDIN_CHUNK_SIZE = 1024 * 1024
+
+
+class ProcessError(Exception):
+    """Raised when a streamed command exits with a non-zero code"""
+
+    def __init__(self, cmd: List[str], returncode: int, tail: List[str]):
+        self.cmd = cmd
+        self.returncode = returncode
+        self.tail = tail
+        super().__init__(f"{cmd[0]} exited with code {returncode}: " + "\n".join(tail))
+
+
+def _feed_stdin(
+    process: subprocess.Popen,
+    source: BinaryIO,
+    on_bytes: Optional[Callable[[int], None]],
+    errors: List[BaseException],
+) -> None:
+    """Copy ``source`` into the process stdin in fixed-size blocks"""
+    try:
+        while True:
+            chunk = source.read(STDIN_CHUNK_SIZE)
+            if not chunk:
+                break
+            process.stdin.write(chunk)
+            if on_bytes:
+                on_bytes(len(chunk))
+    except BrokenPipeError:
+        # The process exited early; its return code reports the failure
+        pass
+    except BaseException as e:
+        # Reading the source failed (corrupt archive, lost download); stop
+        # the process so a truncated input is never mistaken for success
+        errors.append(e)
+        process.kill()
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+
+def run_streaming(
+    cmd: List[str],
+    on_line: Callable[[str], None],
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+    stdin: Optional[BinaryIO] = None,
+    on_stdin_bytes: Optional[Callable[[int], None]] = None,
+) -> None:
+    """Run ``cmd`` and hand every stdout/stderr line to ``on_line`` as it arrives.
+
+    Output is never accumulated; only the last few lines are kept so a
+    failure can be reported. Raises ProcessError on a non-zero exit code.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if stdin is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        env=env,
+        cwd=cwd,
+    )
+
+    feeder = None
+    feed_errors: List[BaseException] = []
+    if stdin is not None:
+        feeder = threading.Thread(
+            target=_feed_stdin, args=(process, stdin, on_stdin_bytes, feed_errors), daemon=True
+        )
+        feeder.start()
+
+    tail = deque(maxlen=ERROR_TAIL_LINES)
+    for raw_line in process.stdout:
+        line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+        tail.append(line)
+        on_line(line)
+
+    returncode = process.wait()
+    if feeder is not None:
+        feeder.join()
+
+    if feed_errors:
+        raise feed_errors[0]
+    if returncode != 0:
+        raise ProcessError(cmd, returncode, list(tail))
+
+
+def run_with_stdout(
+    cmd: List[str],
+    consume: Callable[[BinaryIO], None],
+    on_line: Callable[[str], None],
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[str] = None,
+) -> None:
+    """Run ``cmd`` handing its stdout stream to ``consume``.
+
+    stderr lines go to ``on_line`` from a separate thread so verbose tool
+    output keeps flowing while ``consume`` reads the data stream.
+    """
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        cwd=cwd,
+    )
+
+    tail = deque(maxlen=ERROR_TAIL_LINES)
+
+    def read_stderr() -> None:
+        for raw_line in process.stderr:
+            line = raw_line.decode("utf-8", errors="replace").rstrip("\n")
+            tail.append(line)
+            on_line(line)
+
+    reader = threading.Thread(target=read_stderr, daemon=True)
+    reader.start()
+
+    try:
+        consume(process.stdout)
+    except Exception:
+        process.kill()
+        process.wait()
+        reader.join()
+        raise
+
+    returncode = process.wait()
+    reader.join()
+
+    if returncode != 0:
+        raise ProcessError(cmd, returncode, list(tail))
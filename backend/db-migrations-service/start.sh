@@ -31,7 +31,9 @@ alembic init migrations || true
 
 # Run migrations
 echo "🔄 Running database migrations..."
-alembic upgrade head
+# Databases migrated with the former linear chain get their branch heads first
+python -c "from src.services.migration_branches import restamp_legacy; restamp_legacy()"
+alembic upgrade heads
 
 echo "✅ Migrations completed successfully!"
 
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# Settings are read once on import of src.core.config; point the service at
+# throwaway sqlite databases so the pure helpers import without PostgreSQL
+_tmp = tempfile.mkdtemp(prefix="db-migrations-tests-")
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp}/migrations.db")
+os.environ.setdefault("MASTER_DATABASE_URL", f"sqlite:///{_tmp}/master.db")
+os.environ.setdefault("MIGRATIONS_PATH", os.path.join(_root, "migrations"))
+os.environ.setdefault("ALEMBIC_CONFIG", os.path.join(_root, "alembic.ini"))
+os.environ.setdefault("BACKUP_PATH", os.path.join(_tmp, "backups"))
+# moto intercepts every request, the credentials only have to exist
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
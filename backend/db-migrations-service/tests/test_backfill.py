@@ -0,0 +1,68 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from src.services import backfill
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    """Two databases holding the same table with different rows, and a fresh checkpoint table"""
+    service = create_engine(f"sqlite:///{tmp_path}/service.db")
+    monkeypatch.setattr(backfill, "engine", service)
+    monkeypatch.setattr(backfill, "SessionLocal", sessionmaker(bind=service))
+    engines = []
+    for name, rows in (("first", 25), ("second", 12)):
+        engine = create_engine(f"sqlite:///{tmp_path}/{name}.db", isolation_level="AUTOCOMMIT")
+        with engine.connect() as connection:
+            connection.execute(text("CREATE TABLE sessions (id INTEGER PRIMARY KEY, digest TEXT)"))
+            for i in range(1, rows + 1):
+                connection.execute(text("INSERT INTO sessions (id) VALUES (:id)"), {"id": i})
+        engines.append(engine)
+    yield engines
+    for engine in engines + [service]:
+        engine.dispose()
+
+
+def _run(engine):
+    with engine.connect() as connection:
+        return backfill.run_backfill(
+            connection, "sessions_digest", "sessions", "digest = 'x' || id", batch_size=10, sleep_seconds=0
+        )
+
+
+def _pending(engine) -> int:
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT count(*) FROM sessions WHERE digest IS NULL")).scalar()
+
+
+def test_same_backfill_runs_on_each_database(databases):
+    first, second = databases
+
+    done = _run(first)
+    assert done["status"] == "completed"
+    assert done["rows_updated"] == 25
+    # Completed on the first database, not on the second one
+    assert _pending(second) == 12
+
+    done = _run(second)
+    assert done["status"] == "completed"
+    assert done["rows_updated"] == 12
+    assert done["database"] == str(second.url)
+    assert _pending(second) == 0
+
+    assert len(backfill.list_backfills("sessions_digest")) == 2
+
+
+def test_reset_only_touches_one_database(databases):
+    first, second = databases
+    _run(first)
+    _run(second)
+
+    with first.connect() as connection:
+        database = backfill.database_key(connection)
+    assert backfill.reset_backfill("sessions_digest", database)
+    assert backfill.get_backfill(database, "sessions_digest") is None
+    assert [checkpoint["database"] for checkpoint in backfill.list_backfills("sessions_digest")] == [
+        str(second.url)
+    ]
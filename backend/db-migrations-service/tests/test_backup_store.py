@@ -0,0 +1,48 @@
+import io
+import os
+
+from src.services.backup_store import MAX_CHUNK_FACTOR, MIN_CHUNK_FACTOR, iter_chunks
+
+TARGET = 4096
+
+
+def _dump(lines: int) -> bytes:
+    return b"".join(b"INSERT INTO plans.plans VALUES (%d, 'plan %d');\n" % (i, i * 7) for i in range(lines))
+
+
+def test_iter_chunks_round_trip():
+    data = _dump(5000)
+    assert b"".join(iter_chunks(io.BytesIO(data), TARGET)) == data
+
+
+def test_iter_chunks_sizes():
+    chunks = list(iter_chunks(io.BytesIO(_dump(5000)), TARGET))
+    assert len(chunks) > 1
+    assert max(len(chunk) for chunk in chunks) <= TARGET * MAX_CHUNK_FACTOR
+    # Only the last chunk may fall under the minimum
+    assert min(len(chunk) for chunk in chunks[:-1]) >= TARGET // MIN_CHUNK_FACTOR
+
+
+def test_iter_chunks_splits_huge_lines():
+    huge = b"COPY " + os.urandom(TARGET * MAX_CHUNK_FACTOR * 3) + b"\n"
+    data = _dump(10) + huge + _dump(10)
+
+    chunks = list(iter_chunks(io.BytesIO(data), TARGET))
+
+    assert b"".join(chunks) == data
+    assert max(len(chunk) for chunk in chunks) <= TARGET * MAX_CHUNK_FACTOR
+
+
+def test_iter_chunks_boundaries_follow_content():
+    # An edit early in the dump only changes the chunks around it
+    before = _dump(5000)
+    after = before.replace(b"'plan 70'", b"'plan seventy'", 1)
+
+    first = list(iter_chunks(io.BytesIO(before), TARGET))
+    second = list(iter_chunks(io.BytesIO(after), TARGET))
+
+    assert len(set(first) - set(second)) <= 2
+
+
+def test_iter_chunks_empty():
+    assert list(iter_chunks(io.BytesIO(b""), TARGET)) == []
@@ -0,0 +1,84 @@
+import pytest
+
+from src.services import backups
+from src.services.jobs import Job
+
+
+def _manifest(fmt="custom", schemas=None, parts=None):
+    return {
+        "backup_id": "backup_20260101_000000",
+        "format": fmt,
+        "schemas": schemas,
+        "parts": parts or [{"path": "dump", "schemas": None}],
+    }
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    """Record database_admin calls instead of talking to a server"""
+    calls = []
+    monkeypatch.setattr(backups.database_admin, "database_owner", lambda database: "app")
+    monkeypatch.setattr(backups.database_admin, "create_database", lambda database, owner=None: calls.append(("create", database)))
+    monkeypatch.setattr(backups.database_admin, "drop_database", lambda database: calls.append(("drop", database)))
+    monkeypatch.setattr(
+        backups.database_admin, "swap_databases",
+        lambda live, shadow, previous: calls.append(("swap", shadow)) or 0.1,
+    )
+    monkeypatch.setattr(backups, "_restore_part", lambda *args, **kwargs: calls.append(("restore", kwargs["database"])))
+    return calls
+
+
+def test_plan_restore_whole_backup():
+    manifest = _manifest()
+    assert backups.plan_restore(manifest) == [(manifest["parts"][0], None)]
+
+
+def test_plan_restore_selects_per_service_parts():
+    parts = [{"path": "auth", "schemas": ["auth"]}, {"path": "plans", "schemas": ["plans", "users"]}]
+    plan = backups.plan_restore(_manifest(parts=parts), ["users"])
+    assert plan == [(parts[1], ["users"])]
+
+
+def test_plan_restore_refuses_schemas_from_chunked_backups():
+    with pytest.raises(ValueError):
+        backups.plan_restore(_manifest(fmt="chunked"), ["auth"])
+
+
+def test_plan_restore_missing_schema():
+    parts = [{"path": "auth", "schemas": ["auth"]}]
+    with pytest.raises(ValueError, match="plans"):
+        backups.plan_restore(_manifest(parts=parts), ["auth", "plans"])
+
+
+def test_check_shadow_accepts_full_backup():
+    backups.check_shadow(_manifest())
+
+
+def test_check_shadow_refuses_partial_backup():
+    with pytest.raises(ValueError, match="full database backup"):
+        backups.check_shadow(_manifest(schemas=["auth"]))
+
+
+def test_check_shadow_refuses_schema_filter():
+    with pytest.raises(ValueError):
+        backups.check_shadow(_manifest(), ["auth"])
+
+
+def test_shadow_restore_refused_before_touching_databases(monkeypatch, admin):
+    monkeypatch.setattr(backups, "read_manifest", lambda backup_id: _manifest(fmt="chunked", schemas=["plans"]))
+    with pytest.raises(ValueError):
+        backups.restore_backup(Job(kind="restore", params={}), "backup_20260101_000000", shadow=True)
+    assert admin == []
+
+
+def test_failed_validation_drops_shadow_without_swap(monkeypatch, admin):
+    def invalid(manifest, shadow):
+        raise ValueError(f"Shadow database {shadow} contains no tables")
+
+    monkeypatch.setattr(backups, "_validate_shadow", invalid)
+    manifest = _manifest()
+    with pytest.raises(ValueError, match="no tables"):
+        backups._restore_shadow(Job(kind="restore", params={}), manifest, backups.plan_restore(manifest), "/backups", 1)
+
+    shadow = admin[0][1]
+    assert admin == [("create", shadow), ("restore", shadow), ("drop", shadow)]
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from src.core.config import settings
+from src.services import expiry_purge
+from src.services.jobs import Job
+
+
+class FakeResult:
+    def __init__(self, rowcount: int = 0, value=None):
+        self.rowcount = rowcount
+        self.value = value
+
+    def scalar(self):
+        return self.value
+
+
+class FakeConnection:
+    """Connection whose DELETEs remove the given number of rows per batch"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.statements = []
+        self.commits = 0
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+    def execute(self, statement, parameters=None):
+        if "pg_stat_replication" in str(statement):
+            return FakeResult(value=0)
+        return FakeResult(rowcount=self.batches.pop(0))
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(settings, "PURGE_BATCH_SIZE", 100)
+    monkeypatch.setattr(settings, "PURGE_SLEEP_SECONDS", 0)
+
+
+def _purge(connection, deadline=None):
+    policy = expiry_purge.PURGED_TABLES["auth.sessions"]
+    return expiry_purge._purge_table(connection, "auth.sessions", policy, deadline or time.monotonic() + 60)
+
+
+def test_batches_stop_below_batch_size():
+    connection = FakeConnection([100, 100, 42, 100])
+    result = _purge(connection)
+    assert result["purged"] == 242
+    assert result["batches"] == 3
+    assert "incomplete" not in result
+    # Every batch sets its own timeouts and commits them away
+    assert connection.commits == 3
+    assert sum(statement.startswith("SET LOCAL lock_timeout") for statement in connection.statements) == 3
+
+
+def test_incomplete_at_deadline():
+    connection = FakeConnection([100, 100])
+    result = _purge(connection, deadline=time.monotonic() - 1)
+    assert result["purged"] == 100
+    assert result["batches"] == 1
+    assert result["incomplete"] is True
+
+
+def test_failing_target_does_not_fail_the_others(monkeypatch):
+    monkeypatch.setattr(settings, "MIGRATION_TARGETS", f"auth={settings.DATABASE_URL}")
+
+    def purge(connectable, deadline=None):
+        if connectable is not expiry_purge.master_engine:
+            raise RuntimeError("connection refused")
+        return [{"table": "auth.sessions", "purged": 7}]
+
+    monkeypatch.setattr(expiry_purge, "purge_expired", purge)
+    result = expiry_purge.purge_expired_job(Job(kind="purge", params={}))
+    assert result["purged"] == 7
+    assert result["targets"]["auth"] == {"error": "connection refused"}
@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from src.core.config import settings
+from src.services.health_prober import HealthProber
+
+
+class FakeEngine:
+    """Async engine whose connect() stalls or fails on demand"""
+
+    def __init__(self, connect_delay: float = 0, error: Exception = None):
+        self.connect_delay = connect_delay
+        self.error = error
+
+    @asynccontextmanager
+    async def connect(self):
+        await asyncio.sleep(self.connect_delay)
+        if self.error:
+            raise self.error
+        yield self
+
+    async def execute(self, statement):
+        return None
+
+
+def test_probe_records_healthy_latency():
+    prober = HealthProber({"db": FakeEngine()})
+    target = asyncio.run(prober.probe("db"))
+    assert target.healthy is True
+    assert target.to_dict()["samples"] == 1
+
+
+def test_connect_is_covered_by_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "HEALTH_PROBE_TIMEOUT_SECONDS", 0.05)
+    prober = HealthProber({"db": FakeEngine(connect_delay=5)})
+
+    target = asyncio.run(asyncio.wait_for(prober.probe("db"), timeout=2))
+
+    assert target.healthy is False
+    assert target.error == "TimeoutError"
+    assert target.latency_ms < 2000
+
+
+def test_failed_probes_stay_out_of_percentiles():
+    engine = FakeEngine()
+    prober = HealthProber({"db": engine})
+
+    async def run():
+        await prober.probe("db")
+        engine.error = OSError("connection refused")
+        await prober.probe("db")
+        return prober.targets["db"]
+
+    target = asyncio.run(run())
+    assert target.healthy is False
+    assert target.to_dict()["samples"] == 1
+    assert target.to_dict()["p99_ms"] == target.latencies[0]
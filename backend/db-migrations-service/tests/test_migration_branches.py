@@ -0,0 +1,70 @@
+import pytest
+
+from src.services import migration_branches
+from src.services.migration_engine import migration_engine
+
+
+@pytest.fixture
+def stamped(monkeypatch):
+    """Pretend the version table holds the given heads"""
+    def stamp(*heads):
+        monkeypatch.setattr(migration_engine, "current_heads", lambda connectable=None: heads)
+    return stamp
+
+
+def test_branch_labels_in_schema_order():
+    assert migration_branches.branch_labels() == ["auth", "users", "organizations", "plans"]
+
+
+def test_fresh_database_creates_schemas_first(stamped):
+    stamped()
+    wave, waiting = migration_branches._next_wave(["heads"])
+    assert wave == {"0001": "0001"}
+    assert sorted(waiting) == ["auth", "organizations", "plans", "users"]
+
+
+def test_siblings_moving_one_row_run_apart(stamped):
+    # auth and organizations both start from the 0001 row
+    stamped("0001")
+    wave, waiting = migration_branches._next_wave(["heads"])
+    assert wave == {"auth": "0012"}
+    assert sorted(waiting) == ["organizations", "plans", "users"]
+
+
+def test_independent_branches_share_a_wave(stamped):
+    stamped("0002")
+    wave, waiting = migration_branches._next_wave(["heads"])
+    assert wave == {"auth": "0012", "organizations": "0004"}
+    assert sorted(waiting) == ["plans", "users"]
+
+
+def test_dependencies_upgraded_only_as_far_as_needed(stamped):
+    stamped("0004")
+    wave, waiting = migration_branches._next_wave(["users@head"])
+    assert wave == {"auth": "0002"}
+    assert waiting == ["users"]
+
+
+def test_single_branch_target(stamped):
+    stamped("0003", "0004", "0012")
+    assert migration_branches._next_wave(["plans@head"]) == ({"plans": "0008"}, [])
+
+
+def test_nothing_pending(stamped):
+    stamped("0003", "0008", "0012")
+    assert migration_branches._next_wave(["heads"]) == ({}, [])
+
+
+def test_labels_for_service():
+    assert migration_branches.labels_for_service("plans-service") == ["plans"]
+    # The chat schema has no branch of its own yet
+    with pytest.raises(ValueError):
+        migration_branches.labels_for_service("chat")
+
+
+def test_describe_normalizes_scalar_and_tuple_dependencies():
+    users = migration_engine.describe(migration_engine.script.get_revision("0003"))
+    assert users["down_revisions"] == []
+    assert users["depends_on"] == ["0002"]
+    plans = migration_engine.describe(migration_engine.script.get_revision("0005"))
+    assert plans["depends_on"] == ["0002", "0004"]
@@ -0,0 +1,117 @@
+import pytest
+
+from src.services.migration_planner import (
+    ACCESS_EXCLUSIVE,
+    ROW_EXCLUSIVE,
+    SHARE,
+    SHARE_ROW_EXCLUSIVE,
+    SHARE_UPDATE_EXCLUSIVE,
+    _is_single_statement,
+    classify,
+    split_statements,
+)
+
+
+@pytest.mark.parametrize("statement, operation, table, lock", [
+    ("CREATE INDEX ix_a ON auth.sessions (user_id);", "create_index", "auth.sessions", SHARE),
+    ("CREATE UNIQUE INDEX CONCURRENTLY ix_b ON ONLY auth.sessions (token);",
+     "create_index_concurrently", "auth.sessions", SHARE_UPDATE_EXCLUSIVE),
+    ("CREATE TABLE plans.plan_jobs (id UUID PRIMARY KEY);", "create_table", "plans.plan_jobs", ACCESS_EXCLUSIVE),
+    ("DROP TABLE IF EXISTS plans.plan_jobs;", "drop_table", "plans.plan_jobs", ACCESS_EXCLUSIVE),
+    ("TRUNCATE TABLE auth.sessions;", "truncate", "auth.sessions", ACCESS_EXCLUSIVE),
+    ("UPDATE auth.sessions SET token_digest = NULL;", "update", "auth.sessions", ROW_EXCLUSIVE),
+    ("DELETE FROM auth.sessions WHERE expires_at < now();", "delete", "auth.sessions", ROW_EXCLUSIVE),
+    ("INSERT INTO auth.roles (name) VALUES ('admin');", "insert", "auth.roles", ROW_EXCLUSIVE),
+    ("CREATE TRIGGER t BEFORE UPDATE ON plans.plans FOR EACH ROW EXECUTE FUNCTION f();",
+     "create_trigger", "plans.plans", SHARE_ROW_EXCLUSIVE),
+    ("ALTER TABLE auth.users RENAME TO accounts;", "rename", "auth.users", ACCESS_EXCLUSIVE),
+])
+def test_classify_operations(statement, operation, table, lock):
+    effect = classify(statement)
+    assert (effect.operation, effect.table, effect.lock) == (operation, table, lock)
+
+
+def test_classify_create_table_references():
+    effect = classify("CREATE TABLE plans.plans (id UUID, teacher_id UUID REFERENCES auth.users (id));")
+    assert effect.new_table
+    assert effect.referenced == "auth.users"
+
+
+def test_classify_drop_index():
+    assert classify("DROP INDEX CONCURRENTLY IF EXISTS auth.ix_token;").lock == SHARE_UPDATE_EXCLUSIVE
+    effect = classify("DROP INDEX auth.ix_token;")
+    assert (effect.operation, effect.index, effect.lock) == ("drop_index", "auth.ix_token", ACCESS_EXCLUSIVE)
+
+
+def test_classify_nullable_column_is_metadata_only():
+    effect = classify("ALTER TABLE auth.sessions ADD COLUMN token_digest BYTEA;")
+    assert effect.lock == ACCESS_EXCLUSIVE
+    assert not effect.rewrite and not effect.scan
+
+
+def test_classify_volatile_default_rewrites():
+    effect = classify("ALTER TABLE auth.sessions ADD COLUMN key UUID DEFAULT gen_random_uuid() NOT NULL;")
+    assert effect.rewrite and effect.scan
+
+
+def test_classify_unknown_statement():
+    assert classify("VACUUM ANALYZE auth.sessions;").operation == "vacuum_analyze"
+    assert classify("").operation == "empty"
+
+
+SQL = """BEGIN;
+
+CREATE TABLE alembic_version (
+    version_num VARCHAR(32) NOT NULL
+);
+
+-- Running upgrade 0008, 0012 -> 0013
+
+CREATE FUNCTION auth.touch() RETURNS trigger AS $$
+BEGIN
+
+    NEW.updated_at = now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP INDEX auth.ix_auth_sessions_token;
+
+UPDATE alembic_version SET version_num='0013' WHERE alembic_version.version_num = '0012';
+
+COMMIT;
+
+-- Running upgrade  -> 0001
+
+CREATE SCHEMA IF NOT EXISTS auth;
+
+"""
+
+
+def test_split_statements():
+    revisions = split_statements(SQL)
+
+    assert [(r["revision"], r["direction"], r["from_revisions"]) for r in revisions] == [
+        ("0013", "upgrade", ["0008", "0012"]),
+        ("0001", "upgrade", []),
+    ]
+    first, second = revisions
+    # The function body spans a blank line and stays one statement
+    assert len(first["statements"]) == 2
+    assert first["statements"][0].startswith("CREATE FUNCTION") and first["statements"][0].endswith("plpgsql;")
+    assert first["statements"][1] == "DROP INDEX auth.ix_auth_sessions_token;"
+    assert second["statements"] == ["CREATE SCHEMA IF NOT EXISTS auth;"]
+
+
+@pytest.mark.parametrize("sql, single", [
+    ("UPDATE auth.sessions SET note = 'a;b';", True),
+    ('UPDATE "odd;name" SET x = 1;  \n', True),
+    ("UPDATE t SET x = 1; -- done; really\n", True),
+    ("UPDATE t SET x = 1 /* ; */ WHERE y = 2;", True),
+    ("UPDATE t SET body = $body$ a; b $body$ WHERE id = $1;", True),
+    ("UPDATE t SET x = 1; DELETE FROM t;", False),
+    ("UPDATE t SET x = 1;\n\nCOMMIT;", False),
+    ("UPDATE t SET note = 'unterminated;", False),
+])
+def test_is_single_statement(sql, single):
+    assert _is_single_statement(sql) is single
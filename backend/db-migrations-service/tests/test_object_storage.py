@@ -0,0 +1,104 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+
+from src.core.config import settings
+from src.services import object_storage
+from src.services.object_storage import MIN_PART_SIZE, ObjectReader, delete_prefix, object_key, upload_stream
+
+BUCKET = "profe-backups-test"
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_STORAGE", f"s3://{BUCKET}/backups/")
+    monkeypatch.setattr(settings, "BACKUP_STORAGE_ENDPOINT_URL", None)
+    monkeypatch.setattr(settings, "BACKUP_UPLOAD_PART_SIZE", MIN_PART_SIZE)
+    monkeypatch.setattr(settings, "BACKUP_UPLOAD_CONCURRENCY", 2)
+    with moto.mock_aws():
+        object_storage.get_client.cache_clear()
+        client = object_storage.get_client()
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+    object_storage.get_client.cache_clear()
+
+
+def test_object_key_uses_storage_prefix(bucket):
+    assert object_key("plain", "b1.sql") == "backups/plain/b1.sql"
+
+
+def test_upload_stream_multipart(bucket):
+    data = os.urandom(2 * MIN_PART_SIZE + 1234)
+    progress = []
+
+    result = upload_stream(io.BytesIO(data), object_key("b1.sql"), on_bytes=progress.append)
+
+    assert result["upload_parts"] == 3
+    assert result["size_bytes"] == len(data)
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert progress == [MIN_PART_SIZE, 2 * MIN_PART_SIZE, len(data)]
+    stored = bucket.get_object(Bucket=BUCKET, Key="backups/b1.sql")["Body"].read()
+    assert stored == data
+
+
+def test_upload_stream_empty(bucket):
+    result = upload_stream(io.BytesIO(b""), object_key("empty.sql"))
+
+    assert result["upload_parts"] == 1
+    assert result["size_bytes"] == 0
+    assert bucket.head_object(Bucket=BUCKET, Key="backups/empty.sql")["ContentLength"] == 0
+
+
+def test_upload_stream_aborts_on_error(bucket):
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            if self.tell() >= MIN_PART_SIZE:
+                raise IOError("dump failed")
+            return super().read(size)
+
+    with pytest.raises(IOError):
+        upload_stream(Broken(os.urandom(2 * MIN_PART_SIZE)), object_key("broken.sql"))
+
+    assert not bucket.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+    assert "Contents" not in bucket.list_objects_v2(Bucket=BUCKET, Prefix="backups/broken.sql")
+
+
+def test_object_reader_ranged_reads(bucket):
+    data = os.urandom(3 * MIN_PART_SIZE + 17)
+    bucket.put_object(Bucket=BUCKET, Key="backups/b2.sql", Body=data)
+
+    with ObjectReader("backups/b2.sql") as reader:
+        assert reader.size == len(data)
+        head = reader.read(10)
+        # Crosses the boundary between the first and second range
+        middle = reader.read(MIN_PART_SIZE)
+        rest = reader.read()
+        assert reader.read() == b""
+
+    assert head + middle + rest == data
+    assert middle == data[10:10 + MIN_PART_SIZE]
+    assert reader.bytes_read == len(data)
+
+
+def test_object_reader_small_reads(bucket):
+    data = b"".join(b"line %d\n" % i for i in range(1000))
+    bucket.put_object(Bucket=BUCKET, Key="backups/b3.sql", Body=data)
+
+    with ObjectReader("backups/b3.sql") as reader:
+        blocks = iter(lambda: reader.read(333), b"")
+        assert b"".join(blocks) == data
+
+
+def test_delete_prefix(bucket):
+    for index in range(3):
+        bucket.put_object(Bucket=BUCKET, Key=f"backups/b4/part{index}", Body=b"x")
+    bucket.put_object(Bucket=BUCKET, Key="backups/b5/part0", Body=b"x")
+
+    assert delete_prefix("backups/b4/") == 3
+    assert delete_prefix("backups/b4/") == 0
+    remaining = [item["Key"] for item in bucket.list_objects_v2(Bucket=BUCKET)["Contents"]]
+    assert remaining == ["backups/b5/part0"]
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.core.config import settings
+from src.services.partitions import (
+    _parse_bound,
+    advance,
+    create_partition_sql,
+    partition_name,
+    period_start,
+    policies,
+)
+
+UTC = timezone.utc
+
+
+@pytest.mark.parametrize("interval, expected", [
+    ("day", datetime(2024, 3, 14, tzinfo=UTC)),
+    ("week", datetime(2024, 3, 11, tzinfo=UTC)),
+    ("month", datetime(2024, 3, 1, tzinfo=UTC)),
+])
+def test_period_start(interval, expected):
+    assert period_start(datetime(2024, 3, 14, 17, 30, 5, tzinfo=UTC), interval) == expected
+
+
+def test_period_start_converts_to_utc():
+    moment = datetime(2024, 4, 1, 1, 0, tzinfo=timezone(timedelta(hours=3)))
+    assert period_start(moment, "month") == datetime(2024, 3, 1, tzinfo=UTC)
+
+
+@pytest.mark.parametrize("start, interval, periods, expected", [
+    (datetime(2024, 1, 1, tzinfo=UTC), "month", 1, datetime(2024, 2, 1, tzinfo=UTC)),
+    (datetime(2024, 11, 1, tzinfo=UTC), "month", 3, datetime(2025, 2, 1, tzinfo=UTC)),
+    (datetime(2024, 2, 1, tzinfo=UTC), "month", -3, datetime(2023, 11, 1, tzinfo=UTC)),
+    (datetime(2024, 1, 1, tzinfo=UTC), "month", -12, datetime(2023, 1, 1, tzinfo=UTC)),
+    (datetime(2024, 2, 26, tzinfo=UTC), "week", 1, datetime(2024, 3, 4, tzinfo=UTC)),
+    (datetime(2024, 2, 28, tzinfo=UTC), "day", 2, datetime(2024, 3, 1, tzinfo=UTC)),
+])
+def test_advance(start, interval, periods, expected):
+    assert advance(start, interval, periods) == expected
+
+
+def test_partition_sql():
+    start = datetime(2024, 12, 1, tzinfo=UTC)
+    assert partition_name("sessions", start, "month") == "sessions_p202412"
+    create, attach = create_partition_sql("auth", "sessions", start, "month")
+    assert create.startswith('CREATE TABLE IF NOT EXISTS "auth"."sessions_p202412" (LIKE "auth"."sessions"')
+    assert attach.endswith("FOR VALUES FROM ('2024-12-01T00:00:00+00:00') TO ('2025-01-01T00:00:00+00:00')")
+
+
+def test_parse_bound():
+    assert _parse_bound("'2024-03-01 00:00:00+00'") == datetime(2024, 3, 1, tzinfo=UTC)
+    assert _parse_bound("MINVALUE") is None
+    assert _parse_bound("MAXVALUE") is None
+
+
+def test_policies_retention_override(monkeypatch):
+    monkeypatch.setattr(settings, "PARTITION_RETENTION", "auth.sessions=6, chat.chat_messages=none")
+    result = policies()
+    assert result["auth.sessions"].retention == 6
+    assert result["chat.chat_messages"].retention is None
+
+
+def test_policies_rejects_unknown_table(monkeypatch):
+    monkeypatch.setattr(settings, "PARTITION_RETENTION", "auth.users=3")
+    with pytest.raises(ValueError):
+        policies()
+
+
+def test_policies_override_keeps_expiry_column(monkeypatch):
+    monkeypatch.setattr(settings, "PARTITION_RETENTION", "auth.sessions=1")
+    assert policies()["auth.sessions"].expires == "expires_at"
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.routes import plan_jobs
+
+JOB_ID = "3f0c1a52-8d3e-4b7a-9c61-2f5e0d4b8a17"
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    """Replace the notifier with a fixed list of changes and get_job with a list of reads"""
+    def setup(reads, changes):
+        reads = list(reads)
+
+        async def events():
+            for change in changes:
+                yield change
+
+        @asynccontextmanager
+        async def subscribe(**filters):
+            yield events()
+
+        monkeypatch.setattr(plan_jobs.plan_job_notifier, "subscribe", subscribe)
+        monkeypatch.setattr(plan_jobs.plan_queue, "get_job", lambda job_id: reads.pop(0))
+    return setup
+
+
+def _stream(job_id: str):
+    async def collect():
+        return [json.loads(line) async for line in plan_jobs._stream_job(job_id, "ndjson")]
+    return asyncio.run(collect())
+
+
+def test_stream_ends_on_final_status(feed):
+    feed(
+        [{"id": "j1", "status": "pending"}],
+        [{"id": "j1", "status": "processing"}, {"id": "j1", "status": "completed"}],
+    )
+    events = _stream("j1")
+    assert [(event["type"], event["job"]["status"]) for event in events] == [
+        ("snapshot", "pending"), ("change", "processing"), ("change", "completed"), ("end", "completed"),
+    ]
+
+
+def test_stream_ends_when_job_disappears_after_reconnect(feed):
+    feed([{"id": "j1", "status": "processing"}, None], [{"type": "reconnect"}])
+    events = _stream("j1")
+    assert [event["type"] for event in events] == ["snapshot", "end"]
+    assert events[-1]["job"] is None
+
+
+def test_stream_of_deleted_job(feed):
+    feed([None], [])
+    assert _stream("j1") == [{"type": "end", "job": None}]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(plan_jobs.router, prefix="/api/plan-jobs")
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", [
+    "/api/plan-jobs/not-a-uuid",
+    "/api/plan-jobs/not-a-uuid/events",
+    "/api/plan-jobs/events?teacher_id=not-a-uuid",
+])
+def test_malformed_ids_rejected(client, monkeypatch, path):
+    def get_job(job_id):
+        raise AssertionError("malformed ids must not reach the database")
+
+    monkeypatch.setattr(plan_jobs.plan_queue, "get_job", get_job)
+    assert client.get(path).status_code == 422
+
+
+def test_job_id_passed_as_string(client, monkeypatch):
+    seen = []
+    monkeypatch.setattr(plan_jobs.plan_queue, "get_job", lambda job_id: seen.append(job_id))
+    assert client.get(f"/api/plan-jobs/{JOB_ID}").status_code == 404
+    assert seen == [JOB_ID]
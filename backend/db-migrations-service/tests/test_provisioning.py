@@ -0,0 +1,54 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+from src.core.config import settings
+from src.services import provisioning
+from src.services.migration_engine import migration_engine
+from src.services.migration_planner import REVISION_MARKER
+
+# Revisions that use autocommit_block, and the ones built on top of them
+AUTOCOMMIT = {"0006", "0007", "0008", "0009", "0010", "0011", "0012"}
+
+
+@pytest.fixture
+def baselines(tmp_path, monkeypatch):
+    # Offline SQL is rendered for the PostgreSQL dialect, no server needed
+    monkeypatch.setattr(settings, "MASTER_DATABASE_URL", "postgresql://profe@localhost/profe")
+    monkeypatch.setattr(settings, "MIGRATION_BASELINES_PATH", str(tmp_path))
+    return tmp_path
+
+
+def _rendered_revisions(sql: str) -> set:
+    return {
+        marker.group(3)
+        for marker in (REVISION_MARKER.match(chunk.strip()) for chunk in sql.split("\n\n"))
+        if marker
+    }
+
+
+def test_autocommit_revisions_detected(baselines):
+    sql = migration_engine.render_sql(("0003", "0008", "0012"), online=False)
+    assert provisioning._autocommit_revisions(sql) == {"0006", "0007", "0008", "0009", "0012"}
+
+
+def test_baseline_stops_before_autocommit_revisions(baselines):
+    baseline = provisioning.create_baseline("heads")
+    assert baseline["heads"] == ["0003", "0005"]
+
+    with open(baseline["path"]) as f:
+        sql = f.read()
+    assert _rendered_revisions(sql) == {"0001", "0002", "0003", "0004", "0005"}
+    assert not _rendered_revisions(sql) & AUTOCOMMIT
+    assert provisioning._autocommit_revisions(sql) == set()
+
+
+def test_apply_baseline_refuses_stale_baseline(baselines):
+    # A baseline compiled before autocommit revisions were left out
+    with open(os.path.join(baselines, "0012.sql"), "w") as f:
+        f.write(migration_engine.render_sql(("0012",), online=False))
+
+    engine = create_engine("sqlite://")
+    with pytest.raises(ValueError, match="regenerate"):
+        provisioning.apply_baseline(engine)
@@ -0,0 +1,73 @@
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from src.core.config import settings
+from src.services import wal_archive
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "BACKUP_PATH", str(tmp_path))
+    os.makedirs(wal_archive.wal_archive_path())
+    return tmp_path
+
+
+def _base_backup(backup_id: str, end_lsn: str, finished_at: str) -> None:
+    path = os.path.join(wal_archive.base_backups_path(), backup_id)
+    os.makedirs(path)
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump({"backup_id": backup_id, "end_lsn": end_lsn, "finished_at": finished_at}, f)
+
+
+def test_wal_file_name():
+    assert wal_archive._wal_file_name(1, "0/3000060") == "000000010000000000000003"
+    assert wal_archive._wal_file_name(2, "1/A0000000") == "0000000200000001000000A0"
+    assert wal_archive._wal_file_name(None, "0/3000060") is None
+
+
+def test_cleanup_wal_across_timelines(archive):
+    names = [
+        "000000010000000000000004",
+        "000000010000000000000005",
+        "000000010000000000000006",
+        "000000020000000000000004",
+        "000000020000000000000005",
+        "000000020000000000000006",
+        "000000030000000000000006",
+        "00000002.history",
+    ]
+    for name in names:
+        open(os.path.join(wal_archive.wal_archive_path(), name), "w").close()
+
+    wal_archive._cleanup_wal("000000020000000000000005")
+
+    assert sorted(os.listdir(wal_archive.wal_archive_path())) == [
+        "00000002.history",
+        "000000020000000000000005",
+        "000000020000000000000006",
+        "000000030000000000000006",
+    ]
+
+
+def test_select_base_backup_by_time(archive):
+    _base_backup("base_1", "0/3000100", "2026-01-01T00:10:00+00:00")
+    _base_backup("base_2", "0/5000100", "2026-01-02T00:10:00+00:00")
+
+    assert wal_archive.select_base_backup(target_time=datetime(2026, 1, 1, 12))["backup_id"] == "base_1"
+    selected = wal_archive.select_base_backup(target_time=datetime(2026, 1, 3, tzinfo=timezone.utc))
+    assert selected["backup_id"] == "base_2"
+    with pytest.raises(ValueError):
+        wal_archive.select_base_backup(target_time=datetime(2026, 1, 1))
+
+
+def test_select_base_backup_by_lsn(archive):
+    _base_backup("base_1", "0/3000100", "2026-01-01T00:10:00+00:00")
+    _base_backup("base_2", "0/5000100", "2026-01-02T00:10:00+00:00")
+
+    assert wal_archive.select_base_backup(target_lsn="0/4000000")["backup_id"] == "base_1"
+    assert wal_archive.select_base_backup(target_lsn="0/5000100")["backup_id"] == "base_2"
+    with pytest.raises(ValueError):
+        wal_archive.select_base_backup(target_lsn="0/3000000")